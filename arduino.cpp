@@ -39,6 +39,26 @@ Fw==
 #define BUZZER_PIN 11    // Output
 #define STATUS_LED 15    // Built-in LED on most S2 Mini boards
 
+// Sensor payload encoding: 0 = JSON, 1 = MessagePack keyed by field ID (about a
+// quarter of the bytes). The bridge accepts both on the same topic; the field IDs
+// must match FIELD_IDS in iot-bridge/payload_codec.py.
+#define PAYLOAD_MSGPACK 0
+
+// Readings per sensor payload: 1 publishes each reading on its own, N > 1 waits for N
+// readings and sends them as one batch. Readings taken while MQTT is down are buffered
+// either way (the oldest give way past READING_BUFFER_SIZE) and sent in batches of up
+// to PUBLISH_BATCH_MAX once it is back.
+#define PUBLISH_BATCH_SIZE 1
+#define PUBLISH_BATCH_MAX 10
+#define READING_BUFFER_SIZE 32
+#define MQTT_BUFFER_SIZE 4096  // PubSubClient packet buffer, fits PUBLISH_BATCH_MAX readings
+
+// The bridge raises the air quality, leak, temperature, humidity and inactivity alerts
+// from the readings (iot-bridge/alert_engine.py, thresholds from the Settings page).
+// 1 also publishes them from the device, which stores each of them twice. The buzzer
+// and LED sound either way.
+#define DEVICE_THRESHOLD_ALERTS 0
+
 // Global Variables
 WiFiClientSecure espClient;
 PubSubClient mqttClient(espClient);
@@ -50,6 +70,11 @@ unsigned long lastMotionTime = 0;
 bool motionAlertSent = false;
 bool mqttConnected = false;
 
+// Message identity: random per boot, plus a counter shared by all published messages.
+// millis() restarts at 0 on every reboot, so the bridge keys documents on these instead.
+uint32_t bootId = 0;
+uint32_t messageSeq = 0;
+
 // Sensor Values Structure
 struct SensorData {
   int airQuality;
@@ -70,12 +95,76 @@ struct SystemStatus {
   int errorCount;
 } systemStatus;
 
+// Readings waiting to be published, oldest at bufferHead
+struct BufferedReading {
+  unsigned long takenMillis;
+  uint32_t seq;
+  SensorData sensors;
+  bool wifiConnected;
+  bool mqttConnected;
+  int rssi;
+  int publishCount;
+  int errorCount;
+};
+BufferedReading readingBuffer[READING_BUFFER_SIZE];
+int bufferHead = 0;
+int bufferedCount = 0;
+
+// Minimal MessagePack writer for the sensor payload: maps, small integer keys,
+// integers, bools and short strings into a fixed buffer
+struct MsgPackWriter {
+  uint8_t* buf;
+  size_t cap;
+  size_t len;
+  bool overflow;
+
+  void put(uint8_t b) {
+    if (len < cap) buf[len++] = b;
+    else overflow = true;
+  }
+  void putBE(uint32_t v, int bytes) {
+    for (int i = bytes - 1; i >= 0; i--) put((v >> (8 * i)) & 0xFF);
+  }
+  void mapHeader(uint16_t n) {
+    if (n < 16) put(0x80 | n);
+    else { put(0xde); putBE(n, 2); }
+  }
+  void arrayHeader(uint16_t n) {
+    if (n < 16) put(0x90 | n);
+    else { put(0xdc); putBE(n, 2); }
+  }
+  void key(uint8_t fieldId) { put(fieldId); }  // positive fixint, IDs stay below 128
+  void boolean(bool v) { put(v ? 0xc3 : 0xc2); }
+  void integer(int32_t v) {
+    if (v >= -32 && v < 128) put((uint8_t)(int8_t)v);
+    else if (v >= -128 && v < 128) { put(0xd0); put((uint8_t)(int8_t)v); }
+    else if (v >= -32768 && v < 32768) { put(0xd1); putBE((uint16_t)(int16_t)v, 2); }
+    else { put(0xd2); putBE((uint32_t)v, 4); }
+  }
+  void uinteger(uint32_t v) {
+    if (v < 128) put(v);
+    else if (v <= 0xFF) { put(0xcc); put(v); }
+    else if (v <= 0xFFFF) { put(0xcd); putBE(v, 2); }
+    else { put(0xce); putBE(v, 4); }
+  }
+  void str(const char* s) {
+    size_t n = strlen(s);
+    if (n > 255) n = 255;
+    if (n < 32) put(0xa0 | n);
+    else { put(0xd9); put(n); }
+    for (size_t i = 0; i < n; i++) put(s[i]);
+  }
+};
+
 // Function Prototypes
 void setupWiFi();
 void connectMQTT();
 void simulateSensors();
 void readSensors();
 void publishSensorData();
+void bufferReading();
+void publishBufferedReadings();
+bool publishReadings(int count);
 void publishAlert(String alertType, String message, String severity);
 void publishHeartbeat();
 void triggerLocalAlert(String alertType);
@@ -114,11 +203,13 @@ void setup() {
   systemStatus.errorCount = 0;
   
   setupWiFi();
+  bootId = esp_random();  // hardware RNG, seeded from RF noise once WiFi is up
   
   // Configure MQTT client with SSL/TLS
   espClient.setCACert(ca_cert);  // Set root certificate for SSL verification
   mqttClient.setServer(MQTT_SERVER, MQTT_PORT);
   mqttClient.setCallback(mqttCallback);
+  mqttClient.setBufferSize(MQTT_BUFFER_SIZE);
   
   Serial.println("\nSetup complete. Starting monitoring...");
 }
@@ -142,16 +233,13 @@ void loop() {
     lastSensorRead = currentMillis;
   }
   
-  // Publish sensor data periodically
+  // Take a reading for publishing periodically, buffered while MQTT is down
   if (currentMillis - lastPublish >= MQTT_PUBLISH_INTERVAL) {
-    if (mqttClient.connected()) {
-      publishSensorData();
-      lastPublish = currentMillis;
-      systemStatus.publishCount++;
-      digitalWrite(STATUS_LED, HIGH);
-      delay(50);
-      digitalWrite(STATUS_LED, LOW);
-    }
+    publishSensorData();
+    lastPublish = currentMillis;
+    digitalWrite(STATUS_LED, HIGH);
+    delay(50);
+    digitalWrite(STATUS_LED, LOW);
   }
   
   // Publish heartbeat
@@ -302,17 +390,22 @@ void simulateSensors() {
 void checkAlerts() {
   // Air Quality Alert
   if (sensorData.airQuality > AIR_QUALITY_ALERT_THRESHOLD) {
+#if DEVICE_THRESHOLD_ALERTS
     String msg = "Air quality critical: " + String(sensorData.airQuality) + " PPM";
     publishAlert("AIR_QUALITY", msg, "HIGH");
+#endif
     triggerLocalAlert("AIR_QUALITY");
   }
   
   // Water Leak Alert
   if (sensorData.isRaining) {
+#if DEVICE_THRESHOLD_ALERTS
     publishAlert("WATER_LEAK", "Water leak detected!", "HIGH");
+#endif
     triggerLocalAlert("WATER_LEAK");
   }
   
+#if DEVICE_THRESHOLD_ALERTS
   // Temperature Alerts
   if (sensorData.temperature > TEMP_HIGH_THRESHOLD) {
     String msg = "High temperature: " + String(sensorData.temperature) + "°C";
@@ -330,6 +423,7 @@ void checkAlerts() {
     String msg = "Low humidity: " + String(sensorData.humidity) + "%";
     publishAlert("HUMIDITY", msg, "LOW");
   }
+#endif
   
   // Darkness Alert
   if (sensorData.lightLevel < LIGHT_DARK_THRESHOLD) {
@@ -342,62 +436,177 @@ void checkMotionTimeout(unsigned long currentTime) {
       (currentTime - lastMotionTime > MOTION_TIMEOUT) && 
       lastMotionTime != 0) {
     
+#if DEVICE_THRESHOLD_ALERTS
     String msg = "No motion detected for " + String(MOTION_TIMEOUT/60000) + " minutes";
     publishAlert("MOTION_TIMEOUT", msg, "MEDIUM");
+#endif
     motionAlertSent = true;
   }
 }
 
 void publishSensorData() {
-  if (!mqttClient.connected()) return;
+  // Buffer the reading first, so one taken while MQTT is down is sent once it is back
+  bufferReading();
+  publishBufferedReadings();
+}
+
+void bufferReading() {
+  if (bufferedCount == READING_BUFFER_SIZE) {
+    // Full: the oldest reading gives way
+    bufferHead = (bufferHead + 1) % READING_BUFFER_SIZE;
+    bufferedCount--;
+    systemStatus.errorCount++;
+  }
+  BufferedReading& r = readingBuffer[(bufferHead + bufferedCount) % READING_BUFFER_SIZE];
+  r.takenMillis = millis();
+  r.seq = ++messageSeq;
+  r.sensors = sensorData;
+  r.wifiConnected = systemStatus.wifiConnected;
+  r.mqttConnected = systemStatus.mqttConnected;
+  r.rssi = WiFi.RSSI();
+  r.publishCount = systemStatus.publishCount;
+  r.errorCount = systemStatus.errorCount;
+  bufferedCount++;
+}
+
+void publishBufferedReadings() {
+  // One reading goes out in the single-reading payload, more in a batch payload
+  while (mqttClient.connected() && bufferedCount >= PUBLISH_BATCH_SIZE) {
+    int count = min(bufferedCount, PUBLISH_BATCH_MAX);
+    if (!publishReadings(count)) {
+      Serial.println("❌ Failed to publish sensor data");
+      systemStatus.errorCount++;
+      return;  // still buffered, retried at the next publish interval
+    }
+    bufferHead = (bufferHead + count) % READING_BUFFER_SIZE;
+    bufferedCount -= count;
+    systemStatus.publishCount++;
+  }
+}
+
+const BufferedReading& bufferedReading(int i) {
+  return readingBuffer[(bufferHead + i) % READING_BUFFER_SIZE];
+}
+
+#if PAYLOAD_MSGPACK
+void writeReadingMsgPack(MsgPackWriter& msg, const BufferedReading& r) {
+  // Temperature, humidity and battery are sent as hundredths
+  msg.key(4);  msg.uinteger(r.takenMillis);
+  msg.key(6);  msg.uinteger(r.seq);
+  msg.key(7);  msg.uinteger(r.takenMillis / 1000);
+  msg.key(10); msg.integer(r.sensors.airQuality);
+  msg.key(11); msg.boolean(r.sensors.isRaining);
+  msg.key(12); msg.boolean(r.sensors.motionDetected);
+  msg.key(13); msg.integer(r.sensors.lightLevel);
+  msg.key(14); msg.integer(lroundf(r.sensors.temperature * 100));
+  msg.key(15); msg.integer(lroundf(r.sensors.humidity * 100));
+  msg.key(16); msg.integer(lroundf(r.sensors.batteryLevel * 100));
+  msg.key(20); msg.boolean(r.wifiConnected);
+  msg.key(21); msg.boolean(r.mqttConnected);
+  msg.key(22); msg.integer(r.rssi);
+  msg.key(23); msg.integer(r.publishCount);
+  msg.key(24); msg.integer(r.errorCount);
+}
+
+bool publishReadings(int count) {
+  // Same fields as the JSON below, keyed by field ID; the device_id has to come
+  // first (the bridge routes on it without decoding)
+  static uint8_t buffer[MQTT_BUFFER_SIZE - 64];
+  MsgPackWriter msg = {buffer, sizeof(buffer), 0, false};
+  if (count == 1) {
+    msg.mapHeader(19);
+    msg.key(1);  msg.str(DEVICE_ID);
+    msg.key(2);  msg.str(DEVICE_TYPE);
+    msg.key(3);  msg.str(DEVICE_LOCATION);
+    msg.key(5);  msg.uinteger(bootId);
+    writeReadingMsgPack(msg, bufferedReading(0));
+  } else {
+    msg.mapHeader(6);
+    msg.key(1);  msg.str(DEVICE_ID);
+    msg.key(2);  msg.str(DEVICE_TYPE);
+    msg.key(3);  msg.str(DEVICE_LOCATION);
+    msg.key(4);  msg.uinteger(millis());  // send time, the bridge dates each reading from it
+    msg.key(5);  msg.uinteger(bootId);
+    msg.key(30); msg.arrayHeader(count);
+    for (int i = 0; i < count; i++) {
+      msg.mapHeader(15);
+      writeReadingMsgPack(msg, bufferedReading(i));
+    }
+  }
+  
+  if (msg.overflow) {
+    Serial.println("❌ Sensor payload larger than its buffer");
+    return false;
+  }
+  if (!mqttClient.publish(TOPIC_SENSOR_DATA, buffer, msg.len)) return false;
+  if (DEBUG_MODE) {
+    Serial.printf("\n📤 Published %d reading(s) (%u bytes MessagePack)\n", count, (unsigned)msg.len);
+  }
+  return true;
+}
+#else
+void writeReadingJson(JsonObject obj, const BufferedReading& r) {
+  obj["timestamp"] = r.takenMillis;
+  obj["seq"] = r.seq;
+  obj["uptime_seconds"] = r.takenMillis / 1000;
+  
+  // Sensor readings
+  JsonObject sensors = obj.createNestedObject("sensors");
+  sensors["air_quality_ppm"] = r.sensors.airQuality;
+  sensors["water_leak"] = r.sensors.isRaining;
+  sensors["motion"] = r.sensors.motionDetected;
+  sensors["light_level"] = r.sensors.lightLevel;
+  sensors["temperature_c"] = r.sensors.temperature;
+  sensors["humidity_percent"] = r.sensors.humidity;
+  sensors["battery_percent"] = r.sensors.batteryLevel;
   
-  StaticJsonDocument<512> jsonDoc;
+  // System status
+  JsonObject status = obj.createNestedObject("system");
+  status["wifi_connected"] = r.wifiConnected;
+  status["mqtt_connected"] = r.mqttConnected;
+  status["rssi"] = r.rssi;
+  status["publish_count"] = r.publishCount;
+  status["error_count"] = r.errorCount;
+}
+
+bool publishReadings(int count) {
+  DynamicJsonDocument jsonDoc(512 + 384 * count);
   
   // Device info
   jsonDoc["device_id"] = DEVICE_ID;
   jsonDoc["device_type"] = DEVICE_TYPE;
   jsonDoc["location"] = DEVICE_LOCATION;
-  jsonDoc["timestamp"] = millis();
-  jsonDoc["uptime_seconds"] = millis() / 1000;
-  
-  // Sensor readings
-  JsonObject sensors = jsonDoc.createNestedObject("sensors");
-  sensors["air_quality_ppm"] = sensorData.airQuality;
-  sensors["water_leak"] = sensorData.isRaining;
-  sensors["motion"] = sensorData.motionDetected;
-  sensors["light_level"] = sensorData.lightLevel;
-  sensors["temperature_c"] = sensorData.temperature;
-  sensors["humidity_percent"] = sensorData.humidity;
-  sensors["battery_percent"] = sensorData.batteryLevel;
-  
-  // System status
-  JsonObject status = jsonDoc.createNestedObject("system");
-  status["wifi_connected"] = systemStatus.wifiConnected;
-  status["mqtt_connected"] = systemStatus.mqttConnected;
-  status["rssi"] = WiFi.RSSI();
-  status["publish_count"] = systemStatus.publishCount;
-  status["error_count"] = systemStatus.errorCount;
+  jsonDoc["boot_id"] = bootId;
+  if (count == 1) {
+    writeReadingJson(jsonDoc.as<JsonObject>(), bufferedReading(0));
+  } else {
+    jsonDoc["timestamp"] = millis();  // send time, the bridge dates each reading from it
+    JsonArray readings = jsonDoc.createNestedArray("readings");
+    for (int i = 0; i < count; i++) {
+      writeReadingJson(readings.createNestedObject(), bufferedReading(i));
+    }
+  }
   
   String payload;
   serializeJson(jsonDoc, payload);
   
-  if (mqttClient.publish(TOPIC_SENSOR_DATA, payload.c_str())) {
-    if (DEBUG_MODE) {
-      Serial.println("\n📤 Published Sensor Data:");
-      Serial.println(payload);
-    }
-  } else {
-    Serial.println("❌ Failed to publish sensor data");
-    systemStatus.errorCount++;
+  if (!mqttClient.publish(TOPIC_SENSOR_DATA, (const uint8_t*)payload.c_str(), payload.length())) return false;
+  if (DEBUG_MODE) {
+    Serial.printf("\n📤 Published %d reading(s):\n", count);
+    Serial.println(payload);
   }
+  return true;
 }
+#endif
 
 void publishAlert(String alertType, String message, String severity) {
   if (!mqttClient.connected()) return;
   
-  StaticJsonDocument<256> alertDoc;
+  StaticJsonDocument<384> alertDoc;
   alertDoc["device_id"] = DEVICE_ID;
   alertDoc["timestamp"] = millis();
+  alertDoc["boot_id"] = bootId;
+  alertDoc["seq"] = ++messageSeq;
   alertDoc["alert_type"] = alertType;
   alertDoc["severity"] = severity;
   alertDoc["message"] = message;
@@ -426,6 +635,8 @@ void publishHeartbeat() {
   StaticJsonDocument<256> heartbeat;
   heartbeat["device_id"] = DEVICE_ID;
   heartbeat["timestamp"] = millis();
+  heartbeat["boot_id"] = bootId;
+  heartbeat["seq"] = ++messageSeq;
   heartbeat["uptime_minutes"] = systemStatus.uptimeMinutes;
   heartbeat["free_heap"] = ESP.getFreeHeap();
   heartbeat["wifi_rssi"] = WiFi.RSSI();
@@ -0,0 +1,160 @@
+# alert_engine.py
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Defaults match the Settings page sliders; the bridge overrides them from
+# the settings/alert_thresholds document when it exists
+DEFAULT_THRESHOLDS = {
+    'air_warning': 100,
+    'air_critical': 200,
+    'temp_high': 30,
+    'temp_low': 18,
+    'humidity_high': 70,
+    'humidity_low': 30,
+    'inactivity_threshold': 60,  # minutes
+}
+
+
+class AlertRule:
+    """One threshold on one sensor field.
+
+    The rule triggers when the value is beyond `threshold` ('above' or
+    'below') for at least `min_duration` seconds, and only clears once the
+    value is back past the threshold by `hysteresis`. After firing, the rule
+    stays quiet for `cooldown` seconds even if a new episode starts.
+    """
+
+    __slots__ = ('name', 'alert_type', 'field', 'direction', 'threshold', 'hysteresis',
+                 'min_duration', 'cooldown', 'severity', 'message')
+
+    def __init__(self, name, alert_type, field, direction, threshold, severity, message,
+                 hysteresis=0.0, min_duration=0.0, cooldown=900.0):
+        self.name = name
+        self.alert_type = alert_type
+        self.field = field
+        self.direction = direction
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.min_duration = min_duration
+        self.cooldown = cooldown
+        self.severity = severity
+        self.message = message
+
+    def triggered(self, value):
+        if self.direction == 'above':
+            return value > self.threshold
+        return value < self.threshold
+
+    def cleared(self, value):
+        if self.direction == 'above':
+            return value <= self.threshold - self.hysteresis
+        return value >= self.threshold + self.hysteresis
+
+
+def rules_from_thresholds(thresholds):
+    """Build the rule set from Settings page thresholds"""
+    t = dict(DEFAULT_THRESHOLDS)
+    t.update({k: v for k, v in thresholds.items() if v is not None})
+    return [
+        AlertRule('air_warning', 'AIR_QUALITY', 'air_quality_ppm', 'above', t['air_warning'], 'MEDIUM',
+                  "Air quality warning: {value} PPM", hysteresis=10, min_duration=30),
+        AlertRule('air_critical', 'AIR_QUALITY', 'air_quality_ppm', 'above', t['air_critical'], 'HIGH',
+                  "Air quality critical: {value} PPM", hysteresis=10, min_duration=10),
+        AlertRule('temp_high', 'TEMPERATURE', 'temperature_c', 'above', t['temp_high'], 'MEDIUM',
+                  "High temperature: {value}°C", hysteresis=0.5, min_duration=60),
+        AlertRule('temp_low', 'TEMPERATURE', 'temperature_c', 'below', t['temp_low'], 'MEDIUM',
+                  "Low temperature: {value}°C", hysteresis=0.5, min_duration=60),
+        AlertRule('humidity_high', 'HUMIDITY', 'humidity_percent', 'above', t['humidity_high'], 'LOW',
+                  "High humidity: {value}%", hysteresis=2, min_duration=60),
+        AlertRule('humidity_low', 'HUMIDITY', 'humidity_percent', 'below', t['humidity_low'], 'LOW',
+                  "Low humidity: {value}%", hysteresis=2, min_duration=60),
+        AlertRule('water_leak', 'WATER_LEAK', 'water_leak', 'above', 0.5, 'HIGH',
+                  "Water leak detected!", cooldown=300),
+        # No motion for the whole inactivity window: motion == 0 held for min_duration
+        AlertRule('inactivity', 'MOTION_TIMEOUT', 'motion', 'below', 0.5, 'MEDIUM',
+                  f"No motion detected for {t['inactivity_threshold']} minutes",
+                  min_duration=t['inactivity_threshold'] * 60, cooldown=t['inactivity_threshold'] * 60),
+    ]
+
+
+class _RuleState:
+    __slots__ = ('active', 'pending_since', 'last_fired')
+
+    def __init__(self):
+        self.active = False
+        self.pending_since = None
+        self.last_fired = None
+
+
+class AlertEngine:
+    """Streaming threshold evaluation over sensor readings.
+
+    State is a fixed slot per (device, rule): whether an episode is active,
+    when the current excursion started, and when the rule last fired. Each
+    reading is O(number of rules). `emit(device_id, rule, value, now,
+    reading_id)` is called once per episode, with the ID of the reading that
+    fired it.
+    """
+
+    def __init__(self, rules, emit):
+        self.emit = emit
+        self._rules = list(rules)
+        self._states = {}  # device_id -> [_RuleState per rule]
+        self._lock = threading.Lock()
+
+        self.readings = 0
+        self.fired = 0
+
+    def set_rules(self, rules):
+        """Swap in new thresholds; state is kept when the rule names are unchanged"""
+        rules = list(rules)
+        with self._lock:
+            if [r.name for r in rules] != [r.name for r in self._rules]:
+                self._states = {}
+            self._rules = rules
+        logger.info(f"🔔 Alert rules updated: {', '.join(f'{r.name}={r.threshold}' for r in rules)}")
+
+    def evaluate(self, device_id, sensors, now, reading_id=None):
+        """Feed one reading; `now` is a timestamp in seconds"""
+        if not isinstance(sensors, dict):
+            return
+        rules = self._rules
+        states = self._states.get(device_id)
+        if states is None or len(states) != len(rules):
+            with self._lock:
+                states = self._states[device_id] = [_RuleState() for _ in rules]
+
+        self.readings += 1
+        for rule, state in zip(rules, states):
+            # A missing or non-numeric field skips the rule, not the reading
+            try:
+                value = float(sensors.get(rule.field))
+            except (TypeError, ValueError):
+                continue
+
+            if state.active:
+                if rule.cleared(value):
+                    state.active = False
+                    state.pending_since = None
+                continue
+
+            if not rule.triggered(value):
+                state.pending_since = None
+                continue
+
+            if state.pending_since is None:
+                state.pending_since = now
+            if now - state.pending_since < rule.min_duration:
+                continue
+            if state.last_fired is not None and now - state.last_fired < rule.cooldown:
+                continue
+
+            state.active = True
+            state.last_fired = now
+            self.fired += 1
+            self.emit(device_id, rule, value, now, reading_id)
+
+    def stats(self):
+        return {'readings': self.readings, 'fired': self.fired, 'devices': len(self._states)}
@@ -0,0 +1,146 @@
+# alert_episodes.py
+import logging
+import threading
+from datetime import datetime
+
+from dedup import DedupCache
+
+logger = logging.getLogger(__name__)
+
+
+class _Episode:
+    __slots__ = ('doc_ref', 'data', 'first_seen', 'last_seen', 'count', 'peak', 'low',
+                 'new', 'dirty', 'tokens', 'messages')
+
+    def __init__(self, doc_ref, data, now, dedup_capacity):
+        self.doc_ref = doc_ref
+        self.data = data
+        self.first_seen = now
+        self.last_seen = now
+        self.count = 0
+        self.peak = None
+        self.low = None
+        self.new = True
+        self.dirty = False
+        self.tokens = []
+        # Document IDs of the latest alerts counted, so a replay counts none twice
+        self.messages = DedupCache(dedup_capacity)
+
+
+class EpisodeCompactor:
+    """Folds repeated device alerts into one episode document.
+
+    Alerts with the same (device_id, alert_type, severity) that arrive within
+    `window` seconds of the previous one belong to the same episode. The
+    episode document carries first_seen, last_seen, count and the peak value,
+    and gets at most one write per `flush_interval`.
+
+    A spool replay brings back the alerts received since the oldest
+    unfinished message, which is seconds behind the newest, so each episode
+    remembers the IDs of its latest `dedup_capacity` alerts to skip them.
+    """
+
+    def __init__(self, writer, window=600.0, flush_interval=10.0, dedup_capacity=256):
+        self.writer = writer
+        self.window = window
+        self.flush_interval = flush_interval
+        self.dedup_capacity = dedup_capacity
+
+        self._episodes = {}  # (device_id, alert_type, severity) -> _Episode
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.alerts = 0
+        self.episodes = 0
+        self.writes = 0
+
+    def add(self, doc_ref, data, now, tokens=()):
+        """Record one alert received at datetime `now`. doc_ref (named by the message ID) is used if it starts a new episode"""
+        key = (data.get('device_id', 'unknown'), data.get('alert_type', 'unknown'), data.get('severity', 'LOW'))
+        value = data.get('value')
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            value = None
+
+        with self._lock:
+            self.alerts += 1
+            episode = self._episodes.get(key)
+            if episode is None or (now - episode.last_seen).total_seconds() > self.window:
+                if episode is not None and episode.dirty:
+                    self._write(episode)
+                episode = self._episodes[key] = _Episode(doc_ref, data, now, self.dedup_capacity)
+                self.episodes += 1
+
+            episode.dirty = True
+            episode.tokens.extend(tokens)
+            if episode.messages.seen(doc_ref.id):
+                # Replayed after a failed write: its tokens still need the episode write
+                return
+            episode.data = data
+            episode.last_seen = max(episode.last_seen, now)
+            episode.count += 1
+            if value is not None:
+                episode.peak = value if episode.peak is None else max(episode.peak, value)
+                episode.low = value if episode.low is None else min(episode.low, value)
+
+    def _write(self, episode):
+        doc = {
+            'device_id': episode.data.get('device_id', 'unknown'),
+            'alert_type': episode.data.get('alert_type', 'unknown'),
+            'severity': episode.data.get('severity', 'LOW'),
+            'message': episode.data.get('message', ''),
+            'topic': episode.data.get('topic'),
+            'first_seen': episode.first_seen.isoformat(),
+            'last_seen': episode.last_seen.isoformat(),
+            'received_at': episode.last_seen.isoformat(),
+            'count': episode.count,
+        }
+        if episode.peak is not None:
+            doc['value'] = episode.data.get('value')
+            doc['peak_value'] = episode.peak
+            doc['min_value'] = episode.low
+        if 'threshold' in episode.data:
+            doc['threshold'] = episode.data['threshold']
+        if episode.new:
+            # Only on creation, so an acknowledged episode stays acknowledged
+            doc['alert_status'] = 'active'
+            doc['acknowledged'] = False
+            episode.new = False
+
+        self.writer.set(episode.doc_ref, doc, merge=True, tokens=tuple(episode.tokens))
+        episode.tokens = []
+        episode.dirty = False
+        self.writes += 1
+
+    def flush(self, now=None):
+        """Write every episode that changed since the last flush and forget closed ones"""
+        with self._lock:
+            for key, episode in list(self._episodes.items()):
+                if episode.dirty:
+                    self._write(episode)
+                if now is not None and (now - episode.last_seen).total_seconds() > self.window:
+                    del self._episodes[key]
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="alert-episodes", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush(datetime.now())
+
+    def stats(self):
+        with self._lock:
+            return {'alerts': self.alerts, 'episodes': self.episodes, 'writes': self.writes,
+                    'open_episodes': len(self._episodes),
+                    'alert_ids': sum(episode.messages.stats()['size'] for episode in self._episodes.values())}
@@ -0,0 +1,126 @@
+# bench_batch_writer.py
+# Compare per-message Firestore writes against the BatchWriter at fixed publish rates.
+#   python bench_batch_writer.py --rates 1 10 100 --duration 10 --latency 0.05
+import argparse
+import json
+import time
+from datetime import datetime
+
+from fake_firestore import FakeFirestore
+from firestore_writer import BatchWriter
+
+
+def sample_payload(device_id, seq):
+    return json.dumps({
+        "device_id": device_id,
+        "device_type": "ESP32-S2",
+        "location": "Living Room",
+        "timestamp": seq * 5000,
+        "uptime_seconds": seq * 5,
+        "sensors": {
+            "air_quality_ppm": 120, "water_leak": False, "motion": False,
+            "light_level": 2100, "temperature_c": 25.4,
+            "humidity_percent": 61.2, "battery_percent": 88.0
+        },
+        "system": {
+            "wifi_connected": True, "mqtt_connected": True,
+            "rssi": -61, "publish_count": seq, "error_count": 0
+        }
+    }).encode('utf-8')
+
+
+def direct_handler(db):
+    def handle(payload):
+        data = json.loads(payload)
+        data['received_at'] = datetime.now().isoformat()
+        device_id = data['device_id']
+        db.collection('sensor_readings').document(f"{device_id}_{data['timestamp']}").set(data)
+        db.collection('devices_latest').document(device_id).set({
+            'last_reading': data,
+            'last_updated': data['received_at']
+        })
+    return handle, None
+
+
+def batched_handler(db, max_ops, max_age):
+    writer = BatchWriter(db, max_ops=max_ops, max_age=max_age)
+    writer.start()
+
+    def handle(payload):
+        data = json.loads(payload)
+        data['received_at'] = datetime.now().isoformat()
+        device_id = data['device_id']
+        writer.set(db.collection('sensor_readings').document(f"{device_id}_{data['timestamp']}"), data)
+        writer.set(db.collection('devices_latest').document(device_id), {
+            'last_reading': data,
+            'last_updated': data['received_at']
+        })
+    return handle, writer
+
+
+def run(mode, rate, duration, latency, devices, max_ops, max_age):
+    db = FakeFirestore(latency=latency)
+    if mode == 'direct':
+        handle, writer = direct_handler(db)
+    else:
+        handle, writer = batched_handler(db, max_ops, max_age)
+
+    total = int(rate * duration)
+    handler_time = 0.0
+    started = time.perf_counter()
+    for i in range(total):
+        # Publish on schedule; if the handler has fallen behind, publish immediately
+        due = started + i / rate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+        payload = sample_payload(f"esp32_{i % devices:03d}", i)
+        t0 = time.perf_counter()
+        handle(payload)
+        handler_time += time.perf_counter() - t0
+
+    if writer is not None:
+        writer.stop()
+    elapsed = time.perf_counter() - started
+
+    result = {
+        'mode': mode,
+        'rate': rate,
+        'messages': total,
+        'achieved_msgs_per_s': total / elapsed,
+        'handler_ms_per_msg': handler_time / total * 1000,
+        'round_trips': db.round_trips,
+        'writes': db.writes,
+    }
+    if writer is not None:
+        stats = writer.stats()
+        result['flushes'] = stats['flushes']
+        result['avg_flush_size'] = stats['avg_flush_size']
+        result['avg_flush_latency_ms'] = stats['avg_flush_latency_ms']
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BatchWriter throughput benchmark")
+    parser.add_argument('--rates', type=float, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--duration', type=float, default=10, help="seconds per run")
+    parser.add_argument('--latency', type=float, default=0.05, help="simulated Firestore round trip (s)")
+    parser.add_argument('--devices', type=int, default=30)
+    parser.add_argument('--max-ops', type=int, default=500)
+    parser.add_argument('--max-age', type=float, default=1.0)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'rate':>6} {'msgs':>6} {'msgs/s':>8} {'handler ms':>11} "
+          f"{'round trips':>12} {'flushes':>8} {'avg size':>9} {'flush ms':>9}")
+    for rate in args.rates:
+        for mode in ('direct', 'batched'):
+            r = run(mode, rate, args.duration, args.latency, args.devices, args.max_ops, args.max_age)
+            print(f"{r['mode']:<8} {r['rate']:>6g} {r['messages']:>6} {r['achieved_msgs_per_s']:>8.1f} "
+                  f"{r['handler_ms_per_msg']:>11.3f} {r['round_trips']:>12} "
+                  f"{r.get('flushes', '-'):>8} {r.get('avg_flush_size', 0):>9.1f} "
+                  f"{r.get('avg_flush_latency_ms', 0):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# bench_bridge_async.py
+# Compares the threaded bridge (mqtt_firebase_bridge.py) with the asyncio one
+# (bridge_async.py) on the bench_bridge_load.py device simulator and a slow FakeFirestore,
+# and the memory cost of a pending write as a blocked thread versus an awaiting coroutine.
+#   python bench_bridge_async.py --devices 200 --duration 300 --latency 0.5
+#   python bench_bridge_async.py --pending 1000 5000
+import argparse
+import asyncio
+import logging
+import shutil
+import tempfile
+import threading
+import time
+
+import bridge_async
+import mqtt_firebase_bridge as bridge
+from bench_bridge_load import generate, peak_rss_mb
+from fake_firestore import FakeAsyncFirestore, FakeFirestore
+
+
+def current_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run_threads(args, messages, workdir):
+    db = FakeFirestore(latency=args.latency)
+    bridge.setup(db, spool_dir=f"{workdir}/spool", spill_dir=f"{workdir}/spill")
+    bridge.start()
+
+    started = time.perf_counter()
+    for topic, payload in messages:
+        bridge.accept(topic, payload)
+    bridge.stop()
+    elapsed = time.perf_counter() - started
+    return {'elapsed': elapsed, 'writer': bridge.writer.stats(), 'round_trips': db.round_trips}
+
+
+def run_async(args, messages, workdir):
+    db = FakeAsyncFirestore(latency=args.latency)
+    bridge_async.ASYNC_MAX_INFLIGHT = args.max_inflight
+
+    async def main():
+        pipeline = bridge_async.setup(db, spool_dir=f"{workdir}/spool", spill_dir=f"{workdir}/spill")
+        bridge_async.start(pipeline)
+        started = time.perf_counter()
+        for topic, payload in messages:
+            await pipeline.accept(topic, payload)
+        await bridge_async.stop(pipeline)
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(main())
+    return {'elapsed': elapsed, 'writer': bridge.writer.stats(), 'round_trips': db.round_trips}
+
+
+def pending_threads(count, latency):
+    """RSS growth with `count` threads each blocked in a write round trip"""
+    before = current_rss_mb()
+    release = threading.Event()
+    threads = [threading.Thread(target=release.wait, args=(latency,), daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    grown = current_rss_mb() - before
+    release.set()
+    for thread in threads:
+        thread.join()
+    return grown
+
+
+def pending_coroutines(count, latency):
+    """RSS growth with `count` tasks each awaiting a write round trip"""
+    async def main():
+        before = current_rss_mb()
+        release = asyncio.Event()
+
+        async def write():
+            try:
+                await asyncio.wait_for(release.wait(), latency)
+            except asyncio.TimeoutError:
+                pass
+
+        tasks = [asyncio.create_task(write()) for _ in range(count)]
+        await asyncio.sleep(0)
+        grown = current_rss_mb() - before
+        release.set()
+        await asyncio.gather(*tasks)
+        return grown
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Threaded versus asyncio bridge benchmark")
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=300, help="simulated seconds")
+    parser.add_argument('--publish-interval', type=float, default=5.0)
+    parser.add_argument('--read-interval', type=float, default=2.0)
+    parser.add_argument('--heartbeat-interval', type=float, default=60.0)
+    parser.add_argument('--polluted', type=float, default=0.1)
+    parser.add_argument('--latency', type=float, default=0.5, help="simulated Firestore round trip (s)")
+    parser.add_argument('--batch-ops', type=int, default=bridge.BATCH_MAX_OPS,
+                        help="BATCH_MAX_OPS; small batches mean more commits in flight")
+    parser.add_argument('--max-inflight', type=int, default=bridge_async.ASYNC_MAX_INFLIGHT)
+    parser.add_argument('--pending', type=int, nargs='*', default=[1000, 5000],
+                        help="pending-write counts for the memory comparison")
+    parser.add_argument('--seed', type=int, default=357)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+    bridge.BATCH_MAX_OPS = args.batch_ops
+
+    messages = [(topic, payload) for _, topic, payload in generate(args)]
+    print(f"{len(messages)} messages from {args.devices} devices, Firestore latency "
+          f"{args.latency * 1000:.0f} ms, batches of up to {args.batch_ops} writes")
+
+    for name, run in (('threads', run_threads), ('asyncio', run_async)):
+        workdir = tempfile.mkdtemp(prefix="bridge-async-")
+        try:
+            r = run(args, messages, workdir)
+        finally:
+            shutil.rmtree(workdir)
+        w = r['writer']
+        print(f"{name:8s}: {len(messages) / r['elapsed']:7.0f} msgs/s persisted in {r['elapsed']:.2f}s, "
+              f"{w['ops_written']} writes in {r['round_trips']} commits, "
+              f"{w.get('inflight_high_water', 1)} commit(s) in flight at most, peak RSS {peak_rss_mb():.0f} MB")
+
+    for count in args.pending:
+        threads = pending_threads(count, args.latency * 10)
+        coroutines = pending_coroutines(count, args.latency * 10)
+        print(f"{count} pending writes: threads +{threads:.1f} MB ({threads * 1024 / count:.1f} KB each), "
+              f"coroutines +{coroutines:.1f} MB ({coroutines * 1024 / count:.1f} KB each)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# bench_bridge_cluster.py
+# Throughput of the multi-process bridge (bridge_cluster.py, dispatch mode) for 1..N
+# worker processes, fed offline by the bench_bridge_load.py device simulator with a
+# FakeFirestore in every worker.
+#   python bench_bridge_cluster.py --processes 1 2 4 8 --devices 200 --duration 600
+import argparse
+import functools
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from bench_bridge_load import generate
+from bridge_cluster import BridgeCluster
+from fake_firestore import FakeFirestore
+
+
+def run(args, processes, messages, workdir):
+    acks = [0]
+    acked = threading.Event()
+    lock = threading.Lock()
+
+    def on_ack(mid, qos):
+        with lock:
+            acks[0] += 1
+            if acks[0] == len(messages):
+                acked.set()
+
+    cluster = BridgeCluster(processes, make_db=functools.partial(FakeFirestore, latency=args.latency),
+                            on_ack=on_ack, spool_dir=f"{workdir}/spool", spill_dir=f"{workdir}/spill",
+                            log_level="WARNING")
+    cluster.start()
+    cluster.wait_ready()
+
+    started = time.perf_counter()
+    for mid, (topic, payload) in enumerate(messages, 1):
+        cluster.dispatch(topic, payload, mid, 1)
+    acked.wait(args.timeout)
+    acked_in = time.perf_counter() - started
+    cluster.stop()
+    elapsed = time.perf_counter() - started
+
+    stats = [w.stats or {} for w in cluster.workers]
+    return {
+        'acked_in': acked_in,
+        'elapsed': elapsed,
+        'acks': acks[0],
+        'processed': sum(s.get('processed', 0) for s in stats),
+        'per_worker': [s.get('processed', 0) for s in stats],
+        'writes': sum(s.get('writes', 0) for s in stats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process bridge scaling benchmark")
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=600, help="simulated seconds")
+    parser.add_argument('--publish-interval', type=float, default=5.0)
+    parser.add_argument('--read-interval', type=float, default=2.0)
+    parser.add_argument('--heartbeat-interval', type=float, default=60.0)
+    parser.add_argument('--polluted', type=float, default=0.1)
+    parser.add_argument('--latency', type=float, default=0.05, help="simulated Firestore round trip (s)")
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--seed', type=int, default=357)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    messages = [(topic, payload) for _, topic, payload in generate(args)]
+    print(f"{len(messages)} messages from {args.devices} devices, Firestore latency "
+          f"{args.latency * 1000:.0f} ms, {os.cpu_count()} CPU(s)")
+
+    baseline = None
+    for processes in args.processes:
+        workdir = tempfile.mkdtemp(prefix="bridge-cluster-")
+        try:
+            r = run(args, processes, messages, workdir)
+        finally:
+            shutil.rmtree(workdir)
+        rate = r['processed'] / r['elapsed']
+        baseline = baseline or rate
+        print(f"{processes} process(es): {rate:7.0f} msgs/s persisted ({rate / baseline:.2f}x), "
+              f"{len(messages) / r['acked_in']:7.0f} msgs/s spooled+acked, "
+              f"{r['processed']} processed, {r['writes']} writes, per worker {r['per_worker']}")
+
+
+if __name__ == "__main__":
+    main()
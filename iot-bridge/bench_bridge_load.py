@@ -0,0 +1,351 @@
+# bench_bridge_load.py
+# Offline load test of the bridge: simulated ESP32 devices publish the same payloads
+# as publishSensorData, publishAlert and publishHeartbeat in arduino.cpp, and every
+# message goes through mqtt_firebase_bridge.on_message (spool, ingest queue, workers,
+# batch writer) into a FakeFirestore. No broker or Firebase project is needed.
+#   python bench_bridge_load.py --devices 100 --duration 600 --speedup 0
+# --speedup 0 replays the simulated time as fast as possible (throughput), --speedup 1
+# publishes in real time, 10 ten times faster, and so on.
+import argparse
+import heapq
+import json
+import logging
+import math
+import random
+import resource
+import shutil
+import tempfile
+import threading
+import time
+
+import mqtt_firebase_bridge as bridge
+from fake_firestore import FakeFirestore
+
+TOPIC_SENSOR_DATA = "home/sensors/data"
+TOPIC_ALERTS = "home/sensors/alerts"
+TOPIC_HEARTBEAT = "home/heartbeat"
+
+AIR_QUALITY_ALERT_THRESHOLD = 300
+TEMP_HIGH_THRESHOLD = 30
+TEMP_LOW_THRESHOLD = 18
+HUMIDITY_HIGH_THRESHOLD = 70
+HUMIDITY_LOW_THRESHOLD = 30
+LIGHT_DARK_THRESHOLD = 500
+# DEVICE_THRESHOLD_ALERTS in arduino.cpp: the bridge raises these alerts itself
+DEVICE_THRESHOLD_ALERTS = False
+
+
+def dumps(doc):
+    # ArduinoJson's serializeJson writes compact JSON
+    return json.dumps(doc, separators=(',', ':')).encode('utf-8')
+
+
+class SimDevice:
+    """One ESP32 node: sensor state and the three payload shapes it publishes"""
+
+    def __init__(self, index, polluted, rng):
+        self.device_id = f"esp32_monitor_{index:03d}"
+        self.boot_id = rng.getrandbits(32)
+        self.seq = 0
+        self.polluted = polluted
+        self.rng = rng
+        self.publish_count = 0
+        self.millis = 0
+        self.simulate(0)
+
+    def simulate(self, millis):
+        # simulateSensors(), with random numbers standing in for the pins
+        self.millis = millis
+        base = 380 if self.polluted else 120
+        self.air_quality = max(50, min(500, int(self.rng.gauss(base, 20))))
+        self.is_raining = self.rng.random() < 0.001
+        self.motion = self.rng.random() < 0.2
+        self.light_level = self.rng.randint(400, 3000)
+        self.temperature = 25.0 + 3.0 * math.sin(millis / 600000.0)
+        self.humidity = 60.0 + 10.0 * math.sin(millis / 900000.0)
+        self.battery = 85.0 + 10.0 * math.sin(millis / 1800000.0)
+
+    def reading(self):
+        self.seq += 1
+        self.publish_count += 1
+        return {
+            "timestamp": self.millis,
+            "seq": self.seq,
+            "uptime_seconds": self.millis // 1000,
+            "sensors": {
+                "air_quality_ppm": self.air_quality,
+                "water_leak": self.is_raining,
+                "motion": self.motion,
+                "light_level": self.light_level,
+                "temperature_c": round(self.temperature, 2),
+                "humidity_percent": round(self.humidity, 2),
+                "battery_percent": round(self.battery, 2),
+            },
+            "system": {
+                "wifi_connected": True,
+                "mqtt_connected": True,
+                "rssi": self.rng.randint(-80, -50),
+                "publish_count": self.publish_count,
+                "error_count": 0,
+            },
+        }
+
+    def sensor_data(self):
+        reading = self.reading()
+        return dumps({
+            "device_id": self.device_id,
+            "device_type": "ESP32-S2",
+            "location": "Living Room",
+            "timestamp": reading.pop("timestamp"),
+            "boot_id": self.boot_id,
+            **reading,
+        })
+
+    def sensor_batch(self, readings):
+        # publishReadings() with PUBLISH_BATCH_SIZE > 1: the timestamp is the send time
+        return dumps({
+            "device_id": self.device_id,
+            "device_type": "ESP32-S2",
+            "location": "Living Room",
+            "boot_id": self.boot_id,
+            "timestamp": self.millis,
+            "readings": readings,
+        })
+
+    def alert(self, alert_type, message, severity):
+        self.seq += 1
+        doc = {
+            "device_id": self.device_id,
+            "timestamp": self.millis,
+            "boot_id": self.boot_id,
+            "seq": self.seq,
+            "alert_type": alert_type,
+            "severity": severity,
+            "message": message,
+        }
+        if alert_type == "AIR_QUALITY":
+            doc["value"] = self.air_quality
+            doc["threshold"] = AIR_QUALITY_ALERT_THRESHOLD
+        elif alert_type == "WATER_LEAK":
+            doc["value"] = self.is_raining
+        elif alert_type == "TEMPERATURE":
+            doc["value"] = round(self.temperature, 2)
+        return dumps(doc)
+
+    def alerts(self):
+        # checkAlerts(): one publishAlert per threshold exceeded on this read
+        if DEVICE_THRESHOLD_ALERTS:
+            yield from self.threshold_alerts()
+        if self.light_level < LIGHT_DARK_THRESHOLD:
+            yield self.alert("LIGHT", "Room is dark", "INFO")
+
+    def threshold_alerts(self):
+        if self.air_quality > AIR_QUALITY_ALERT_THRESHOLD:
+            yield self.alert("AIR_QUALITY", f"Air quality critical: {self.air_quality} PPM", "HIGH")
+        if self.is_raining:
+            yield self.alert("WATER_LEAK", "Water leak detected!", "HIGH")
+        if self.temperature > TEMP_HIGH_THRESHOLD:
+            yield self.alert("TEMPERATURE", f"High temperature: {self.temperature:.2f}°C", "MEDIUM")
+        elif self.temperature < TEMP_LOW_THRESHOLD:
+            yield self.alert("TEMPERATURE", f"Low temperature: {self.temperature:.2f}°C", "MEDIUM")
+        if self.humidity > HUMIDITY_HIGH_THRESHOLD:
+            yield self.alert("HUMIDITY", f"High humidity: {self.humidity:.2f}%", "LOW")
+        elif self.humidity < HUMIDITY_LOW_THRESHOLD:
+            yield self.alert("HUMIDITY", f"Low humidity: {self.humidity:.2f}%", "LOW")
+
+    def heartbeat(self):
+        self.seq += 1
+        return dumps({
+            "device_id": self.device_id,
+            "timestamp": self.millis,
+            "boot_id": self.boot_id,
+            "seq": self.seq,
+            "uptime_minutes": self.millis // 60000,
+            "free_heap": self.rng.randint(150000, 200000),
+            "wifi_rssi": self.rng.randint(-80, -50),
+            "publish_count": self.publish_count,
+        })
+
+
+def generate(args):
+    """Yield (simulated seconds, topic, payload) in time order for all devices"""
+    batch_size = getattr(args, 'batch_size', 1)
+    rng = random.Random(args.seed)
+    devices = [SimDevice(i, rng.random() < args.polluted, rng) for i in range(args.devices)]
+
+    # (due time, device index, kind); devices start at random offsets like real nodes
+    events = []
+    for i in range(args.devices):
+        offset = rng.random()
+        events.append((offset * args.read_interval, i, 'read'))
+        events.append((offset * args.publish_interval, i, 'publish'))
+        events.append((offset * args.heartbeat_interval, i, 'heartbeat'))
+    heapq.heapify(events)
+    buffered = [[] for _ in devices]
+
+    while events:
+        at, i, kind = heapq.heappop(events)
+        if at >= args.duration:
+            continue
+        device = devices[i]
+        if kind == 'read':
+            device.simulate(int(at * 1000))
+            for payload in device.alerts():
+                yield at, TOPIC_ALERTS, payload
+            heapq.heappush(events, (at + args.read_interval, i, kind))
+        elif kind == 'publish':
+            if batch_size == 1:
+                yield at, TOPIC_SENSOR_DATA, device.sensor_data()
+            else:
+                buffered[i].append(device.reading())
+                if len(buffered[i]) == batch_size:
+                    yield at, TOPIC_SENSOR_DATA, device.sensor_batch(buffered[i])
+                    buffered[i] = []
+            heapq.heappush(events, (at + args.publish_interval, i, kind))
+        else:
+            yield at, TOPIC_HEARTBEAT, device.heartbeat()
+            heapq.heappush(events, (at + args.heartbeat_interval, i, kind))
+
+
+class FakeMessage:
+    __slots__ = ('topic', 'payload', 'qos', 'mid')
+
+    def __init__(self, topic, payload, qos, mid):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.mid = mid
+
+
+class FakeClient:
+    """Stands in for the paho client: counts the QoS 1 acks the bridge sends"""
+
+    def __init__(self):
+        self.acks = 0
+
+    def ack(self, mid, qos):
+        self.acks += 1
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(args, workdir):
+    db = FakeFirestore(latency=args.latency)
+    bridge.setup(db, spool_dir=f"{workdir}/spool", spill_dir=f"{workdir}/spill")
+
+    # Timestamps keyed by spool seq: put into the ingest queue, handled, persisted
+    put_at = {}
+    handled = []
+    persisted = []
+    lock = threading.Lock()
+
+    put = bridge.ingest.put
+    handler = bridge.ingest.handler
+    on_commit = bridge.writer.on_commit
+
+    def timed_put(topic, payload, token=None):
+        put_at[token] = time.perf_counter()
+        put(topic, payload, token)
+
+    def timed_handler(topic, payload, token=None):
+        handler(topic, payload, token)
+        done = time.perf_counter()
+        with lock:
+            handled.append(done - put_at[token])
+
+    def timed_commit(tokens):
+        done = time.perf_counter()
+        with lock:
+            persisted.extend(done - put_at[t] for t in tokens if t in put_at)
+        on_commit(tokens)
+
+    bridge.ingest.put = timed_put
+    bridge.ingest.handler = timed_handler
+    bridge.writer.on_commit = timed_commit
+
+    client = FakeClient()
+    bridge.start()
+
+    counts = {TOPIC_SENSOR_DATA: 0, TOPIC_ALERTS: 0, TOPIC_HEARTBEAT: 0}
+    started = time.perf_counter()
+    for mid, (at, topic, payload) in enumerate(generate(args), 1):
+        if args.speedup > 0:
+            delay = started + at / args.speedup - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        bridge.on_message(client, None, FakeMessage(topic, payload, 1, mid))
+        counts[topic] += 1
+    fed = sum(counts.values())
+
+    while len(handled) < fed and time.perf_counter() - started < args.timeout:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    bridge.stop()
+
+    return {
+        'counts': counts,
+        'fed': fed,
+        'handled': len(handled),
+        'elapsed': elapsed,
+        'handled_latency': sorted(handled),
+        'persisted_latency': sorted(persisted),
+        'acks': client.acks,
+        'doc_writes': db.writes,
+        'round_trips': db.round_trips,
+        'queue': bridge.ingest.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the MQTT to Firestore bridge")
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=600, help="simulated seconds")
+    parser.add_argument('--speedup', type=float, default=0, help="0 = as fast as possible")
+    parser.add_argument('--publish-interval', type=float, default=5.0, help="MQTT_PUBLISH_INTERVAL (s)")
+    parser.add_argument('--read-interval', type=float, default=2.0, help="SENSOR_READ_INTERVAL (s)")
+    parser.add_argument('--heartbeat-interval', type=float, default=60.0, help="HEARTBEAT_INTERVAL (s)")
+    parser.add_argument('--batch-size', type=int, default=1, help="PUBLISH_BATCH_SIZE, readings per sensor message")
+    parser.add_argument('--polluted', type=float, default=0.1,
+                        help="fraction of devices above the air quality alert threshold")
+    parser.add_argument('--latency', type=float, default=0.05, help="simulated Firestore round trip (s)")
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--seed', type=int, default=357)
+    parser.add_argument('--log-level', default="WARNING")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    baseline_rss = peak_rss_mb()
+
+    workdir = tempfile.mkdtemp(prefix="bridge-load-")
+    try:
+        r = run(args, workdir)
+    finally:
+        shutil.rmtree(workdir)
+
+    counts = r['counts']
+    print(f"{args.devices} devices, {args.duration:.0f}s simulated"
+          + (f" at {args.speedup:g}x" if args.speedup > 0 else " as fast as possible")
+          + f", Firestore latency {args.latency * 1000:.0f} ms")
+    print(f"Messages: {r['fed']} ({counts[TOPIC_SENSOR_DATA]} sensor, {counts[TOPIC_ALERTS]} alerts, "
+          f"{counts[TOPIC_HEARTBEAT]} heartbeats), {r['handled']} handled, {r['acks']} acked")
+    print(f"Sustained: {r['handled'] / r['elapsed']:.0f} msgs/s over {r['elapsed']:.2f}s")
+    for name in ('handled', 'persisted'):
+        values = r[f'{name}_latency']
+        print(f"{name.capitalize()} latency (ms): p50 {percentile(values, 50) * 1000:.1f}  "
+              f"p95 {percentile(values, 95) * 1000:.1f}  p99 {percentile(values, 99) * 1000:.1f}")
+    print(f"Firestore: {r['doc_writes']} document writes in {r['round_trips']} commits"
+          + (f", sensor messages carry {args.batch_size} readings each" if args.batch_size > 1 else ""))
+    print(f"Queue high water: {r['queue']['high_water']}")
+    print(f"Peak RSS: {peak_rss_mb():.0f} MB (baseline {baseline_rss:.0f} MB after imports)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# bench_broker_backlog.py
+# Measure how fast the bridge drains the backlog a broker queued while it was down.
+# Needs a broker that keeps persistent sessions (mosquitto: persistence true,
+# max_queued_messages large enough for the backlog). For brokers that do not queue
+# for offline sessions, --burst publishes the backlog at full speed while the
+# bridge is connected instead.
+#   python bench_broker_backlog.py --host localhost --port 1883 --messages 20000
+import argparse
+import json
+import logging
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import paho.mqtt
+import paho.mqtt.client as mqtt
+
+from fake_firestore import FakeFirestore
+from firestore_writer import BatchWriter, Coalescer
+from ingest_queue import IngestQueue
+from spool import Spool, SpoolReplayer
+
+TOPIC = "home/sensors/data"
+CLIENT_ID = "bridge-backlog-bench"
+MANUAL_ACK = hasattr(mqtt, 'CallbackAPIVersion')
+
+
+def make_client(client_id, clean_session, manual_ack=False):
+    if MANUAL_ACK:
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=client_id,
+                           clean_session=clean_session, manual_ack=manual_ack)
+    return mqtt.Client(client_id=client_id, clean_session=clean_session)
+
+
+def connect(client, args):
+    connected = threading.Event()
+    client.on_connect = lambda c, u, f, rc: connected.set()
+    if args.username:
+        client.username_pw_set(args.username, args.password)
+    client.connect(args.host, args.port, 60)
+    client.loop_start()
+    if not connected.wait(10):
+        raise RuntimeError(f"Could not connect to {args.host}:{args.port}")
+
+
+def register_session(args):
+    """Subscribe once with a persistent session, then go offline"""
+    client = make_client(CLIENT_ID, clean_session=False)
+    connect(client, args)
+    subscribed = threading.Event()
+    client.on_subscribe = lambda *a: subscribed.set()
+    client.subscribe(TOPIC, qos=1)
+    subscribed.wait(10)
+    client.disconnect()
+    client.loop_stop()
+
+
+def publish_backlog(args):
+    client = make_client("bridge-backlog-publisher", clean_session=True)
+    client.max_inflight_messages_set(100)
+    connect(client, args)
+    published = []
+    for i in range(args.messages):
+        payload = json.dumps({
+            "device_id": f"esp32_{i % args.devices:03d}", "device_type": "ESP32-S2",
+            "location": "Living Room", "timestamp": i * 5000, "uptime_seconds": i * 5,
+            "sensors": {"air_quality_ppm": 120, "water_leak": False, "motion": False,
+                        "light_level": 2100, "temperature_c": 25.4,
+                        "humidity_percent": 61.2, "battery_percent": 88.0},
+            "system": {"wifi_connected": True, "mqtt_connected": True, "rssi": -61,
+                       "publish_count": i, "error_count": 0}
+        })
+        published.append(client.publish(TOPIC, payload, qos=1))
+    for info in published:
+        info.wait_for_publish()
+    client.disconnect()
+    client.loop_stop()
+
+
+def drain_backlog(args, spool_dir):
+    """Reconnect with the same session and run the bridge pipeline until all messages are persisted"""
+    db = FakeFirestore(latency=args.latency)
+    spool = Spool(spool_dir, fsync=args.fsync, fsync_interval=args.fsync_interval)
+
+    persisted = []
+    all_persisted = threading.Event()
+
+    def on_commit(tokens):
+        spool.done(tokens)
+        persisted.append(len(tokens))
+        if sum(persisted) >= args.messages:
+            all_persisted.set()
+
+    writer = BatchWriter(db, on_commit=on_commit, on_error=spool.failed)
+    coalescer = Coalescer(writer)
+
+    # Same writes as process_message in mqtt_firebase_bridge.py
+    def process(topic, payload, token=None, received=None):
+        tokens = (token,) if token is not None else ()
+        data = json.loads(payload)
+        data['received_at'] = (received or datetime.now()).isoformat()
+        device_id = data['device_id']
+        writer.set(db.collection('sensor_readings').document(f"{device_id}_{data['timestamp']}"), data,
+                   tokens=tokens)
+        coalescer.set(db.collection('devices_latest').document(device_id), {
+            'last_reading': data, 'last_updated': data['received_at']
+        })
+
+    ingest = IngestQueue(process, workers=args.workers, on_drop=spool.done)
+    replayer = SpoolReplayer(spool, process, writer, coalescer)
+
+    client = make_client(CLIENT_ID, clean_session=False, manual_ack=True)
+    acked = [0]
+
+    def ack(client, msg):
+        client.ack(msg.mid, msg.qos)
+        acked[0] += 1
+
+    def on_message(client, userdata, msg):
+        on_durable = (lambda: ack(client, msg)) if MANUAL_ACK else None
+        seq, live = spool.append(msg.topic, msg.payload, on_durable=on_durable)
+        if not MANUAL_ACK:
+            spool.sync()
+            acked[0] += 1
+        if live:
+            ingest.put(msg.topic, msg.payload, seq)
+
+    writer.start()
+    coalescer.start()
+    ingest.start()
+    replayer.start()
+    client.on_message = on_message
+
+    started = time.perf_counter()
+    connect(client, args)
+    if args.burst:
+        client.subscribe(TOPIC, qos=1)
+        time.sleep(0.5)
+        started = time.perf_counter()
+        publish_backlog(args)
+    finished = all_persisted.wait(args.timeout)
+    elapsed = time.perf_counter() - started
+
+    client.disconnect()
+    client.loop_stop()
+    ingest.stop()
+    coalescer.stop()
+    writer.stop()
+    replayer.stop()
+    spool.close()
+
+    return {
+        'finished': finished,
+        'persisted': sum(persisted),
+        'acked': acked[0],
+        'elapsed': elapsed,
+        'commits': db.round_trips,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Broker backlog drain benchmark")
+    parser.add_argument('--host', default="localhost")
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--devices', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.05, help="simulated Firestore round trip (s)")
+    parser.add_argument('--fsync', default="interval")
+    parser.add_argument('--fsync-interval', type=float, default=0.05)
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--burst', action='store_true',
+                        help="publish while the bridge is connected instead of queueing offline")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    register_session(args)
+
+    if not args.burst:
+        started = time.perf_counter()
+        publish_backlog(args)
+        print(f"Queued {args.messages} QoS 1 messages in {time.perf_counter() - started:.1f}s "
+              f"while the bridge was offline")
+
+    spool_dir = tempfile.mkdtemp(prefix="backlog-bench-")
+    try:
+        r = drain_backlog(args, spool_dir)
+    finally:
+        shutil.rmtree(spool_dir)
+
+    ack_mode = "manual ack after fsync" if MANUAL_ACK else "ack on return after fsync"
+    print(f"paho-mqtt {paho.mqtt.__version__} ({ack_mode})")
+    print(f"Persisted {r['persisted']}/{args.messages} in {r['elapsed']:.2f}s "
+          f"= {r['persisted'] / r['elapsed']:.0f} msgs/s, {r['acked']} acked, {r['commits']} commits"
+          + ("" if r['finished'] else " (timed out)"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# bench_frame_memory.py
+# Memory and st.cache_data pickling cost of the dashboard's cached frames: every
+# column in the type pandas infers (sensor_frame(..., compact=False) and the plain
+# alert DataFrame, as cached before) versus the compact layout of frames.py, for
+# documents of the bench_bridge_load.py fleet.
+#   python bench_frame_memory.py --rows 100000 --legacy 0.1
+import argparse
+import json
+import pickle
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pandas as pd
+
+from bench_bridge_load import TOPIC_ALERTS, generate
+from bench_frames import compare, documents
+from frames import alert_frame, readings_frame, sensor_frame
+
+PER_ROWS = 100000
+
+
+def alert_documents(count, seed):
+    """count alert documents as the bridge writes them, repeats folded into episodes"""
+    fleet = SimpleNamespace(devices=100, duration=count * 5.0 / 10 + 5, publish_interval=5.0,
+                            read_interval=2.0, heartbeat_interval=60.0, polluted=0.0, seed=seed)
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for at, topic, payload in generate(fleet):
+        if topic != TOPIC_ALERTS:
+            continue
+        data = json.loads(payload)
+        received = (base + timedelta(seconds=at)).astimezone().replace(tzinfo=None)
+        first = received - timedelta(seconds=len(rows) % 600)
+        rows.append({**data, 'topic': TOPIC_ALERTS, 'received_at': received.isoformat(),
+                     'first_seen': first.isoformat(), 'last_seen': received.isoformat(),
+                     'count': 1 + len(rows) % 7, 'alert_status': 'active', 'acknowledged': False,
+                     'id': f"a{len(rows)}"})
+        if len(rows) == count:
+            break
+    return rows
+
+
+def plain_alert_frame(rows):
+    df = pd.DataFrame(rows)
+    df['timestamp'] = pd.to_datetime(df['received_at'], format='ISO8601')
+    return df
+
+
+def measure(frame, rounds):
+    """(bytes per PER_ROWS rows, pickled bytes, best dumps seconds, best loads seconds)"""
+    memory = frame.memory_usage(deep=True).sum() * PER_ROWS / len(frame)
+    dumps = loads = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        blob = pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL)
+        dumps = min(dumps, time.perf_counter() - started)
+        started = time.perf_counter()
+        pickle.loads(blob)
+        loads = min(loads, time.perf_counter() - started)
+    return memory, len(blob), dumps, loads
+
+
+def report(what, before, after, rounds):
+    for label, frame in (('before', before), ('after', after)):
+        memory, size, dumps, loads = measure(frame, rounds)
+        print(f"{what:7s} {label:6s}: {len(frame.columns):2d} columns, {memory / 2**20:7.1f} MiB per {PER_ROWS} rows, "
+              f"pickle {size / 2**20:7.1f} MiB, dumps {dumps * 1000:7.1f} ms, loads {loads * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cached frame memory and pickling cost")
+    parser.add_argument('--rows', type=int, default=PER_ROWS)
+    parser.add_argument('--alerts', type=int, default=20000)
+    parser.add_argument('--legacy', type=float, default=0.0, help="share of pre-schema_version 2 documents")
+    parser.add_argument('--rounds', type=int, default=3, help="timing runs, the best one counts")
+    parser.add_argument('--seed', type=int, default=357)
+    args = parser.parse_args()
+
+    rows = documents(args.rows, args.legacy, args.seed)
+    before = sensor_frame(pd.DataFrame(rows), compact=False)
+    after = readings_frame(rows)
+    print(f"{len(rows)} sensor documents ({args.legacy:.0%} legacy), differing columns against the "
+          f"compact sensor_frame: {', '.join(compare(sensor_frame(pd.DataFrame(rows)), after)) or 'none'}")
+    report('sensors', before, after, args.rounds)
+
+    rows = alert_documents(args.alerts, args.seed)
+    print(f"{len(rows)} alert documents")
+    report('alerts', plain_alert_frame(rows), alert_frame(rows), args.rounds)
+
+
+if __name__ == "__main__":
+    main()
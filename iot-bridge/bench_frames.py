@@ -0,0 +1,88 @@
+# bench_frames.py
+# Time to build the dashboard's sensor frame from sensor_readings documents: the
+# pd.DataFrame(rows) + sensor_frame conversion versus the single-pass readings_frame
+# (frames.py), for documents of the bench_bridge_load.py fleet.
+#   python bench_frames.py --rows 1000 10000 100000
+import argparse
+import json
+import time
+import warnings
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pandas as pd
+
+from bench_bridge_load import TOPIC_SENSOR_DATA, generate
+from dedup import message_id
+from frames import readings_frame, sensor_frame
+from schema import normalize_reading
+
+
+def documents(count, legacy, seed):
+    """count sensor_readings documents as the dashboard gets them, `legacy` of them pre-version 2"""
+    fleet = SimpleNamespace(devices=100, duration=count * 5.0 / 100 + 5, publish_interval=5.0,
+                            read_interval=2.0, heartbeat_interval=60.0, polluted=0.1, seed=seed)
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for at, topic, payload in generate(fleet):
+        if topic != TOPIC_SENSOR_DATA:
+            continue
+        data = json.loads(payload)
+        received = base + timedelta(seconds=at)
+        if len(rows) < count * legacy:
+            row = {**data, 'received_at': received.astimezone().replace(tzinfo=None).isoformat(),
+                   'topic': TOPIC_SENSOR_DATA}
+        else:
+            row = normalize_reading(data, received)
+        row['id'] = message_id(data, payload)
+        rows.append(row)
+        if len(rows) == count:
+            break
+    return rows
+
+
+def best_seconds(build, rows, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        build(rows)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def compare(expected, actual):
+    """Columns of expected whose values differ in actual (rows matched by id)"""
+    expected = expected.sort_values('id').reset_index(drop=True)
+    actual = actual.sort_values('id').reset_index(drop=True)
+    differ = []
+    # Missing values are NaN on one side and None on the other in object columns
+    warnings.simplefilter('ignore', FutureWarning)
+    for column in expected.columns:
+        try:
+            pd.testing.assert_series_equal(expected[column], actual[column], check_dtype=False,
+                                           check_names=False)
+        except (AssertionError, KeyError, TypeError):
+            differ.append(column)
+    return differ
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sensor frame construction time")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--legacy', type=float, default=0.0, help="share of pre-schema_version 2 documents")
+    parser.add_argument('--rounds', type=int, default=3, help="timing runs, the best one counts")
+    parser.add_argument('--seed', type=int, default=357)
+    args = parser.parse_args()
+
+    for count in args.rows:
+        rows = documents(count, args.legacy, args.seed)
+        before = best_seconds(lambda r: sensor_frame(pd.DataFrame(r)), rows, args.rounds)
+        after = best_seconds(readings_frame, rows, args.rounds)
+        differ = compare(sensor_frame(pd.DataFrame(rows)), readings_frame(rows))
+        print(f"{len(rows):7d} documents: DataFrame + sensor_frame {before * 1000:8.1f} ms, "
+              f"readings_frame {after * 1000:8.1f} ms ({before / after:4.1f}x), "
+              f"differing columns: {', '.join(differ) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
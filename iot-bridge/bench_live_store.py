@@ -0,0 +1,122 @@
+# bench_live_store.py
+# Firestore reads and data age of the dashboard's polling loaders (st.cache_data TTLs
+# of streamlit_app.py) versus the snapshot listeners of live_store.py, while the
+# bench_bridge_load.py fleet keeps writing and --sessions open tabs rerun the page
+# every --rerun seconds.
+#   python bench_live_store.py --devices 10 --duration 900 --sessions 5 --rerun 30
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from bench_bridge_load import TOPIC_ALERTS, TOPIC_HEARTBEAT, TOPIC_SENSOR_DATA, generate
+from dedup import message_id
+from fake_firestore import FakeFirestore
+from frames import alert_frame, readings_frame
+from live_store import LiveStore
+from schema import normalize_reading
+
+# (loader, arguments, cache TTL) called by one rerun of the dashboard page and sidebar
+PAGE_LOADS = (
+    ('sensors', 500, 60), ('alerts', 100, 30), ('devices', None, 60),
+    ('sensors', 100, 60), ('alerts', 100, 30), ('devices', None, 60),
+)
+
+
+def poll(db, loader, limit):
+    if loader == 'sensors':
+        query = db.collection('sensor_readings').order_by('received_at', direction='DESCENDING').limit(limit)
+    elif loader == 'alerts':
+        query = db.collection('alerts').where('alert_status', '==', 'active') \
+            .order_by('received_at', direction='DESCENDING').limit(limit)
+    else:
+        query = db.collection('device_heartbeats')
+    return list(query.stream())
+
+
+def write(db, topic, payload, received):
+    data = json.loads(payload)
+    if topic == TOPIC_SENSOR_DATA:
+        db.collection('sensor_readings').document(message_id(data, payload)).set(normalize_reading(data, received))
+    elif topic == TOPIC_ALERTS:
+        db.collection('alerts').document(message_id(data, payload)).set(
+            {**data, 'received_at': received.isoformat(), 'alert_status': 'active', 'acknowledged': False})
+    elif topic == TOPIC_HEARTBEAT:
+        db.collection('device_heartbeats').document(data['device_id']).set(
+            {**data, 'received_at': received.isoformat()})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Polling versus listener dashboard loads")
+    parser.add_argument('--devices', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=900, help="simulated seconds")
+    parser.add_argument('--publish-interval', type=float, default=5.0)
+    parser.add_argument('--read-interval', type=float, default=2.0)
+    parser.add_argument('--heartbeat-interval', type=float, default=60.0)
+    parser.add_argument('--polluted', type=float, default=0.1)
+    parser.add_argument('--sessions', type=int, default=5, help="open dashboard tabs")
+    parser.add_argument('--rerun', type=float, default=30.0, help="auto-refresh interval of each tab (s)")
+    parser.add_argument('--seed', type=int, default=357)
+    args = parser.parse_args()
+
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    polled = FakeFirestore()
+    listened = FakeFirestore()
+    store = LiveStore(listened, readings_frame, alert_frame)
+    initial_reads = listened.reads
+
+    cache = {}  # (loader, limit) -> simulated time the entry was filled
+    poll_ages, live_ages = [], []
+    delivery = []
+    reruns = 0
+    newest_write = None
+
+    # Tabs rerun in turn, spread over the interval
+    next_rerun = [args.rerun * (i + 1) / args.sessions for i in range(args.sessions)]
+    for at, topic, payload in generate(args):
+        while min(next_rerun) <= at:
+            session = next_rerun.index(min(next_rerun))
+            now = next_rerun[session]
+            for loader, limit, ttl in PAGE_LOADS:
+                filled = cache.get((loader, limit))
+                if filled is None or now - filled >= ttl:
+                    poll(polled, loader, limit)
+                    cache[(loader, limit)] = filled = now
+                if loader == 'sensors' and newest_write is not None:
+                    # The cache shows what had been written when it was filled
+                    poll_ages.append(now - filled if filled < newest_write else 0.0)
+            frame = store.sensors.frame()
+            if newest_write is not None and not frame.empty:
+                shown = frame['received_at'].iloc[0]
+                live_ages.append(max(0.0, (base + timedelta(seconds=newest_write) - shown).total_seconds()))
+            store.active_alerts.frame()
+            store.heartbeats.frame()
+            reruns += 1
+            next_rerun[session] += args.rerun
+
+        received = base + timedelta(seconds=at)
+        write(polled, topic, payload, received)
+        version = store.sensors.version
+        started = time.perf_counter()
+        write(listened, topic, payload, received)
+        if topic == TOPIC_SENSOR_DATA:
+            store.sensors.wait(version, timeout=1.0)
+            delivery.append(time.perf_counter() - started)
+            newest_write = at
+    store.close()
+
+    hours = args.duration / 3600
+    print(f"{args.devices} devices, {len(polled.docs)} documents written over {args.duration:.0f}s, "
+          f"{args.sessions} tabs rerunning every {args.rerun:g}s ({reruns} reruns)")
+    print(f"polling   : {polled.reads / hours:8.0f} reads/hour, sensor data on screen "
+          f"{sum(poll_ages) / len(poll_ages):5.1f}s old on average, {max(poll_ages):5.1f}s at most")
+    print(f"listeners : {listened.reads / hours:8.0f} reads/hour ({initial_reads} for the first snapshots), "
+          f"sensor data on screen {sum(live_ages) / max(1, len(live_ages)):5.1f}s old on average, "
+          f"{max(live_ages, default=0.0):5.1f}s at most")
+    delivery.sort()
+    print(f"listener delivery: p50 {delivery[len(delivery) // 2] * 1000:.2f} ms, "
+          f"p99 {delivery[int(len(delivery) * 0.99)] * 1000:.2f} ms from write to table (in process)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# bench_payload_codec.py
+# Bytes per reading and bridge decode time of the JSON sensor payload versus the
+# MessagePack one (PAYLOAD_MSGPACK in arduino.cpp, payload_codec.py), for readings of
+# the bench_bridge_load.py fleet.
+#   python bench_payload_codec.py --messages 20000
+import argparse
+import json
+import time
+from types import SimpleNamespace
+
+from bench_bridge_load import TOPIC_SENSOR_DATA, generate
+from payload_codec import encode_payload, parse_payload
+from topic_router import parse_json
+
+
+def publish_bytes(payload):
+    """Size of the QoS 1 MQTT PUBLISH packet carrying payload"""
+    remaining = 2 + len(TOPIC_SENSOR_DATA) + 2 + len(payload)
+    length_bytes = 1 if remaining < 128 else 2 if remaining < 16384 else 3
+    return 1 + length_bytes + remaining
+
+
+def per_message_us(parse, payloads, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for payload in payloads:
+            parse(payload)
+        best = min(best, time.perf_counter() - started)
+    return best / len(payloads) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON versus MessagePack sensor payloads")
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=5, help="timing runs, the best one counts")
+    parser.add_argument('--seed', type=int, default=357)
+    args = parser.parse_args()
+
+    fleet = SimpleNamespace(devices=100, duration=args.messages * 5.0 / 100, publish_interval=5.0,
+                            read_interval=2.0, heartbeat_interval=60.0, polluted=0.1, seed=args.seed)
+    json_payloads = [payload for _, topic, payload in generate(fleet) if topic == TOPIC_SENSOR_DATA]
+    json_payloads = json_payloads[:args.messages]
+    msgpack_payloads = [encode_payload(json.loads(payload)) for payload in json_payloads]
+
+    # Both decode to the same document (the scaled fields were rounded to 2 places)
+    mismatched = sum(parse_json(j) != parse_payload(m) for j, m in zip(json_payloads, msgpack_payloads))
+
+    count = len(json_payloads)
+    print(f"{count} sensor readings, {mismatched} decoded differently")
+    rows = (
+        ('JSON', json_payloads, parse_json),
+        ('JSON (auto-detect)', json_payloads, parse_payload),
+        ('MessagePack', msgpack_payloads, parse_payload),
+    )
+    for name, payloads, parse in rows:
+        size = sum(len(p) for p in payloads) / count
+        packet = sum(publish_bytes(p) for p in payloads) / count
+        decode = per_message_us(parse, payloads, args.rounds)
+        print(f"{name:19s}: {size:6.1f} payload bytes, {packet:6.1f} bytes per MQTT publish, "
+              f"{decode:5.2f} us to decode")
+
+
+if __name__ == "__main__":
+    main()
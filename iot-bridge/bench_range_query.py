@@ -0,0 +1,59 @@
+# bench_range_query.py
+# Reads and completeness of the Analytics page's date-range load: the newest 1000
+# sensor_readings filtered in pandas (before range_query.py) versus range filters sent
+# to Firestore and paged with cursors, for ranges ending today.
+#   python bench_range_query.py --devices 5 --interval 300 --days 8 --ranges 1 3 7
+import argparse
+from datetime import date, timedelta, timezone
+
+from fake_firestore import FakeFirestore
+from range_query import day_bounds, stream_range
+
+NEWEST_LIMIT = 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Newest-N versus range-filtered Analytics loads")
+    parser.add_argument('--devices', type=int, default=5)
+    parser.add_argument('--interval', type=float, default=300.0, help="seconds between a device's readings")
+    parser.add_argument('--days', type=int, default=8, help="days of stored readings")
+    parser.add_argument('--ranges', type=int, nargs='+', default=[1, 3, 7], help="range lengths in days")
+    parser.add_argument('--page-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    db = FakeFirestore()
+    collection = db.collection('sensor_readings')
+    today = date(2026, 1, 31)
+    _, now = day_bounds(today, today)
+    now = now.astimezone(timezone.utc)
+    at = now - timedelta(days=args.days)
+    received = []
+    while at < now:
+        for device in range(args.devices):
+            collection.document(f"d{device}_{at.timestamp():.0f}").set(
+                {'device_id': f"d{device}", 'received_at': at, 'schema_version': 2})
+            received.append(at)
+        at += timedelta(seconds=args.interval)
+    print(f"{len(received)} readings over {args.days} days ({args.devices} devices, one per {args.interval:g}s each)")
+
+    for days in args.ranges:
+        start_date = today - timedelta(days=days - 1)
+        start, end = day_bounds(start_date, today)
+        start, end = start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+        expected = sum(start <= t < end for t in received)
+
+        before = db.reads
+        newest = collection.order_by('received_at', direction='DESCENDING').limit(NEWEST_LIMIT).stream()
+        found = sum(start <= doc.to_dict()['received_at'] < end for doc in newest)
+        newest_reads = db.reads - before
+
+        before, trips = db.reads, db.round_trips
+        ranged = sum(1 for _ in stream_range(collection, start, end, page_size=args.page_size))
+        range_reads, pages = db.reads - before, db.round_trips - trips
+
+        print(f"{days} day(s), {expected} readings: newest {NEWEST_LIMIT} found {found:6d} with {newest_reads:6d} reads; "
+              f"range found {ranged:6d} with {range_reads:6d} reads in {pages} page(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# bench_sensor_buckets.py
+# Firestore cost of the two sensor reading layouts for the bench_bridge_load.py fleet:
+# one sensor_readings document per reading versus sensor_buckets (one document per
+# device per window with columnar arrays). Counts document writes, the document reads
+# for the dashboard's newest-N load, and approximate stored bytes.
+#   python bench_sensor_buckets.py --devices 100 --duration 3600 --window 300
+import argparse
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from bench_bridge_load import TOPIC_SENSOR_DATA, generate
+from dedup import message_id
+from fake_firestore import FakeFirestore
+from firestore_writer import BatchWriter
+from schema import normalize_reading
+from sensor_buckets import SensorBuckets, bucket_columns, recent_buckets
+
+
+def stored_bytes(value):
+    """Approximate Firestore storage size of a value (per the documented size rules)"""
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode('utf-8')) + 1
+    if isinstance(value, list):
+        return sum(stored_bytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(len(k) + 1 + stored_bytes(v) for k, v in value.items())
+    return 8
+
+
+def collection_bytes(db, collection):
+    prefix = collection + '/'
+    # Document name plus fields plus the 32 bytes of per-document overhead
+    return sum(len(path) + 1 + stored_bytes(data) + 32 for path, data in db.docs.items() if path.startswith(prefix))
+
+
+def readings(args, base):
+    for at, topic, payload in generate(args):
+        if topic == TOPIC_SENSOR_DATA:
+            data = json.loads(payload)
+            yield base + timedelta(seconds=at), normalize_reading(data, base + timedelta(seconds=at)), \
+                message_id(data, payload)
+
+
+def run_documents(args, base):
+    db = FakeFirestore()
+    writer = BatchWriter(db)
+    count = 0
+    for _, reading, msg_id in readings(args, base):
+        writer.set(db.collection('sensor_readings').document(msg_id), reading)
+        count += 1
+    writer.flush()
+    writes = db.writes
+
+    started = time.perf_counter()
+    docs = list(db.collection('sensor_readings').order_by('received_at', direction='DESCENDING')
+                .limit(args.load).stream())
+    rows = len([doc.to_dict() for doc in docs])
+    return {'readings': count, 'writes': writes, 'reads': db.reads, 'rows': rows,
+            'load_s': time.perf_counter() - started, 'bytes': collection_bytes(db, 'sensor_readings')}
+
+
+def run_buckets(args, base):
+    db = FakeFirestore()
+    writer = BatchWriter(db)
+    buckets = SensorBuckets(db, writer, window=args.window, flush_interval=args.flush_interval)
+    buckets.started = base
+    count = 0
+    next_tick = base
+    for now, reading, msg_id in readings(args, base):
+        if now >= next_tick:
+            buckets.flush(now=now)
+            next_tick = now + timedelta(seconds=1)
+        buckets.add(reading, msg_id)
+        count += 1
+    buckets.flush(force=True)
+    writer.flush()
+    writes = db.writes
+
+    started = time.perf_counter()
+    columns = bucket_columns(snapshot.to_dict() for snapshot in recent_buckets(db, args.load))
+    return {'readings': count, 'writes': writes, 'reads': db.reads, 'rows': len(columns['ids']),
+            'load_s': time.perf_counter() - started, 'bytes': collection_bytes(db, 'sensor_buckets')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sensor_readings documents versus sensor_buckets")
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=3600, help="simulated seconds")
+    parser.add_argument('--publish-interval', type=float, default=5.0)
+    parser.add_argument('--read-interval', type=float, default=2.0)
+    parser.add_argument('--heartbeat-interval', type=float, default=60.0)
+    parser.add_argument('--polluted', type=float, default=0.1)
+    parser.add_argument('--window', type=int, default=300, help="SENSOR_BUCKET_SECONDS")
+    parser.add_argument('--flush-interval', type=float, default=1e9,
+                        help="SENSOR_BUCKET_FLUSH_INTERVAL (default: write when the window closes only)")
+    parser.add_argument('--load', type=int, default=1000, help="readings the dashboard loads")
+    parser.add_argument('--seed', type=int, default=357)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    docs = run_documents(args, base)
+    buckets = run_buckets(args, base)
+    print(f"{docs['readings']} readings from {args.devices} devices over {args.duration:.0f}s, "
+          f"one every {args.publish_interval:g}s, {args.window}s buckets")
+    for name, r in (('documents', docs), ('buckets', buckets)):
+        print(f"{name:9s}: {r['writes']:7d} document writes, {r['reads']:5d} reads to load {r['rows']} readings "
+              f"({r['load_s'] * 1000:.0f} ms), ~{r['bytes'] / 1024:.0f} KiB stored")
+    print(f"Cut: {docs['writes'] / buckets['writes']:.0f}x writes, {docs['reads'] / buckets['reads']:.0f}x reads, "
+          f"{docs['bytes'] / buckets['bytes']:.1f}x storage")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# bench_sensor_store.py
+# Firestore reads of the dashboard's sensor data refreshes: re-querying the newest
+# `limit` sensor_readings every time (get_sensor_data before sensor_store.py) versus the
+# incremental SensorStore, while the bench_bridge_load.py fleet keeps writing.
+#   python bench_sensor_store.py --devices 10 --duration 3600 --refresh 60 --limit 1000
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from bench_bridge_load import TOPIC_SENSOR_DATA, generate
+from dedup import message_id
+from fake_firestore import FakeFirestore
+from frames import readings_frame
+from schema import normalize_reading
+from sensor_store import SensorStore
+
+
+def full_load(db, limit):
+    docs = db.collection('sensor_readings').order_by('received_at', direction='DESCENDING').limit(limit).stream()
+    return [doc.id for doc in docs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full versus incremental dashboard sensor loads")
+    parser.add_argument('--devices', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=3600, help="simulated seconds")
+    parser.add_argument('--publish-interval', type=float, default=5.0)
+    parser.add_argument('--read-interval', type=float, default=2.0)
+    parser.add_argument('--heartbeat-interval', type=float, default=60.0)
+    parser.add_argument('--polluted', type=float, default=0.1)
+    parser.add_argument('--refresh', type=float, default=60.0, help="get_sensor_data cache TTL (s)")
+    parser.add_argument('--limit', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=357)
+    args = parser.parse_args()
+
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    db = FakeFirestore()
+    store = SensorStore(db, readings_frame)
+    full_reads = store_reads = refreshes = mismatches = 0
+    full_seconds = store_seconds = 0.0
+
+    next_refresh = args.refresh
+    for at, topic, payload in generate(args):
+        while at >= next_refresh:
+            before = db.reads
+            started = time.perf_counter()
+            expected = full_load(db, args.limit)
+            full_seconds += time.perf_counter() - started
+            full_reads += db.reads - before
+
+            before = db.reads
+            started = time.perf_counter()
+            frame = store.frame(args.limit)
+            store_seconds += time.perf_counter() - started
+            store_reads += db.reads - before
+            mismatches += list(frame['id']) != expected
+            refreshes += 1
+            next_refresh += args.refresh
+        if topic == TOPIC_SENSOR_DATA:
+            data = json.loads(payload)
+            db.collection('sensor_readings').document(message_id(data, payload)).set(
+                normalize_reading(data, base + timedelta(seconds=at)))
+
+    readings = len(db.docs)
+    print(f"{args.devices} devices, {readings} readings over {args.duration:.0f}s, "
+          f"{refreshes} refreshes of the newest {args.limit}")
+    print(f"full        : {full_reads / refreshes:7.1f} reads per refresh, {full_seconds / refreshes * 1000:6.1f} ms")
+    print(f"incremental : {store_reads / refreshes:7.1f} reads per refresh, {store_seconds / refreshes * 1000:6.1f} ms "
+          f"(first refresh included), {mismatches} refreshes differed from the full load")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# bench_spool_replay.py
+# Simulate a Firestore outage, then measure how fast the spool replayer catches up.
+#   python bench_spool_replay.py --devices 30 --interval 5 --outage 3600
+import argparse
+import json
+import logging
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+from fake_firestore import FakeFirestore
+from firestore_writer import BatchWriter, Coalescer
+from spool import Spool, SpoolReplayer, FSYNC_POLICIES
+
+
+def sensor_payload(device_id, millis):
+    return json.dumps({
+        "device_id": device_id, "device_type": "ESP32-S2", "location": "Living Room",
+        "timestamp": millis, "uptime_seconds": millis // 1000,
+        "sensors": {
+            "air_quality_ppm": 120, "water_leak": False, "motion": False,
+            "light_level": 2100, "temperature_c": 25.4,
+            "humidity_percent": 61.2, "battery_percent": 88.0
+        },
+        "system": {"wifi_connected": True, "mqtt_connected": True, "rssi": -61,
+                   "publish_count": millis // 5000, "error_count": 0}
+    }).encode('utf-8')
+
+
+def heartbeat_payload(device_id, millis):
+    return json.dumps({
+        "device_id": device_id, "timestamp": millis, "uptime_minutes": millis // 60000,
+        "free_heap": 180000, "wifi_rssi": -61, "publish_count": millis // 5000
+    }).encode('utf-8')
+
+
+def make_handler(db, writer, coalescer):
+    # Same writes as process_message in mqtt_firebase_bridge.py
+    def handle(topic, payload, token=None, received=None):
+        tokens = (token,) if token is not None else ()
+        data = json.loads(payload)
+        data['received_at'] = (received or datetime.now()).isoformat()
+        device_id = data['device_id']
+        if topic == "home/sensors/data":
+            writer.set(db.collection('sensor_readings').document(f"{device_id}_{data['timestamp']}"), data,
+                       tokens=tokens)
+            coalescer.set(db.collection('devices_latest').document(device_id), {
+                'last_reading': data, 'last_updated': data['received_at']
+            })
+        else:
+            coalescer.set(db.collection('device_heartbeats').document(device_id), data, tokens=tokens)
+    return handle
+
+
+def outage_messages(devices, interval, heartbeat_interval, outage):
+    for t in range(0, outage * 1000, 1000):
+        for d in range(devices):
+            device_id = f"esp32_{d:03d}"
+            if t % (interval * 1000) == 0:
+                yield "home/sensors/data", sensor_payload(device_id, t)
+            if t % (heartbeat_interval * 1000) == 0:
+                yield "home/heartbeat", heartbeat_payload(device_id, t)
+
+
+def run(args, fsync):
+    directory = tempfile.mkdtemp(prefix="spool-bench-")
+    try:
+        spool = Spool(directory, segment_bytes=args.segment_mb * 1024 * 1024, fsync=fsync)
+        db = FakeFirestore(latency=args.latency)
+        writer = BatchWriter(db, on_commit=spool.done, on_error=spool.failed)
+        coalescer = Coalescer(writer, interval=15.0)
+        handler = make_handler(db, writer, coalescer)
+        replayer = SpoolReplayer(spool, handler, writer, coalescer, batch_records=args.batch)
+
+        # Outage: the first live commit fails and everything after it is only spooled
+        db.available = False
+        started = time.perf_counter()
+        count = 0
+        for topic, payload in outage_messages(args.devices, args.interval, args.heartbeat, args.outage):
+            seq, live = spool.append(topic, payload)
+            if live:
+                handler(topic, payload, seq)
+                writer.flush()
+            count += 1
+        spool.sync()
+        append_elapsed = time.perf_counter() - started
+
+        # Backend recovers: drain the backlog
+        db.available = True
+        before = spool.stats()
+        backlog = before['backlog']
+        started = time.perf_counter()
+        while spool.replay_from is not None:
+            if not replayer.replay_batch():
+                raise RuntimeError("replay failed with the backend available")
+        replay_elapsed = time.perf_counter() - started
+        spool.maintain()
+
+        spool.close()
+        return {
+            'fsync': fsync,
+            'messages': count,
+            'spool_mb': before['bytes'] / 1024 / 1024,
+            'append_per_s': count / append_elapsed,
+            'backlog': backlog,
+            'replay_s': replay_elapsed,
+            'replay_per_s': backlog / replay_elapsed,
+            'commits': db.round_trips,
+            'writes': db.writes,
+        }
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spool replay catch-up benchmark")
+    parser.add_argument('--devices', type=int, default=30)
+    parser.add_argument('--interval', type=int, default=5, help="sensor publish interval (s)")
+    parser.add_argument('--heartbeat', type=int, default=30, help="heartbeat interval (s)")
+    parser.add_argument('--outage', type=int, default=3600, help="outage length (s)")
+    parser.add_argument('--latency', type=float, default=0.05, help="simulated Firestore round trip (s)")
+    parser.add_argument('--batch', type=int, default=400, help="records per replay batch")
+    parser.add_argument('--segment-mb', type=int, default=16)
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, nargs='+', default=["interval"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    print(f"{'fsync':<9} {'messages':>9} {'spool MB':>9} {'append/s':>10} "
+          f"{'replay s':>9} {'replay msg/s':>13} {'commits':>8} {'writes':>8}")
+    for fsync in args.fsync:
+        r = run(args, fsync)
+        print(f"{r['fsync']:<9} {r['messages']:>9} {r['spool_mb']:>9.1f} {r['append_per_s']:>10.0f} "
+              f"{r['replay_s']:>9.2f} {r['replay_per_s']:>13.0f} {r['commits']:>8} {r['writes']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# bench_write_layout.py
+# Index hotspots of the sensor reading layouts at growing fleet sizes. Readings from the
+# bench_bridge_load.py fleet are written into a FakeFirestore through the bridge's
+# BatchWriter, once per layout:
+#   documents             one sensor_readings collection, every field indexed (the default)
+#   documents+exemptions  the same with firestore.indexes.json applied
+#   devices+exemptions    SENSOR_STORAGE = "devices": sensor_readings per device
+# and then the writes are laid onto a model of Firestore's index key ranges: the first
+# --history seconds of readings are the stored data, split into ranges of --split-entries
+# index entries, and the next --window seconds of writes are counted per range. A range
+# takes about CAPACITY writes/s; more than that is throttled however Firestore splits,
+# when the writes all land after the newest key.
+#   python bench_write_layout.py --devices 100 1000 5000 10000
+import argparse
+import json
+import logging
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import schema
+from bench_bridge_load import TOPIC_SENSOR_DATA, generate
+from dedup import message_id
+from fake_firestore import FakeFirestore
+from firestore_indexes import QUERIED_FIELDS
+from firestore_writer import BatchWriter
+from schema import normalize_reading, reading_collection
+
+# Sustained writes/s into one key range of an index (Firestore's guidance for
+# sequential keys: 500 writes/s)
+CAPACITY = 500
+
+LAYOUTS = {
+    'documents': ("documents", False),
+    'documents+exemptions': ("documents", True),
+    'devices+exemptions': ("devices", True),
+}
+
+
+def sortable(value):
+    if isinstance(value, datetime):
+        return (0, value.timestamp())
+    if isinstance(value, (bool, int, float)):
+        return (0, float(value))
+    return (1, str(value))
+
+
+def write_readings(readings, storage):
+    db = FakeFirestore()
+    writer = BatchWriter(db)
+    saved = schema.SENSOR_STORAGE
+    schema.SENSOR_STORAGE = storage
+    try:
+        for reading, msg_id in readings:
+            writer.set(reading_collection(db, 'sensor_readings', reading['device_id']).document(msg_id), reading)
+        writer.flush()
+    finally:
+        schema.SENSOR_STORAGE = saved
+    return db
+
+
+def index_load(db, exemptions, cutoff, args):
+    """(index entries per write, hottest range writes/s, hottest index) for the writes after cutoff"""
+    docs = [(path, data, data['received_at'] >= cutoff) for path, data in db.docs.items()]
+    fields = sorted({field for _, data, _ in docs for field in data})
+    if exemptions:
+        fields = [field for field in fields if field in QUERIED_FIELDS['sensor_readings']]
+
+    # Every document is an entry of the document name index and, per indexed field, of
+    # an ascending and a descending single-field index with collection scope
+    indexes = [('__name__', lambda path, data: path)]
+    indexes += [(field, lambda path, data, field=field: (path.rsplit('/', 1)[0], sortable(data[field]), path))
+                for field in fields]
+    writes = sum(new for _, _, new in docs)
+    entries = 0
+    hottest, hottest_index = 0.0, None
+    for name, key in indexes:
+        indexed = [(key(path, data), new) for path, data, new in docs if name == '__name__' or name in data]
+        boundaries = sorted(k for k, new in indexed if not new)[::args.split_entries][1:]
+        ranges = Counter(bisect_right(boundaries, k) for k, new in indexed if new)
+        directions = 1 if name == '__name__' else 2
+        entries += sum(ranges.values()) * directions
+        load = max(ranges.values(), default=0) / args.window
+        if load > hottest:
+            hottest, hottest_index = load, name
+    return entries / writes if writes else 0.0, hottest, hottest_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index hotspots of the sensor reading layouts")
+    parser.add_argument('--devices', type=int, nargs='+', default=[100, 1000, 5000, 10000])
+    parser.add_argument('--publish-interval', type=float, default=5.0)
+    parser.add_argument('--read-interval', type=float, default=2.0)
+    parser.add_argument('--heartbeat-interval', type=float, default=60.0)
+    parser.add_argument('--polluted', type=float, default=0.1)
+    parser.add_argument('--history', type=float, default=30.0, help="simulated seconds of stored readings")
+    parser.add_argument('--window', type=float, default=10.0, help="simulated seconds of measured writes")
+    parser.add_argument('--split-entries', type=int, default=1000, help="stored index entries per key range")
+    parser.add_argument('--seed', type=int, default=357)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    cutoff = base + timedelta(seconds=args.history)
+    print(f"Key ranges of {args.split_entries} index entries, {CAPACITY} writes/s each; "
+          f"one reading per device every {args.publish_interval:g}s")
+    fleet_sizes = args.devices
+    for devices in fleet_sizes:
+        args.devices = devices
+        args.duration = args.history + args.window
+        readings = []
+        for at, topic, payload in generate(args):
+            if topic == TOPIC_SENSOR_DATA:
+                data = json.loads(payload)
+                readings.append((normalize_reading(data, base + timedelta(seconds=at)), message_id(data, payload)))
+        offered = devices / args.publish_interval
+
+        print(f"{devices} devices, {offered:.0f} readings/s:")
+        for name, (storage, exemptions) in LAYOUTS.items():
+            db = write_readings(readings, storage)
+            per_write, hottest, index = index_load(db, exemptions, cutoff, args)
+            sustained = offered if hottest <= CAPACITY else offered * CAPACITY / hottest
+            print(f"  {name:21s}: {per_write:5.1f} index entries per write, hottest range "
+                  f"{hottest:6.0f} writes/s ({index}), sustains {sustained:6.0f} readings/s")
+
+
+if __name__ == "__main__":
+    main()
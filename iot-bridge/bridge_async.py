@@ -0,0 +1,223 @@
+# bridge_async.py
+# asyncio entry point for the bridge: aiomqtt for MQTT (pip install aiomqtt) and
+# Firestore's AsyncClient for writes.
+#   python bridge_async.py
+# The message handling (routes, dedup, rollups, alert rules and episodes, coalescing,
+# spool and replay) is the same as mqtt_firebase_bridge.py. What changes is how it is
+# driven: the paho thread and the ingest worker threads become tasks on one event loop,
+# and Firestore commits are coroutines instead of a thread blocked per commit, so
+# thousands of writes can be in flight from one process.
+import asyncio
+import logging
+import signal
+import ssl
+import time
+
+import aiomqtt
+from firebase_admin import firestore_async
+
+import metrics
+import mqtt_firebase_bridge as bridge
+from firestore_writer import AsyncBatchWriter
+
+logger = logging.getLogger(__name__)
+
+# At most ASYNC_MAX_INFLIGHT batch commits awaiting Firestore at once
+ASYNC_MAX_INFLIGHT = 1000
+# Messages spooled but not yet parsed; the MQTT reader waits when this many are queued
+ASYNC_QUEUE_MAXSIZE = 10000
+# Let the commit tasks run at least every ASYNC_YIELD_EVERY parsed messages
+ASYNC_YIELD_EVERY = 100
+RECONNECT_INTERVAL = 5.0
+
+
+def paho_client(client):
+    """The paho client under an aiomqtt Client.
+
+    aiomqtt acks QoS 1 messages as soon as they arrive and has no public API
+    for manual acks, so the bridge switches them on and acks through paho.
+    This relies on aiomqtt's private _client attribute: aiomqtt is pinned in
+    requirements.txt, check this again when upgrading it.
+    """
+    return client._client
+
+
+class AsyncPipeline:
+    """Stages of the asyncio bridge.
+
+    accept() spools a message and queues it; one task then parses,
+    validates and persists messages in arrival order, handing writes to the
+    AsyncBatchWriter, whose commit tasks are the last stage. A full queue
+    makes accept() wait, which pushes back on the MQTT reader.
+    """
+
+    def __init__(self, maxsize=ASYNC_QUEUE_MAXSIZE):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self._task = None
+        self.processed = 0
+
+    async def accept(self, topic, payload, on_durable=None):
+        bridge.MESSAGES.inc(bridge.router.route(topic).name)
+        seq, live = bridge.spool.append(topic, payload, on_durable=on_durable)
+        if live:
+            await self.queue.put((topic, payload, seq))
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            topic, payload, seq = await self.queue.get()
+            bridge.process_message(topic, payload, seq)
+            self.queue.task_done()
+            self.processed += 1
+            if self.processed % ASYNC_YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+
+    async def stop(self):
+        """Finish the messages already queued, then stop"""
+        await self.queue.join()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self):
+        return {'depth': self.queue.qsize(), 'processed': self.processed}
+
+
+def setup(db, spool_dir=None, spill_dir=None):
+    """Build the bridge pipeline on an async Firestore client"""
+    bridge.setup(db, spool_dir=spool_dir, spill_dir=spill_dir,
+                 writer_class=lambda *args, **kwargs: AsyncBatchWriter(*args, max_inflight=ASYNC_MAX_INFLIGHT,
+                                                                       **kwargs))
+    metrics.Gauge('bridge_writer_inflight', "Batch commits awaiting Firestore",
+                  fn=lambda: bridge.writer.inflight)
+    pipeline = AsyncPipeline()
+    metrics.Gauge('bridge_async_queue_depth', "Spooled messages waiting to be parsed",
+                  fn=pipeline.queue.qsize)
+    return pipeline
+
+
+def start(pipeline):
+    """Start the writer and parse stage on the running loop, and the helper threads"""
+    bridge.writer.start()
+    pipeline.start()
+    bridge.coalescer.start()
+    bridge.rollups.start()
+    bridge.episodes.start()
+    if bridge.buckets is not None:
+        bridge.buckets.start()
+    bridge.replayer.start()
+
+
+async def stop(pipeline):
+    """Drain every stage and close the spool"""
+    await pipeline.stop()
+    # These threads may be waiting on the loop (the replayer flushes through the
+    # writer), so they are joined from a worker thread rather than on the loop. The
+    # rollups go last, so they count the readings the others still wrote.
+    for component in (bridge.replayer, bridge.coalescer, bridge.episodes, bridge.buckets, bridge.rollups):
+        if component is not None:
+            await asyncio.to_thread(component.stop)
+    await bridge.writer.stop()
+    bridge.spool.close()
+
+
+async def drain(pipeline, deadline=None):
+    """Stop within `deadline` seconds (SHUTDOWN_DEADLINE) and report what was flushed or left in the spool"""
+    deadline = bridge.SHUTDOWN_DEADLINE if deadline is None else deadline
+    before = bridge.drain_snapshot(pipeline.queue.qsize())
+    started = time.monotonic()
+    try:
+        await asyncio.wait_for(stop(pipeline), deadline)
+        completed = True
+    except asyncio.TimeoutError:
+        logger.error(f"❌ Pipeline did not drain within {deadline:.0f}s")
+        bridge.spool.sync()
+        completed = False
+    return bridge.drain_summary(before, completed, time.monotonic() - started)
+
+
+def create_client():
+    tls_context = None
+    if bridge.MQTT_TLS:
+        tls_context = ssl.SSLContext(ssl.PROTOCOL_TLSv1_2)
+        tls_context.check_hostname = False  # For development/testing
+        tls_context.verify_mode = ssl.CERT_NONE
+    client = aiomqtt.Client(bridge.MQTT_BROKER, bridge.MQTT_PORT, username=bridge.MQTT_USER,
+                            password=bridge.MQTT_PASSWORD, identifier=bridge.MQTT_CLIENT_ID,
+                            clean_session=bridge.MQTT_CLEAN_SESSION, tls_context=tls_context)
+    # aiomqtt acks QoS 1 as soon as a message arrives; ack from the spool instead,
+    # like the threaded bridge does, so the broker redelivers anything not on disk
+    paho_client(client).manual_ack_set(True)
+    return client
+
+
+async def consume(client, pipeline):
+    loop = asyncio.get_running_loop()
+    paho = paho_client(client)
+
+    async with client:
+        logger.info("✅ Connected to MQTT broker")
+        if bridge.CONNECTS.value():
+            bridge.RECONNECTS.inc()
+        bridge.CONNECTS.inc()
+        bridge.CONNECTED.set(1)
+        for pattern in bridge.router.patterns():
+            await client.subscribe(pattern, qos=bridge.MQTT_QOS)
+            logger.info(f"   Subscribed to: {pattern} (QoS {bridge.MQTT_QOS})")
+
+        async for message in client.messages:
+            on_durable = None
+            if message.qos > 0:
+                # The spool may call this from its fsync thread; paho must only be used on the loop
+                on_durable = (lambda mid=message.mid, qos=message.qos:
+                              loop.call_soon_threadsafe(paho.ack, mid, qos))
+            await pipeline.accept(message.topic.value, message.payload, on_durable=on_durable)
+
+
+async def run():
+    sync_db = bridge.init_firebase()
+    pipeline = setup(firestore_async.client())
+    # The async client has no snapshot listeners, so thresholds are followed on the sync one
+    sync_db.collection(bridge.ALERT_SETTINGS_COLLECTION).document(bridge.ALERT_SETTINGS_DOC).on_snapshot(
+        bridge.on_thresholds_snapshot)
+
+    metrics.start_http_server(bridge.METRICS_PORT, bridge.METRICS_HOST)
+    start(pipeline)
+
+    stopping = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        asyncio.get_running_loop().add_signal_handler(signum, stopping.set)
+
+    async def keep_connected():
+        while True:
+            try:
+                logger.info(f"🔗 Connecting to MQTT broker at {bridge.MQTT_BROKER}:{bridge.MQTT_PORT} "
+                            f"(TLS: {bridge.MQTT_TLS})")
+                await consume(create_client(), pipeline)
+            except aiomqtt.MqttError as e:
+                bridge.CONNECTED.set(0)
+                logger.warning(f"⚠️  MQTT connection lost ({e}), reconnecting in {RECONNECT_INTERVAL:.0f}s")
+                await asyncio.sleep(RECONNECT_INTERVAL)
+
+    consumer = asyncio.create_task(keep_connected())
+    await stopping.wait()
+
+    logger.info("👋 Shutting down...")
+    # Ack what is already spooled before leaving the session; the rest stays queued on the broker
+    bridge.spool.sync()
+    await asyncio.sleep(0)
+    consumer.cancel()
+    await asyncio.gather(consumer, return_exceptions=True)
+    await drain(pipeline)
+    logger.info(f"🧵 Async pipeline stats: {pipeline.stats()}")
+    bridge.log_stats()
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
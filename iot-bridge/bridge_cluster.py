@@ -0,0 +1,343 @@
+# bridge_cluster.py
+# Run the bridge as N worker processes, each with its own spool and Firestore pipeline.
+#   python bridge_cluster.py --workers 4                  # this process owns the MQTT session
+#                                                        # and hashes device_id to a worker
+#   python bridge_cluster.py --workers 4 --mode shared    # each worker subscribes through
+#                                                        # $share/<group>/... on the broker
+# Dispatch mode keeps every device's messages in order. Shared mode only does if the
+# broker picks the subscriber by publisher (e.g. EMQX hash_clientid); round-robin
+# brokers such as mosquitto can hand consecutive messages of a device to different workers.
+import argparse
+import hashlib
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+import mqtt_firebase_bridge as bridge
+from ingest_queue import partition_key
+
+logger = logging.getLogger(__name__)
+
+SHARE_GROUP = "mqtt-firebase-bridge"
+
+# A worker that crashes within STABLE_AFTER seconds of starting is restarted after
+# RESTART_BACKOFF seconds, doubling up to MAX_RESTART_BACKOFF while it keeps crashing
+RESTART_BACKOFF = 1.0
+MAX_RESTART_BACKOFF = 30.0
+STABLE_AFTER = 60.0
+
+# Workers are started fresh rather than forked from a process running paho threads
+_mp = multiprocessing.get_context('spawn')
+
+
+def worker_for(key, workers):
+    # Not crc32: the ingest queue inside the worker partitions on crc32 of the same key,
+    # and reusing it would put all of a worker's devices on one of its partitions
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little') % workers
+
+
+def run_dispatch_worker(index, conn, make_db, spool_dir, spill_dir, log_level, metrics_port):
+    """Worker process in dispatch mode: messages come over the pipe, acks go back once spooled"""
+    logging.getLogger().setLevel(log_level)
+    # The supervisor decides when to stop, after it has stopped dispatching
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    bridge.setup(make_db(), spool_dir=spool_dir, spill_dir=spill_dir)
+    bridge.watch_thresholds()
+    if metrics_port:
+        metrics.start_http_server(metrics_port, bridge.METRICS_HOST)
+    bridge.start()
+
+    send_lock = threading.Lock()
+
+    def send(*message):
+        with send_lock:
+            conn.send(message)
+
+    send('ready')
+    try:
+        while True:
+            message = conn.recv()
+            if message[0] == 'stop':
+                break
+            _, mid, topic, payload, qos = message
+            on_durable = (lambda mid=mid: send('ack', mid)) if qos > 0 else None
+            bridge.accept(topic, payload, on_durable=on_durable)
+    except EOFError:
+        pass
+
+    summary = bridge.drain()
+    try:
+        send('stopped', {
+            'processed': bridge.ingest.stats()['processed'],
+            'writes': bridge.writer.ops_written,
+            'commits': bridge.writer.flush_count,
+            'drain': summary,
+        })
+    except OSError:
+        pass
+
+
+def run_shared_worker(index, group, spool_dir, spill_dir, log_level):
+    """Worker process in shared mode: a complete bridge on its own $share subscription"""
+    logging.getLogger().setLevel(log_level)
+    bridge.MQTT_CLIENT_ID = f"{bridge.MQTT_CLIENT_ID}-{index}"
+    bridge.SHARE_GROUP = group
+    bridge.SPOOL_DIR = spool_dir
+    bridge.SPILL_DIR = spill_dir
+    bridge.METRICS_PORT += 1 + index
+    bridge.main()
+
+
+class _Worker:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.inflight = OrderedDict()  # mid -> (topic, payload, qos) until the worker spooled it
+        self.lock = threading.Lock()       # guards inflight; never held while sending
+        self.send_lock = threading.Lock()  # keeps sends to the pipe in order
+        self.ready = threading.Event()
+        self.stopped = threading.Event()
+        self.started_at = 0.0
+        self.restart_at = None
+        self.backoff = RESTART_BACKOFF
+        self.restarts = 0
+        self.stats = None
+
+
+class BridgeCluster:
+    """Supervisor for N bridge worker processes.
+
+    In dispatch mode the calling process owns the MQTT session and sends each
+    message to the worker chosen by its device_id, so a device always lands
+    on the same worker and its messages stay in order. The broker ack is
+    passed to `on_ack(mid, qos)` once that worker has spooled the message;
+    whatever a crashed worker had not spooled is sent again to its
+    replacement. In shared mode every worker is a complete bridge on a
+    $share subscription. Crashed workers are restarted either way.
+    """
+
+    def __init__(self, workers, mode='dispatch', make_db=None, on_ack=None, group=SHARE_GROUP,
+                 spool_dir=None, spill_dir=None, log_level="INFO", metrics_port=None):
+        self.mode = mode
+        self.make_db = make_db or bridge.init_firebase
+        self.on_ack = on_ack
+        self.group = group
+        self.spool_dir = spool_dir or bridge.SPOOL_DIR
+        self.spill_dir = spill_dir or bridge.SPILL_DIR
+        self.log_level = log_level
+        self.metrics_port = metrics_port
+        self.workers = [_Worker(i) for i in range(workers)]
+
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        for worker in self.workers:
+            self._spawn(worker)
+        self._thread = threading.Thread(target=self._supervise, name="cluster-supervisor", daemon=True)
+        self._thread.start()
+
+    def wait_ready(self, timeout=60):
+        """Block until every dispatch worker has its pipeline running"""
+        deadline = time.monotonic() + timeout
+        return all(w.ready.wait(max(0.0, deadline - time.monotonic())) for w in self.workers)
+
+    def dispatch(self, topic, payload, mid, qos):
+        """Hand one MQTT message to the worker that owns its device"""
+        worker = self.workers[worker_for(partition_key(topic, payload), len(self.workers))]
+        with worker.send_lock:
+            if qos > 0:
+                with worker.lock:
+                    worker.inflight[mid] = (topic, payload, qos)
+            try:
+                worker.conn.send(('msg', mid, topic, payload, qos))
+            except OSError:
+                pass  # worker is down; the supervisor resends its inflight messages
+
+    def inflight(self):
+        return sum(len(w.inflight) for w in self.workers)
+
+    def restarts(self):
+        return sum(w.restarts for w in self.workers)
+
+    def _paths(self, worker):
+        return f"{self.spool_dir}/worker-{worker.index}", f"{self.spill_dir}/worker-{worker.index}"
+
+    def _spawn(self, worker):
+        spool_dir, spill_dir = self._paths(worker)
+        if self.mode == 'shared':
+            process = _mp.Process(target=run_shared_worker, name=f"bridge-worker-{worker.index}",
+                                  args=(worker.index, self.group, spool_dir, spill_dir, self.log_level))
+            process.start()
+            worker.process = process
+            worker.started_at = time.monotonic()
+            return
+
+        parent, child = _mp.Pipe()
+        port = self.metrics_port + 1 + worker.index if self.metrics_port else None
+        process = _mp.Process(target=run_dispatch_worker, name=f"bridge-worker-{worker.index}",
+                              args=(worker.index, child, self.make_db, spool_dir, spill_dir,
+                                    self.log_level, port))
+        process.start()
+        child.close()
+
+        worker.ready.clear()
+        threading.Thread(target=self._read, args=(worker, parent), name=f"cluster-reader-{worker.index}",
+                         daemon=True).start()
+        with worker.send_lock:
+            worker.process = process
+            worker.conn = parent
+            worker.started_at = time.monotonic()
+            with worker.lock:
+                resend = list(worker.inflight.items())
+            for mid, (topic, payload, qos) in resend:
+                try:
+                    parent.send(('msg', mid, topic, payload, qos))
+                except OSError:
+                    break
+
+    def _read(self, worker, conn):
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                return
+            kind = message[0]
+            if kind == 'ack':
+                with worker.lock:
+                    entry = worker.inflight.pop(message[1], None)
+                if entry is not None and self.on_ack is not None:
+                    self.on_ack(message[1], entry[2])
+            elif kind == 'ready':
+                worker.ready.set()
+            elif kind == 'stopped':
+                worker.stats = message[1]
+                worker.stopped.set()
+
+    def _supervise(self):
+        while not self._stopping.wait(0.5):
+            for worker in self.workers:
+                if worker.process.is_alive():
+                    continue
+                now = time.monotonic()
+                if worker.restart_at is None:
+                    ran = now - worker.started_at
+                    if ran >= STABLE_AFTER:
+                        worker.backoff = RESTART_BACKOFF
+                    logger.warning(f"💥 Worker {worker.index} exited with code {worker.process.exitcode} "
+                                   f"after {ran:.0f}s, restarting in {worker.backoff:.0f}s")
+                    worker.restart_at = now + worker.backoff
+                    worker.backoff = min(worker.backoff * 2, MAX_RESTART_BACKOFF)
+                if now >= worker.restart_at and not self._stopping.is_set():
+                    worker.restart_at = None
+                    worker.restarts += 1
+                    self._spawn(worker)
+
+    def stop(self, timeout=None):
+        """Let every worker drain its pipeline and exit"""
+        timeout = bridge.SHUTDOWN_DEADLINE + 10 if timeout is None else timeout
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        for worker in self.workers:
+            if not worker.process.is_alive():
+                continue
+            if self.mode == 'shared':
+                os.kill(worker.process.pid, signal.SIGTERM)
+            else:
+                try:
+                    with worker.send_lock:
+                        worker.conn.send(('stop',))
+                except OSError:
+                    pass
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                logger.error(f"❌ Worker {worker.index} did not stop in time, terminating it")
+                worker.process.terminate()
+                worker.process.join()
+            worker.stopped.wait(1)
+
+    def stats(self):
+        drained = [w.stats['drain'] for w in self.workers if w.stats and 'drain' in w.stats]
+        return {'workers': len(self.workers), 'mode': self.mode, 'inflight': self.inflight(),
+                'restarts': self.restarts(),
+                'writes_flushed': sum(d['writes_flushed'] for d in drained),
+                'left_in_spool': sum(d['left_in_spool'] for d in drained)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process MQTT to Firestore bridge")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--mode', choices=('dispatch', 'shared'), default='dispatch')
+    parser.add_argument('--group', default=SHARE_GROUP, help="shared subscription group")
+    parser.add_argument('--log-level', default="INFO")
+    args = parser.parse_args()
+
+    stopping = threading.Event()
+    bridge.handle_shutdown_signals(stopping.set)
+
+    if args.mode == 'shared':
+        cluster = BridgeCluster(args.workers, mode='shared', group=args.group, log_level=args.log_level)
+        cluster.start()
+        logger.info(f"🧩 Started {args.workers} workers on $share/{args.group}/...")
+        stopping.wait()
+        # Each worker drains itself on SIGTERM
+        cluster.stop()
+        return
+
+    if not bridge.MANUAL_ACK:
+        logger.warning("⚠️  paho-mqtt 1.x acks on return, a crashing worker can lose messages it had not spooled")
+
+    client = bridge.create_client()
+    cluster = BridgeCluster(args.workers, on_ack=client.ack if bridge.MANUAL_ACK else None,
+                            log_level=args.log_level, metrics_port=bridge.METRICS_PORT)
+    metrics.Gauge('bridge_cluster_inflight', "Messages dispatched to a worker and not yet spooled",
+                  fn=cluster.inflight)
+    metrics.Counter('bridge_cluster_restarts_total', "Worker processes restarted after a crash",
+                    fn=cluster.restarts)
+
+    client.on_connect = bridge.on_connect
+    client.on_disconnect = bridge.on_disconnect
+    client.on_message = lambda c, userdata, msg: cluster.dispatch(msg.topic, msg.payload, msg.mid, msg.qos)
+
+    cluster.start()
+    if not cluster.wait_ready():
+        logger.warning("⚠️  Not all workers are ready yet, messages will queue for them")
+    logger.info(f"🧩 Started {args.workers} workers, dispatching by device_id")
+
+    try:
+        client.connect(bridge.MQTT_BROKER, bridge.MQTT_PORT, 60)
+        logger.info(f"🔗 Connecting to MQTT broker at {bridge.MQTT_BROKER}:{bridge.MQTT_PORT} (TLS: {bridge.MQTT_TLS})")
+        metrics.start_http_server(bridge.METRICS_PORT, bridge.METRICS_HOST)
+        client.loop_start()
+    except Exception as e:
+        logger.error(f"❌ MQTT connection error: {e}")
+        cluster.stop()
+        return
+
+    stopping.wait()
+    if bridge.MANUAL_ACK:
+        # Stop consuming but stay connected until the workers have acked what they were sent;
+        # messages that arrive from now on are left unacked and redelivered on the next start
+        client.on_message = None
+    else:
+        client.disconnect()
+    cluster.stop()
+    client.disconnect()
+    client.loop_stop()
+    logger.info(f"🧩 Cluster stats: {cluster.stats()}")
+
+
+if __name__ == "__main__":
+    main()
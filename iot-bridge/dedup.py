@@ -0,0 +1,63 @@
+# dedup.py
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def message_id(data, payload):
+    """Deterministic document ID for a device message.
+
+    Firmware that sends `boot_id` and `seq` gets device_boot_seq, which stays
+    unique across reboots (millis() restarts at zero, boot_id does not repeat).
+    Older payloads fall back to device_timestamp plus a short hash of the raw
+    payload, so a reboot no longer overwrites earlier readings while an MQTT
+    redelivery still maps to the same document.
+    """
+    device_id = data.get('device_id', 'unknown')
+    if 'boot_id' in data and 'seq' in data:
+        return f"{device_id}_{data['boot_id']}_{data['seq']}"
+    digest = hashlib.blake2b(payload, digest_size=4).hexdigest()
+    return f"{device_id}_{data.get('timestamp', 0)}_{digest}"
+
+
+class DedupCache:
+    """Fixed-size LRU set of recently handled message IDs.
+
+    IDs are stored as 64-bit hashes, so memory stays at roughly
+    `capacity` small ints however many devices there are.
+    """
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    @staticmethod
+    def _hash(msg_id):
+        return int.from_bytes(hashlib.blake2b(msg_id.encode('utf-8'), digest_size=8).digest(), 'little')
+
+    def seen(self, msg_id):
+        """Record msg_id; True if it was already recorded (a duplicate)"""
+        key = self._hash(msg_id)
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                self.hits += 1
+                return True
+            self._keys[key] = None
+            if len(self._keys) > self.capacity:
+                self._keys.popitem(last=False)
+            return False
+
+    def add(self, msg_id):
+        key = self._hash(msg_id)
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+            if len(self._keys) > self.capacity:
+                self._keys.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._keys), 'capacity': self.capacity, 'duplicates': self.hits}
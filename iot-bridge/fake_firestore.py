@@ -0,0 +1,453 @@
+# fake_firestore.py
+# In-memory stand-in for the Firestore client, used to benchmark the bridge offline
+import asyncio
+import enum
+import functools
+import threading
+import time
+import uuid
+
+
+def _resolve(current, value):
+    # Field transforms (firestore.Increment / Maximum / Minimum) carry their operand in .value
+    kind = type(value).__name__
+    if kind == 'Increment':
+        return (current or 0) + value.value
+    if kind == 'Maximum':
+        return value.value if current is None else max(current, value.value)
+    if kind == 'Minimum':
+        return value.value if current is None else min(current, value.value)
+    return value
+
+
+def _merge(target, data):
+    for key, value in data.items():
+        if type(value).__name__ == 'Sentinel':
+            # firestore.DELETE_FIELD
+            target.pop(key, None)
+        elif isinstance(value, dict):
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            _merge(target[key], value)
+        else:
+            target[key] = _resolve(target.get(key), value)
+    return target
+
+
+def _field(data, doc_path, field_path):
+    """(found, value) of a dotted field path; __name__ is the document path"""
+    if field_path == '__name__':
+        return True, doc_path
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return False, None
+        value = value[part]
+    return True, value
+
+
+def _rank(value):
+    # Firestore orders values of different types by type first
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if hasattr(value, 'tzinfo'):
+        return 3
+    if isinstance(value, str):
+        return 4
+    return 5
+
+
+def _compare(a, b):
+    if _rank(a) != _rank(b):
+        return -1 if _rank(a) < _rank(b) else 1
+    return (a > b) - (a < b)
+
+
+_OPERATORS = {
+    '==': lambda a, b: _rank(a) == _rank(b) and a == b,
+    '!=': lambda a, b: not (_rank(a) == _rank(b) and a == b),
+    '<': lambda a, b: _rank(a) == _rank(b) and a < b,
+    '<=': lambda a, b: _rank(a) == _rank(b) and a <= b,
+    '>': lambda a, b: _rank(a) == _rank(b) and a > b,
+    '>=': lambda a, b: _rank(a) == _rank(b) and a >= b,
+    'in': lambda a, b: a in b,
+    'array-contains': lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+class FakeQuery:
+    """where / order_by / start_after / limit over one collection, evaluated in memory.
+
+    As in Firestore, documents without a filtered or ordered field are left
+    out, and ties are broken by document ID.
+    """
+    ASCENDING = 'ASCENDING'
+    DESCENDING = 'DESCENDING'
+
+    def __init__(self, collection, filters=(), orders=(), cursor=None, count=None):
+        self._collection = collection
+        self._filters = filters
+        self._orders = orders
+        self._cursor = cursor
+        self._count = count
+
+    def _copy(self, **changes):
+        state = {'filters': self._filters, 'orders': self._orders, 'cursor': self._cursor,
+                 'count': self._count}
+        state.update(changes)
+        return FakeQuery(self._collection, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def limit(self, count):
+        return self._copy(count=count)
+
+    def _matches(self, snapshot):
+        for field_path, op_string, value in self._filters:
+            found, current = _field(snapshot._data, snapshot.reference.path, field_path)
+            if not found or not _OPERATORS[op_string](current, value):
+                return False
+        return True
+
+    def _results(self):
+        orders = self._orders
+        if not any(field == '__name__' for field, _ in orders):
+            direction = orders[-1][1] if orders else self.ASCENDING
+            orders = orders + (('__name__', direction),)
+        fields = [field for field, _ in orders]
+
+        rows = []
+        for snapshot in self._collection._documents():
+            found = [_field(snapshot._data, snapshot.reference.path, field) for field in fields]
+            if all(ok for ok, _ in found) and self._matches(snapshot):
+                rows.append(([value for _, value in found], snapshot))
+
+        def order(a, b):
+            for (_, direction), x, y in zip(orders, a[0], b[0]):
+                result = _compare(x, y)
+                if result:
+                    return -result if direction == self.DESCENDING else result
+            return 0
+
+        rows.sort(key=functools.cmp_to_key(order))
+        if self._cursor is not None:
+            cursor = self._cursor
+            if isinstance(cursor, FakeSnapshot):
+                cursor = [_field(cursor._data or {}, cursor.reference.path, f)[1] for f in fields]
+            else:
+                cursor = [cursor[f] for f in fields if f in cursor]
+            rows = [row for row in rows if order((row[0][:len(cursor)], None), (cursor, None)) > 0]
+        if self._count is not None:
+            rows = rows[:self._count]
+        return [snapshot for _, snapshot in rows]
+
+    def stream(self):
+        rows = self._results()
+        client = self._collection._client
+        client._round_trip()
+        with client._lock:
+            client.reads += max(1, len(rows))  # an empty result is billed as one read
+        yield from rows
+
+    def on_snapshot(self, callback):
+        """Call callback(snapshots, changes, read_time) now and after every write that changes the results"""
+        return self._collection._client._listen_query(self, callback)
+
+
+class FakeDocument:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def collection(self, name):
+        return FakeCollection(self._client, f"{self.path}/{name}")
+
+    def set(self, data, merge=False):
+        self._client._round_trip()
+        self._client._apply(self.path, data, merge)
+
+    def get(self):
+        return FakeSnapshot(self, self._client.docs.get(self.path))
+
+    def on_snapshot(self, callback):
+        """Call callback([snapshot], changes, read_time) now and after every write"""
+        return self._client._listen(self, callback)
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeCollection:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+
+    def document(self, doc_id=None):
+        return FakeDocument(self._client, f"{self.path}/{doc_id or uuid.uuid4().hex[:20]}")
+
+    def add(self, data):
+        doc_ref = self.document()
+        doc_ref.set(data)
+        return None, doc_ref
+
+    def _holds(self, path):
+        return path.rsplit('/', 1)[0] == self.path
+
+    def _documents(self):
+        prefix = self.path + '/'
+        for path, data in list(self._client.docs.items()):
+            if path.startswith(prefix) and '/' not in path[len(prefix):]:
+                yield FakeSnapshot(FakeDocument(self._client, path), data)
+
+    def stream(self):
+        return self._documents()
+
+    def where(self, *args, **kwargs):
+        return FakeQuery(self).where(*args, **kwargs)
+
+    def order_by(self, field_path, direction=FakeQuery.ASCENDING):
+        return FakeQuery(self).order_by(field_path, direction)
+
+    def start_after(self, document_fields_or_snapshot):
+        return FakeQuery(self).start_after(document_fields_or_snapshot)
+
+    def limit(self, count):
+        return FakeQuery(self).limit(count)
+
+    def on_snapshot(self, callback):
+        return FakeQuery(self).on_snapshot(callback)
+
+
+class FakePartition:
+    def __init__(self, group, start, end):
+        self._group = group
+        self._start = start
+        self._end = end
+
+    def query(self):
+        query = FakeQuery(self._group).order_by('__name__')
+        if self._start is not None:
+            query = query.where('__name__', '>=', self._start)
+        if self._end is not None:
+            query = query.where('__name__', '<', self._end)
+        return query
+
+
+class FakeCollectionGroup:
+    """Every collection with this name, wherever it is nested"""
+
+    def __init__(self, client, name):
+        self._client = client
+        self.name = name
+
+    def _holds(self, path):
+        parts = path.split('/')
+        return len(parts) >= 2 and parts[-2] == self.name
+
+    def _documents(self):
+        for path, data in list(self._client.docs.items()):
+            parts = path.split('/')
+            if len(parts) >= 2 and parts[-2] == self.name:
+                yield FakeSnapshot(FakeDocument(self._client, path), data)
+
+    def get_partitions(self, partition_count):
+        """Split the documents into about partition_count ranges of document path"""
+        paths = sorted(snapshot.reference.path for snapshot in self._documents())
+        size = -(-len(paths) // max(1, partition_count)) or 1
+        starts = [None] + paths[size::size]
+        for i, start in enumerate(starts):
+            yield FakePartition(self, start, starts[i + 1] if i + 1 < len(starts) else None)
+
+
+class FakeBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, doc_ref, data, merge=False):
+        self._ops.append((doc_ref.path, data, merge))
+
+    def commit(self):
+        self._client._round_trip()
+        for path, data, merge in self._ops:
+            self._client._apply(path, data, merge)
+        self._ops = []
+
+
+class ChangeType(enum.Enum):
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+class FakeChange:
+    def __init__(self, type, document, old_index, new_index):
+        self.type = type
+        self.document = document
+        self.old_index = old_index
+        self.new_index = new_index
+
+
+class FakeWatch:
+    def __init__(self, client, path, listener):
+        self._client = client
+        self._path = path
+        self._listener = listener
+
+    def unsubscribe(self):
+        with self._client._lock:
+            listeners = self._client._listeners.get(self._path, [])
+            if self._listener in listeners:
+                listeners.remove(self._listener)
+
+
+class _QueryWatch:
+    def __init__(self, client, key):
+        self._client = client
+        self._key = key
+
+    def unsubscribe(self):
+        with self._client._lock:
+            self._client._query_listeners.pop(self._key, None)
+
+
+class FakeFirestore:
+    """Mimics the parts of firestore.Client the bridge uses.
+
+    Every set() or batch commit costs one round trip of `latency` seconds,
+    which is what makes per-message writes expensive against the real thing.
+    So does every query, and `reads` counts the documents queries returned.
+    Query listeners are billed like Firestore's: the first snapshot's
+    documents, then one read per added or modified document.
+    Set `available` to False to simulate an outage.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.available = True
+        self.docs = {}
+        self.round_trips = 0
+        self.writes = 0
+        self.reads = 0
+        self._listeners = {}  # document path -> [(doc_ref, callback)]
+        self._query_listeners = {}  # id -> [query, {path: data} of the last results, callback]
+        self._lock = threading.Lock()
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def collection_group(self, name):
+        return FakeCollectionGroup(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if not self.available:
+            raise ConnectionError("503 Service Unavailable (simulated outage)")
+        with self._lock:
+            self.round_trips += 1
+
+    def _listen(self, doc_ref, callback):
+        listener = (doc_ref, callback)
+        with self._lock:
+            self._listeners.setdefault(doc_ref.path, []).append(listener)
+        callback([doc_ref.get()], [], time.time())
+        return FakeWatch(self, doc_ref.path, listener)
+
+    def _listen_query(self, query, callback):
+        results = query._results()
+        listener = [query, {s.reference.path: dict(s._data) for s in results}, callback]
+        with self._lock:
+            self._query_listeners[id(listener)] = listener
+            self.reads += max(1, len(results))
+        changes = [FakeChange(ChangeType.ADDED, s, -1, i) for i, s in enumerate(results)]
+        callback(results, changes, time.time())
+        return _QueryWatch(self, id(listener))
+
+    def _notify_queries(self, path):
+        with self._lock:
+            listeners = list(self._query_listeners.values())
+        for listener in listeners:
+            query, previous, callback = listener
+            if not query._collection._holds(path):
+                continue
+            results = query._results()
+            current = {s.reference.path: dict(s._data) for s in results}
+            changes = []
+            for i, snapshot in enumerate(results):
+                doc_path = snapshot.reference.path
+                if doc_path not in previous:
+                    changes.append(FakeChange(ChangeType.ADDED, snapshot, -1, i))
+                elif previous[doc_path] != snapshot._data:
+                    changes.append(FakeChange(ChangeType.MODIFIED, snapshot, i, i))
+            for doc_path in previous:
+                if doc_path not in current:
+                    gone = FakeSnapshot(FakeDocument(self, doc_path), None)
+                    changes.append(FakeChange(ChangeType.REMOVED, gone, 0, -1))
+            if not changes:
+                continue
+            listener[1] = current
+            with self._lock:
+                self.reads += sum(change.type is not ChangeType.REMOVED for change in changes)
+            callback(results, changes, time.time())
+
+    def _apply(self, path, data, merge):
+        with self._lock:
+            self.writes += 1
+            if merge and path in self.docs:
+                _merge(self.docs[path], data)
+            else:
+                self.docs[path] = _merge({}, data)
+            listeners = list(self._listeners.get(path, ()))
+        for doc_ref, callback in listeners:
+            callback([doc_ref.get()], [], time.time())
+        if self._query_listeners:
+            self._notify_queries(path)
+
+
+class FakeAsyncBatch(FakeBatch):
+    async def commit(self):
+        await self._client._round_trip_async()
+        for path, data, merge in self._ops:
+            self._client._apply(path, data, merge)
+        self._ops = []
+
+
+class FakeAsyncFirestore(FakeFirestore):
+    """Like FakeFirestore, but batch commits are coroutines, as with firestore.AsyncClient"""
+
+    def batch(self):
+        return FakeAsyncBatch(self)
+
+    async def _round_trip_async(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if not self.available:
+            raise ConnectionError("503 Service Unavailable (simulated outage)")
+        with self._lock:
+            self.round_trips += 1
@@ -0,0 +1,67 @@
+# firestore_indexes.py
+# Writes firestore.indexes.json: single-field index exemptions for the sensor reading
+# fields nothing queries and the reading IDs in sensor_rollups. Firestore indexes every field of every document by default
+# (ascending, descending and array-contains), so each sensor_readings write also
+# updates about 40 index entries, and every element of a sensor_buckets array is an
+# index entry of its own. Run it after changing schema.py, then deploy:
+#   python firestore_indexes.py
+#   firebase deploy --only firestore:indexes
+import argparse
+import json
+
+from rollups import COUNTED_FIELD, ROLLUP_COLLECTION
+from schema import DEVICE_FIELDS, INDEXED_READING_FIELDS, READING_FIELDS
+from sensor_buckets import BUCKET_COLLECTION, BUCKET_DEVICE_FIELDS, SAMPLE_COLUMNS
+
+INDEXES_FILE = "firestore.indexes.json"
+
+# Collection group -> fields that keep their automatic indexes (what the dashboard
+# and migrate_sensor_readings.py query or order by)
+QUERIED_FIELDS = {
+    'sensor_readings': INDEXED_READING_FIELDS,
+    BUCKET_COLLECTION: ('device_id', 'bucket_start'),
+    ROLLUP_COLLECTION: (),
+}
+
+# Composite indexes the dashboard needs; deploying the file removes any not listed
+COMPOSITE_INDEXES = [
+    {'collectionGroup': 'alerts', 'queryScope': 'COLLECTION', 'fields': [
+        {'fieldPath': 'alert_status', 'order': 'ASCENDING'},
+        {'fieldPath': 'received_at', 'order': 'DESCENDING'},
+    ]},
+]
+
+STORED_FIELDS = {
+    'sensor_readings': ('schema_version', 'device_id', 'received_at', 'device_millis')
+                       + DEVICE_FIELDS + tuple(READING_FIELDS),
+    BUCKET_COLLECTION: ('schema_version', 'device_id', 'bucket_start', 'bucket_seconds', 'count')
+                       + BUCKET_DEVICE_FIELDS + SAMPLE_COLUMNS + tuple(READING_FIELDS),
+    # Only the map of reading IDs: an index entry per ID would be rewritten on every flush
+    ROLLUP_COLLECTION: (COUNTED_FIELD,),
+}
+
+
+def field_overrides():
+    """fieldOverrides entries that turn off indexing for every unqueried field"""
+    overrides = []
+    for group, fields in STORED_FIELDS.items():
+        for field in fields:
+            if field not in QUERIED_FIELDS[group]:
+                overrides.append({'collectionGroup': group, 'fieldPath': field, 'indexes': []})
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate Firestore index exemptions for sensor readings")
+    parser.add_argument('--output', default=INDEXES_FILE)
+    args = parser.parse_args()
+
+    overrides = field_overrides()
+    with open(args.output, 'w') as f:
+        json.dump({'indexes': COMPOSITE_INDEXES, 'fieldOverrides': overrides}, f, indent=2)
+        f.write('\n')
+    print(f"Wrote {len(overrides)} index exemptions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+# firestore_writer.py
+import asyncio
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects a WriteBatch with more than 500 operations
+MAX_BATCH_OPS = 500
+
+
+class BatchWriter:
+    """Collect Firestore writes and commit them together as WriteBatch flushes.
+
+    A flush happens when `max_ops` writes are pending or when the oldest
+    pending write is older than `max_age` seconds, whichever comes first.
+    Each write can carry tokens; after a commit they are passed to
+    `on_commit`, or to `on_error` if the commit failed. `on_flush(ops,
+    seconds)` is called with the size and latency of every successful commit.
+    """
+
+    def __init__(self, db, max_ops=MAX_BATCH_OPS, max_age=1.0, on_commit=None, on_error=None,
+                 on_flush=None):
+        self.db = db
+        self.max_ops = min(max_ops, MAX_BATCH_OPS)
+        self.max_age = max_age
+        self.on_commit = on_commit
+        self.on_error = on_error
+        self.on_flush = on_flush
+
+        self._pending = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # keeps commits in order
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+
+        # Flush statistics
+        self.flush_count = 0
+        self.ops_written = 0
+        self.failed_ops = 0
+        self.last_flush_size = 0
+        self.last_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+    def set(self, doc_ref, data, merge=False, tokens=()):
+        """Queue a document set() for the next batch commit"""
+        with self._lock:
+            first = not self._pending
+            if first:
+                self._oldest = time.monotonic()
+            self._pending.append((doc_ref, data, merge, tokens))
+            full = len(self._pending) >= self.max_ops
+
+        self._queued(first, full)
+
+    def set_all(self, writes, tokens=()):
+        """Queue (doc_ref, data) sets that commit in one WriteBatch; tokens complete with it.
+
+        If the writes would not fit next to the pending ones, those are
+        flushed first, so at most max_ops writes never straddle two commits.
+        """
+        ops = [(doc_ref, data, False, ()) for doc_ref, data in writes]
+        if not ops:
+            return
+        if len(ops) > self.max_ops:
+            raise ValueError(f"{len(ops)} writes do not fit in one batch of {self.max_ops}")
+        ops[-1] = ops[-1][:3] + (tuple(tokens),)
+
+        # Pending writes only grow by appending, and flushes cut them from the front,
+        # so writes appended within the first max_ops are committed together
+        room = True
+        while True:
+            with self._lock:
+                # Without room (an AsyncBatchWriter before start() cannot commit yet)
+                # the writes are queued as they are
+                if len(self._pending) + len(ops) <= self.max_ops or not room:
+                    first = not self._pending
+                    if first:
+                        self._oldest = time.monotonic()
+                    self._pending.extend(ops)
+                    full = len(self._pending) >= self.max_ops
+                    break
+            room = self._make_room()
+
+        self._queued(first, full)
+
+    def _queued(self, first, full):
+        if full:
+            self.flush()
+        elif first:
+            self._wake.set()  # let the deadline thread pick up the new age
+
+    def _make_room(self):
+        """Commit what is pending to make room for a group of writes"""
+        self.flush()
+        return True
+
+    def add(self, collection_name, data, tokens=()):
+        """Queue a write to a new auto-ID document, like collection.add()"""
+        doc_ref = self.db.collection(collection_name).document()
+        self.set(doc_ref, data, tokens=tokens)
+        return doc_ref
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Commit everything pending, in chunks of at most max_ops writes"""
+        with self._flush_lock:
+            with self._lock:
+                ops = self._pending
+                self._pending = []
+                self._oldest = None
+
+            for start in range(0, len(ops), self.max_ops):
+                self._commit(ops[start:start + self.max_ops])
+
+            return len(ops)
+
+    def _commit(self, ops):
+        batch, tokens = self._batch(ops)
+        started = time.perf_counter()
+        try:
+            batch.commit()
+        except Exception as e:
+            self._failed(ops, tokens, e)
+            return
+        self._committed(ops, tokens, time.perf_counter() - started)
+
+    def _batch(self, ops):
+        """A WriteBatch of ops and the tokens they carry"""
+        batch = self.db.batch()
+        tokens = []
+        for doc_ref, data, merge, op_tokens in ops:
+            batch.set(doc_ref, data, merge=merge)
+            tokens.extend(op_tokens)
+        return batch, tokens
+
+    def _failed(self, ops, tokens, error):
+        self.failed_ops += len(ops)
+        logger.error(f"❌ Batch commit of {len(ops)} writes failed: {error}")
+        if self.on_error is not None:
+            self.on_error(tokens)
+
+    def _committed(self, ops, tokens, latency):
+        self.flush_count += 1
+        self.ops_written += len(ops)
+        self.last_flush_size = len(ops)
+        self.last_flush_latency = latency
+        self.total_flush_latency += latency
+        logger.info(f"📦 Flushed {len(ops)} writes in {latency * 1000:.1f} ms")
+        if self.on_flush is not None:
+            self.on_flush(len(ops), latency)
+        if self.on_commit is not None:
+            self.on_commit(tokens)
+
+    def start(self):
+        """Start the background thread that enforces the max_age deadline"""
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="batch-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and flush whatever is still pending"""
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while self._running:
+            with self._lock:
+                oldest = self._oldest
+
+            if oldest is None:
+                timeout = self.max_age
+            else:
+                timeout = oldest + self.max_age - time.monotonic()
+
+            if timeout > 0:
+                self._wake.wait(timeout)
+                self._wake.clear()
+                continue
+
+            self.flush()
+
+    def stats(self):
+        """Summary of flush activity so far"""
+        avg_size = self.ops_written / self.flush_count if self.flush_count else 0
+        avg_latency = self.total_flush_latency / self.flush_count if self.flush_count else 0
+        return {
+            'flushes': self.flush_count,
+            'ops_written': self.ops_written,
+            'failed_ops': self.failed_ops,
+            'pending': self.pending(),
+            'avg_flush_size': avg_size,
+            'avg_flush_latency_ms': avg_latency * 1000,
+            'last_flush_size': self.last_flush_size,
+            'last_flush_latency_ms': self.last_flush_latency * 1000,
+        }
+
+
+class AsyncBatchWriter(BatchWriter):
+    """BatchWriter for Firestore's AsyncClient, running on an asyncio event loop.
+
+    set() keeps the same signature and may be called from any thread. Each
+    batch is committed as its own task, with at most `max_inflight` commits
+    awaiting Firestore at once. A batch that touches a document an earlier
+    batch is still writing waits for that batch, so writes to one document
+    land in order. start() must be called from the loop; stop() is a coroutine.
+    """
+
+    def __init__(self, db, max_ops=MAX_BATCH_OPS, max_age=1.0, on_commit=None, on_error=None,
+                 on_flush=None, max_inflight=1000):
+        super().__init__(db, max_ops=max_ops, max_age=max_age, on_commit=on_commit,
+                         on_error=on_error, on_flush=on_flush)
+        self.max_inflight = max_inflight
+        self._loop = None
+        self._semaphore = None
+        self._wake = None
+        self._writing = {}  # document path -> task of the latest batch writing it
+        self._tasks = set()
+        self.inflight = 0
+        self.inflight_high_water = 0
+
+    def _queued(self, first, full):
+        if (full or first) and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _make_room(self):
+        if self._loop is None:
+            return False
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._dispatch()  # commits as tasks, in order, without waiting
+        else:
+            self.flush()
+        return True
+
+    def flush(self):
+        """Commit everything pending and wait for it; for threads other than the loop's"""
+        if self._loop is None:
+            return 0
+        return asyncio.run_coroutine_threadsafe(self.flush_async(), self._loop).result()
+
+    async def flush_async(self):
+        """Commit everything pending and wait until all commits so far have finished"""
+        count = self._dispatch()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        return count
+
+    def _dispatch(self):
+        with self._lock:
+            ops = self._pending
+            self._pending = []
+            self._oldest = None
+
+        for start in range(0, len(ops), self.max_ops):
+            task = self._loop.create_task(self._commit(ops[start:start + self.max_ops]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return len(ops)
+
+    async def _commit(self, ops):
+        this = asyncio.current_task()
+        paths = {doc_ref.path for doc_ref, _, _, _ in ops}
+        earlier = {self._writing[path] for path in paths if path in self._writing}
+        for path in paths:
+            self._writing[path] = this
+
+        try:
+            if earlier:
+                await asyncio.gather(*earlier, return_exceptions=True)
+            async with self._semaphore:
+                self.inflight += 1
+                self.inflight_high_water = max(self.inflight_high_water, self.inflight)
+                try:
+                    await self._commit_batch(ops)
+                finally:
+                    self.inflight -= 1
+        finally:
+            for path in paths:
+                if self._writing.get(path) is this:
+                    del self._writing[path]
+
+    async def _commit_batch(self, ops):
+        # BatchWriter._commit, awaiting the commit
+        batch, tokens = self._batch(ops)
+        started = time.perf_counter()
+        try:
+            await batch.commit()
+        except Exception as e:
+            self._failed(ops, tokens, e)
+            return
+        self._committed(ops, tokens, time.perf_counter() - started)
+
+    def start(self):
+        """Start the deadline task; call from the event loop"""
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.max_inflight)
+        self._wake = asyncio.Event()
+        self._running = True
+        self._thread = self._loop.create_task(self._run())
+
+    async def stop(self):
+        """Stop the deadline task and commit whatever is still pending"""
+        self._running = False
+        if self._thread is not None:
+            self._wake.set()
+            await self._thread
+            self._thread = None
+        await self.flush_async()
+
+    async def _run(self):
+        while self._running:
+            with self._lock:
+                oldest = self._oldest
+                full = len(self._pending) >= self.max_ops
+
+            if not full:
+                timeout = self.max_age if oldest is None else oldest + self.max_age - time.monotonic()
+                if timeout > 0:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wake.clear()
+                    continue
+
+            self._dispatch()
+
+    def stats(self):
+        stats = super().stats()
+        stats['inflight'] = self.inflight
+        stats['inflight_high_water'] = self.inflight_high_water
+        return stats
+
+
+class Coalescer:
+    """Last-write-wins buffer for documents that are overwritten on every message.
+
+    Only the newest data for each document is kept, and each document is
+    written to the BatchWriter at most once per `interval` seconds. A
+    document that has not been written for a full interval goes out
+    immediately, so a quiet device is never delayed.
+    """
+
+    def __init__(self, writer, interval=15.0):
+        self.writer = writer
+        self.interval = interval
+
+        self._dirty = {}        # path -> (doc_ref, data, merge, tokens)
+        self._last_write = {}   # path -> monotonic time of the last write
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.updates = 0
+        self.writes = 0
+
+    def set(self, doc_ref, data, merge=False, tokens=()):
+        """Record the newest state of a document"""
+        now = time.monotonic()
+        path = doc_ref.path
+        with self._lock:
+            self.updates += 1
+            # Tokens of superseded states complete together with the write that replaces them
+            previous = self._dirty.pop(path, None)
+            if previous is not None:
+                tokens = tuple(previous[3]) + tuple(tokens)
+
+            last = self._last_write.get(path)
+            if last is None or now - last >= self.interval:
+                self._last_write[path] = now
+                self.writes += 1
+                write_now = True
+            else:
+                self._dirty[path] = (doc_ref, data, merge, tokens)
+                write_now = False
+
+        if write_now:
+            self.writer.set(doc_ref, data, merge=merge, tokens=tokens)
+
+    def flush(self, force=False):
+        """Write every buffered document whose interval has elapsed (all of them if force)"""
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for path, entry in list(self._dirty.items()):
+                if force or now - self._last_write[path] >= self.interval:
+                    due.append(entry)
+                    del self._dirty[path]
+                    self._last_write[path] = now
+            self.writes += len(due)
+
+        for doc_ref, data, merge, tokens in due:
+            self.writer.set(doc_ref, data, merge=merge, tokens=tokens)
+        return len(due)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="coalescer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread and hand every buffered document to the writer"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush(force=True)
+
+    def _run(self):
+        tick = min(1.0, self.interval / 4)
+        while not self._stop.wait(tick):
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'updates': self.updates,
+                'writes': self.writes,
+                'buffered': len(self._dirty),
+                'devices': len(self._last_write),
+            }
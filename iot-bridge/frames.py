@@ -0,0 +1,219 @@
+# frames.py
+# Dashboard DataFrames for sensor readings and alerts. Kept out of streamlit_app.py so
+# the stores and the benchmarks can build the same frames without the Streamlit runtime.
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from schema import DEVICE_FIELDS, READING_FIELDS
+
+
+# Column types of the cached frames: float32 measurements, bool flags, categoricals
+# for strings with few distinct values, and nullable integers and flags where the
+# field can be missing. Raw payload objects are not kept.
+_CATEGORIES = ('device_id', 'device_type', 'location', 'boot_id', 'topic')
+_INTEGERS = {'rssi': 'Int32', 'publish_count': 'Int32', 'error_count': 'Int32',
+             'device_millis': 'Int64', 'seq': 'Int64', 'uptime_seconds': 'Int64'}
+
+ALERT_CATEGORIES = ('device_id', 'alert_type', 'severity', 'alert_status', 'topic', 'rule', 'source', 'boot_id')
+ALERT_VALUES = ('value', 'threshold', 'peak_value', 'min_value')
+
+
+def _reading_layout():
+    """(field, type, value when missing) of the columns of a readings frame"""
+    layout = [('id', object, None), ('device_id', 'category', None), ('received_at', 'datetime', None),
+              ('schema_version', 'Int8', None)]
+    for name, (group, source, kind) in READING_FIELDS.items():
+        if group == 'sensors':
+            # Missing sensor values are 0 / False, as they always were on the dashboard
+            layout.append((name, bool, False) if kind is bool else (name, np.float32, 0.0))
+        else:
+            layout.append((name, 'boolean', None) if kind is bool else (name, _INTEGERS[name], None))
+    for name in ('device_millis',) + DEVICE_FIELDS:
+        layout.append((name, 'category' if name in _CATEGORIES else _INTEGERS[name], None))
+    return layout
+
+
+_LAYOUT = _reading_layout()
+_FIELDS = [name for name, _, _ in _LAYOUT]
+
+
+def _typed(values, kind, missing):
+    """Column of `kind` for an object array of field values (NaN or None where missing)"""
+    if kind is object:
+        return values
+    if kind == 'category':
+        return pd.Categorical(values)
+    try:
+        numbers = values.astype(np.float64)
+    except (TypeError, ValueError):
+        numbers = pd.to_numeric(values, errors='coerce').astype(np.float64)
+    absent = np.isnan(numbers)
+    if kind == 'boolean':
+        return pd.arrays.BooleanArray(np.where(absent, 0, numbers) != 0, absent)
+    if kind in ('Int8', 'Int32', 'Int64'):
+        return pd.arrays.IntegerArray(np.where(absent, 0, numbers).astype(kind.lower()), absent)
+    numbers[absent] = missing
+    return numbers != 0 if kind is bool else numbers.astype(kind)
+
+
+def _frame(columns):
+    # Typed columns go into the frame as they are, without another type check or copy
+    return pd.DataFrame({name: pd.Series(values, dtype=values.dtype, copy=False)
+                         for name, values in columns.items()}, copy=False)
+
+
+def concat(frames):
+    """pd.concat of readings or alert frames that keeps their categorical columns categorical"""
+    frame = pd.concat(frames, ignore_index=True)
+    for name, dtype in frames[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) and name in frame and frame[name].dtype == object:
+            frame[name] = frame[name].astype('category')
+    return frame
+
+
+def readings_frame(rows):
+    """Dashboard frame for sensor_readings documents (dicts with their 'id'), newest first.
+
+    Given the columns and no type to infer, pandas copies every field the
+    dashboard uses out of each document in one pass, into one preallocated
+    object array. Each column is then cast to its compact type in one step,
+    instead of pd.DataFrame(rows) guessing a type per column and
+    sensor_frame converting it again. Fields outside the schema are left
+    out. Documents from before schema_version 2, or without a timestamp,
+    go through sensor_frame instead.
+    """
+    if not rows:
+        return pd.DataFrame()
+    raw = pd.DataFrame(rows, columns=_FIELDS, dtype=object)
+    try:
+        if raw['schema_version'].isna().any():
+            raise ValueError("documents from before schema_version 2")
+        # received_at is a UTC Firestore timestamp; microseconds survive float seconds
+        seconds = np.fromiter(map(datetime.timestamp, raw['received_at']), np.float64, len(raw))
+    except (TypeError, ValueError):
+        return sensor_frame(pd.DataFrame(rows))
+
+    micros = np.rint(seconds * 1e6).astype(np.int64)
+    # Queries mostly return documents in received_at order already
+    step = np.diff(micros)
+    if (step <= 0).all():
+        order = slice(None)
+    elif (step >= 0).all():
+        order = slice(None, None, -1)
+    else:
+        order = np.argsort(micros, kind='stable')[::-1]
+    micros = micros[order]
+    columns = {}
+    for name, kind, missing in _LAYOUT:
+        if kind == 'datetime':
+            columns[name] = pd.to_datetime(micros, unit='us', utc=True).array
+        else:
+            # Missing fields are NaN in the object array
+            columns[name] = _typed(raw[name].to_numpy()[order], kind, missing)
+    # The dashboard shows naive local time, at the UTC offset in effect now
+    offset = datetime.now().astimezone().utcoffset() // timedelta(microseconds=1)
+    columns['timestamp'] = (micros + offset).astype('datetime64[us]').astype('datetime64[ns]')
+    return _frame(columns)
+
+
+def sensor_frame(df, compact=True):
+    """Dashboard columns (timestamp and flat sensor values) for a frame of readings
+
+    With compact=False the frame keeps every column of df, in the types
+    pandas gave them, as the dashboard cached it before the compact layout.
+    """
+    # The bridge writes flat, typed schema_version 2 documents (schema.py); older ones
+    # keep the nested Arduino JSON until migrate_sensor_readings.py has rewritten them
+    if 'schema_version' in df.columns:
+        legacy = df['schema_version'].isna()
+    else:
+        legacy = pd.Series(True, index=df.index)
+
+    # Parse timestamps: version 2 has a UTC Firestore timestamp, older documents a
+    # local-time ISO string; the dashboard works in naive local time
+    if 'received_at' in df.columns:
+        timestamps = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+        if (~legacy).any():
+            local_tz = datetime.now().astimezone().tzinfo
+            timestamps[~legacy] = pd.to_datetime(df.loc[~legacy, 'received_at'], utc=True) \
+                                    .dt.tz_convert(local_tz).dt.tz_localize(None)
+        if legacy.any():
+            timestamps[legacy] = pd.to_datetime(df.loc[legacy, 'received_at'], errors='coerce')
+        df['timestamp'] = timestamps
+    elif 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+    else:
+        df['timestamp'] = pd.Timestamp.now()
+
+    # Sensor values are already columns in version 2. Older documents nest them under
+    # 'sensors' with the Arduino names (or have them flat under those names)
+    for column in READING_FIELDS:
+        if column not in df.columns:
+            df[column] = None
+    if legacy.any():
+        for group in ('sensors', 'system'):
+            if group in df.columns:
+                nested = pd.DataFrame(
+                    [x if isinstance(x, dict) else {} for x in df.loc[legacy, group]],
+                    index=df.index[legacy])
+            else:
+                nested = df.loc[legacy]
+            for column, (field_group, source, kind) in READING_FIELDS.items():
+                if field_group == group and source in nested.columns:
+                    df.loc[legacy, column] = nested[source]
+
+    for column, (group, source, kind) in READING_FIELDS.items():
+        if group == 'sensors':
+            df[column] = df[column].fillna(False).astype(bool) if kind is bool \
+                else pd.to_numeric(df[column], errors='coerce').fillna(0)
+
+    # Sort by timestamp descending
+    df = df.sort_values('timestamp', ascending=False)
+    if not compact:
+        return df
+
+    columns = {}
+    for name, kind, missing in _LAYOUT:
+        if kind == 'datetime':
+            # Also for documents whose received_at was a local-time string
+            local_tz = datetime.now().astimezone().tzinfo
+            columns[name] = df['timestamp'].dt.tz_localize(local_tz).dt.tz_convert('UTC').array
+        else:
+            values = df[name].to_numpy(dtype=object) if name in df.columns else np.full(len(df), None, object)
+            columns[name] = _typed(values, kind, missing)
+    columns['timestamp'] = df['timestamp'].to_numpy()
+    return _frame(columns)
+
+
+def alert_frame(rows):
+    """Dashboard frame for alert documents, with received_at as the timestamp column
+
+    received_at (a local-time ISO string) becomes the naive datetime
+    timestamp; the device's millis() timestamp is dropped with it. Payload
+    objects are dropped too, and the remaining columns get compact types.
+    """
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return df
+    df['timestamp'] = pd.to_datetime(df['received_at'], format='ISO8601', errors='coerce')
+    nested = [name for name in df.columns
+              if df[name].dtype == object and df[name].map(lambda v: isinstance(v, (dict, list))).any()]
+    df = df.drop(columns=nested + ['received_at'])
+    for name in ALERT_CATEGORIES:
+        if name in df.columns:
+            df[name] = df[name].astype('category')
+    for name in ALERT_VALUES:
+        if name in df.columns:
+            df[name] = pd.to_numeric(df[name], errors='coerce').astype(np.float32)
+    for name in ('first_seen', 'last_seen'):
+        if name in df.columns:
+            df[name] = pd.to_datetime(df[name], format='ISO8601', errors='coerce')
+    if 'count' in df.columns:
+        df['count'] = pd.to_numeric(df['count'], errors='coerce').astype('Int32')
+    if 'seq' in df.columns:
+        df['seq'] = pd.to_numeric(df['seq'], errors='coerce').astype('Int64')
+    if 'acknowledged' in df.columns:
+        df['acknowledged'] = df['acknowledged'].fillna(False).astype(bool)
+    return df
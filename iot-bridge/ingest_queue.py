@@ -0,0 +1,250 @@
+# ingest_queue.py
+import base64
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import zlib
+
+from payload_codec import device_id
+
+logger = logging.getLogger(__name__)
+
+# Backpressure policies for a full partition
+BLOCK = "block"              # paho thread waits for room
+DROP_OLDEST = "drop-oldest"  # discard the oldest queued message
+SPILL = "spill"              # append to an on-disk overflow file
+POLICIES = (BLOCK, DROP_OLDEST, SPILL)
+
+# Cheap device_id lookup on the raw payload so the paho thread never runs json.loads
+# (MessagePack payloads carry it as their first field, see payload_codec.device_id)
+DEVICE_ID_PATTERN = re.compile(rb'"device_id"\s*:\s*"([^"]*)"')
+
+_STOP = object()
+
+
+def partition_key(topic, payload):
+    """Key that decides which worker handles a message (device_id, else topic)"""
+    key = device_id(payload)
+    if key is not None:
+        return key
+    match = DEVICE_ID_PATTERN.search(payload)
+    if match:
+        return match.group(1)
+    return topic.encode('utf-8')
+
+
+class SpillFile:
+    """Append-only overflow file read back in FIFO order"""
+
+    def __init__(self, path):
+        self.path = path
+        self._read_offset = 0
+        self._file = open(path, 'a+b')
+        # Anything left over from a previous run is still waiting to be handled
+        self._file.seek(0)
+        self.count = sum(1 for _ in self._file)
+
+    def append(self, topic, payload, token=None):
+        line = json.dumps({
+            'topic': topic,
+            'payload': base64.b64encode(payload).decode('ascii'),
+            'token': token
+        })
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(line.encode('utf-8') + b'\n')
+        self.count += 1
+
+    def pop(self):
+        if self.count == 0:
+            return None
+        self._file.flush()
+        self._file.seek(self._read_offset)
+        line = self._file.readline()
+        self._read_offset = self._file.tell()
+        self.count -= 1
+        if self.count == 0:
+            # Fully drained, start the file over
+            self._file.truncate(0)
+            self._read_offset = 0
+        item = json.loads(line)
+        return item['topic'], base64.b64decode(item['payload']), item.get('token')
+
+    def close(self):
+        self._file.close()
+
+
+class _Partition:
+    def __init__(self, maxsize, spill_path):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.lock = threading.Lock()
+        self.spill = SpillFile(spill_path) if spill_path else None
+        self.spilling = self.spill is not None and self.spill.count > 0
+
+
+class IngestQueue:
+    """Bounded queue between the paho network thread and a pool of workers.
+
+    Messages are partitioned by device_id so every device is always handled
+    by the same worker, which keeps devices_latest and device_heartbeats
+    overwrites in arrival order. `maxsize` is the total bound, split evenly
+    across the workers. The handler is called as handler(topic, payload, token);
+    tokens of discarded messages are passed to `on_drop`.
+    """
+
+    def __init__(self, handler, workers=4, maxsize=10000, policy=BLOCK, spill_dir="spill", on_drop=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+
+        self.handler = handler
+        self.on_drop = on_drop
+        self.policy = policy
+        self.maxsize = maxsize
+
+        per_partition = max(1, maxsize // workers)
+        if policy == SPILL:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._partitions = [
+            _Partition(per_partition, os.path.join(spill_dir, f"partition-{i}.jsonl") if policy == SPILL else None)
+            for i in range(workers)
+        ]
+        self._threads = []
+
+        self._stats_lock = threading.Lock()
+        self.high_water = 0
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.errors = 0
+
+    def put(self, topic, payload, token=None):
+        """Hand a raw MQTT message to its worker, applying the backpressure policy"""
+        key = partition_key(topic, payload)
+        part = self._partitions[zlib.crc32(key) % len(self._partitions)]
+        item = (topic, payload, token)
+
+        if self.policy == BLOCK:
+            part.queue.put(item)
+        elif self.policy == DROP_OLDEST:
+            with part.lock:
+                while True:
+                    try:
+                        part.queue.put_nowait(item)
+                        break
+                    except queue.Full:
+                        try:
+                            dropped = part.queue.get_nowait()
+                            with self._stats_lock:
+                                self.dropped += 1
+                            if self.on_drop is not None and dropped[2] is not None:
+                                self.on_drop([dropped[2]])
+                        except queue.Empty:
+                            pass
+        else:
+            with part.lock:
+                # Once a partition spills, everything after it spills too until
+                # the file is drained, so a device's messages stay in order
+                if not part.spilling:
+                    try:
+                        part.queue.put_nowait(item)
+                    except queue.Full:
+                        part.spilling = True
+                if part.spilling:
+                    part.spill.append(*item)
+                    with self._stats_lock:
+                        self.spilled += 1
+
+        with self._stats_lock:
+            self.enqueued += 1
+            depth = self._depth()
+            if depth > self.high_water:
+                self.high_water = depth
+
+    def _depth(self):
+        depth = 0
+        for part in self._partitions:
+            depth += part.queue.qsize()
+            if part.spill is not None:
+                depth += part.spill.count
+        return depth
+
+    def depth(self):
+        """Messages waiting in memory plus messages spilled to disk"""
+        return self._depth()
+
+    def start(self):
+        for i, part in enumerate(self._partitions):
+            thread = threading.Thread(target=self._work, args=(part,), name=f"ingest-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"🧵 Started {len(self._threads)} ingest workers (queue {self.maxsize}, policy {self.policy})")
+
+    def stop(self, timeout=None):
+        """Let the workers finish what is queued, then stop them"""
+        for part in self._partitions:
+            part.queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        for part in self._partitions:
+            if part.spill is not None:
+                part.spill.close()
+
+    def _next(self, part):
+        if part.spill is None:
+            return part.queue.get()
+
+        while True:
+            try:
+                if part.spilling:
+                    return part.queue.get_nowait()
+                return part.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+            with part.lock:
+                # Queue is empty, so everything left in the spill file is next in line
+                if part.spilling:
+                    item = part.spill.pop()
+                    if part.spill.count == 0:
+                        part.spilling = False
+                    if item is not None:
+                        return item
+
+    def _work(self, part):
+        while True:
+            item = self._next(part)
+            if item is _STOP:
+                break
+            self._handle(*item)
+
+        # Spilled messages queued behind the stop marker still get handled
+        if part.spill is not None:
+            with part.lock:
+                while part.spill.count:
+                    self._handle(*part.spill.pop())
+                part.spilling = False
+
+    def _handle(self, topic, payload, token):
+        try:
+            self.handler(topic, payload, token)
+        except Exception as e:
+            with self._stats_lock:
+                self.errors += 1
+            logger.error(f"❌ Worker failed on [{topic}]: {e}")
+        with self._stats_lock:
+            self.processed += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'depth': self._depth(),
+                'high_water': self.high_water,
+                'enqueued': self.enqueued,
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'spilled': self.spilled,
+                'errors': self.errors,
+            }
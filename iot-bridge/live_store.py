@@ -0,0 +1,128 @@
+# live_store.py
+# Firestore query results kept in memory by on_snapshot listeners, for the dashboard:
+# one process-wide LiveStore serves every session, so the number of open tabs no
+# longer multiplies the polling reads, and a reading shows up as soon as the
+# listener delivers it instead of when a cache TTL runs out.
+import logging
+import threading
+import time
+
+import pandas as pd
+
+from schema import TIMESTAMP_FLOOR
+
+logger = logging.getLogger(__name__)
+
+
+class LiveTable:
+    """The documents of one query, kept current by an on_snapshot listener.
+
+    Listener callbacks only swap in the new rows (the listener thread must
+    not block). frame() builds a DataFrame from them at most once per
+    change, through `build(rows)`, and every caller shares that build until
+    the next change. A closed listener (Firestore closes the stream on
+    errors it cannot retry) is attached again on the next frame().
+    """
+
+    def __init__(self, name, query, build=None, key='id'):
+        self.name = name
+        self.query = query
+        self.build = build
+        self.key = key
+
+        self._rows = []
+        self._version = 0
+        self._built_version = -1
+        self._frame = None
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._ready = threading.Event()
+        self._watch = None
+
+        self.updated_at = None
+        self.snapshots = 0
+        self.changes = 0
+        self._listen()
+
+    def _listen(self):
+        self._ready.clear()
+        self._watch = self.query.on_snapshot(self._on_snapshot)
+
+    def _on_snapshot(self, docs, changes, read_time):
+        rows = []
+        for doc in docs:
+            row = doc.to_dict()
+            row[self.key] = doc.id
+            rows.append(row)
+        with self._lock:
+            self._rows = rows
+            self._version += 1
+            self.updated_at = time.time()
+            self.snapshots += 1
+            self.changes += len(changes)
+            self._changed.notify_all()
+        self._ready.set()
+
+    def _active(self):
+        # google-cloud-firestore's Watch has is_active; the fake's watches stay open
+        return getattr(self._watch, 'is_active', True)
+
+    @property
+    def version(self):
+        return self._version
+
+    def wait(self, version, timeout):
+        """Block until the table is past version (or timeout); returns the current version"""
+        with self._lock:
+            self._changed.wait_for(lambda: self._version > version, timeout)
+            return self._version
+
+    def frame(self, timeout=10.0):
+        """The rows as a DataFrame, shared until the next change; callers get a copy"""
+        if not self._active():
+            logger.warning(f"⚠️ {self.name} listener closed, attaching it again")
+            self._listen()
+        if not self._ready.wait(timeout):
+            raise TimeoutError(f"no {self.name} snapshot after {timeout}s")
+
+        with self._lock:
+            if self._built_version != self._version:
+                build = self.build if self.build is not None and self._rows else pd.DataFrame
+                df = build(self._rows)
+                self._frame, self._built_version = df, self._version
+            return self._frame.copy()
+
+    def close(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+
+    def stats(self):
+        with self._lock:
+            return {'rows': len(self._rows), 'snapshots': self.snapshots, 'changes': self.changes,
+                    'updated_at': self.updated_at}
+
+
+class LiveStore:
+    """Listeners on the newest sensor_readings, the active alerts and every device heartbeat"""
+
+    def __init__(self, db, build_sensors=None, build_alerts=None, sensor_rows=1000, alert_rows=500):
+        # Version 2 timestamps only: legacy ISO strings would sort first (schema.TIMESTAMP_FLOOR)
+        readings = db.collection('sensor_readings').where('received_at', '>=', TIMESTAMP_FLOOR) \
+            .order_by('received_at', direction='DESCENDING')
+        active = db.collection('alerts').where('alert_status', '==', 'active') \
+            .order_by('received_at', direction='DESCENDING')
+
+        self.sensor_rows = sensor_rows
+        self.alert_rows = alert_rows
+        self.sensors = LiveTable('sensor_readings', readings.limit(sensor_rows), build_sensors)
+        # Alert history is loaded by date range (range_query.py), not listened to
+        self.active_alerts = LiveTable('active alerts', active.limit(alert_rows), build_alerts)
+        self.heartbeats = LiveTable('device_heartbeats', db.collection('device_heartbeats'), key='device_id')
+        self.tables = (self.sensors, self.active_alerts, self.heartbeats)
+
+    def close(self):
+        for table in self.tables:
+            table.close()
+
+    def stats(self):
+        return {table.name: table.stats() for table in self.tables}
@@ -0,0 +1,183 @@
+# metrics.py
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Prometheus' default buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=(), fn=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.fn = fn  # called at scrape time instead of tracking values
+        self._values = {}  # label values -> value
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def value(self, *label_values):
+        if self.fn is not None:
+            return self.fn()
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def samples(self):
+        if self.fn is not None:
+            return [(self.name, (), self.fn())]
+        with self._lock:
+            if not self.labels and not self._values:
+                return [(self.name, (), 0)]
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, value in self.samples():
+            lines.append(f"{name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic count, optionally split by label values"""
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down; usually read from `fn` at scrape time"""
+    kind = "gauge"
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets"""
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        with self._lock:
+            self._sum += value
+            self._count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+
+    def samples(self):
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        samples = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            samples.append((f"{self.name}_bucket", (('le', _format_value(float(bound))),), cumulative))
+        samples.append((f"{self.name}_bucket", (('le', "+Inf"),), count))
+        samples.append((f"{self.name}_sum", (), total))
+        samples.append((f"{self.name}_count", (), count))
+        return samples
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, extra, value in self.samples():
+            lines.append(f"{name}{_format_labels((), (), extra)} {_format_value(value)}")
+        return lines
+
+
+class DeviceLag:
+    """Device-to-store lag from device timestamps that are millis() since boot.
+
+    The firmware's timestamp has no wall clock, so the boot time of each
+    (device, boot_id) is estimated as the earliest received_at - timestamp
+    seen. The lag of a message is how much later than that it arrived, i.e.
+    broker, network and bridge delay above the best case so far.
+    """
+
+    def __init__(self, max_devices=10000):
+        self.max_devices = max_devices
+        self._boot = {}  # (device_id, boot_id) -> estimated boot time, epoch seconds
+        self._lock = threading.Lock()
+
+    def lag(self, device_id, boot_id, timestamp_ms, received):
+        """Seconds between the device sending the message and `received` (epoch seconds)"""
+        if not isinstance(timestamp_ms, (int, float)) or isinstance(timestamp_ms, bool):
+            return None
+        sent_since_boot = timestamp_ms / 1000.0
+        if sent_since_boot > 1e9:
+            return max(0.0, received - sent_since_boot)  # already an epoch timestamp
+
+        key = (device_id, boot_id)
+        boot = received - sent_since_boot
+        with self._lock:
+            known = self._boot.get(key)
+            if known is None or boot < known:
+                if known is None and len(self._boot) >= self.max_devices:
+                    self._boot.clear()
+                self._boot[key] = known = boot
+        return boot - known
+
+
+def render():
+    """All registered metrics in the Prometheus text format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes would flood the bridge log
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """Serve /metrics on a background thread; returns the server"""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    logger.info(f"📊 Metrics at http://{host}:{port}/metrics")
+    return server
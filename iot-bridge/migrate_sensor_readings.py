@@ -0,0 +1,137 @@
+# migrate_sensor_readings.py
+# Rewrites sensor_readings documents stored before schema_version 2 (nested `sensors`,
+# local-time ISO `received_at`, device millis() in `timestamp`) in place into the flat,
+# typed layout the bridge writes now (schema.py). Document IDs do not change and
+# migrated documents are skipped, so the tool can be interrupted and run again.
+#   python migrate_sensor_readings.py --dry-run
+#   python migrate_sensor_readings.py --workers 8 --timezone Asia/Kuala_Lumpur
+# --timezone is the zone the bridge VM wrote received_at in (default: this machine's).
+import argparse
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from zoneinfo import ZoneInfo
+
+import mqtt_firebase_bridge as bridge
+from firestore_writer import MAX_BATCH_OPS
+from schema import upgrade_document
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "sensor_readings"
+DOCUMENT_ID = "__name__"  # what FieldPath.document_id() stands for
+
+
+def pages(query, page_size):
+    """Every document of a query ordered by document ID, page_size at a time"""
+    last = None
+    while True:
+        page_query = query.limit(page_size)
+        if last is not None:
+            page_query = page_query.start_after(last)
+        page = list(page_query.stream())
+        if not page:
+            return
+        yield page
+        last = page[-1]
+        if len(page) < page_size:
+            return
+
+
+class Migration:
+    """Upgrades a collection, one WriteBatch per page of documents.
+
+    The collection is split with a partition query, and each worker thread
+    reads and rewrites its own range of document IDs.
+    """
+
+    def __init__(self, db, source_tz=None, dry_run=False):
+        self.db = db
+        self.source_tz = source_tz
+        self.dry_run = dry_run
+        self._lock = threading.Lock()
+        self.scanned = 0
+        self.migrated = 0
+        self.skipped = 0
+        self.unreadable = 0
+        self.failed = 0
+
+    def migrate_page(self, page):
+        batch = self.db.batch()
+        migrated = skipped = unreadable = 0
+        for snapshot in page:
+            try:
+                doc = upgrade_document(snapshot.to_dict(), self.source_tz)
+            except ValueError as e:
+                logger.warning(f"⚠️  Skipping {snapshot.id}: {e}")
+                unreadable += 1
+                continue
+            if doc is None:
+                skipped += 1
+                continue
+            batch.set(snapshot.reference, doc)  # replaces the document: the nested maps go away
+            migrated += 1
+
+        failed = 0
+        if migrated and not self.dry_run:
+            try:
+                batch.commit()
+            except Exception as e:
+                logger.error(f"❌ Commit of {migrated} documents from {page[0].id} failed: {e}")
+                failed, migrated = migrated, 0
+
+        with self._lock:
+            self.scanned += len(page)
+            self.migrated += migrated
+            self.skipped += skipped
+            self.unreadable += unreadable
+            self.failed += failed
+
+    def migrate_range(self, query, page_size):
+        for page in pages(query, page_size):
+            self.migrate_page(page)
+            logger.info(f"🔁 Scanned {self.scanned}, migrated {self.migrated}")
+
+    def run(self, collection_name, workers=4, page_size=MAX_BATCH_OPS):
+        # A collection group query also covers the per-device sensor_readings
+        # subcollections (SENSOR_STORAGE = "devices"); those are written as version 2
+        if workers > 1:
+            queries = [partition.query()
+                       for partition in self.db.collection_group(collection_name).get_partitions(workers)]
+        else:
+            queries = [self.db.collection(collection_name).order_by(DOCUMENT_ID)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for future in [pool.submit(self.migrate_range, query, page_size) for query in queries]:
+                future.result()
+
+    def stats(self):
+        with self._lock:
+            return {'scanned': self.scanned, 'migrated': self.migrated, 'already_v2': self.skipped,
+                    'unreadable': self.unreadable, 'failed': self.failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade sensor_readings to the flat schema_version 2 layout")
+    parser.add_argument('--collection', default=COLLECTION)
+    parser.add_argument('--workers', type=int, default=4, help="ranges of document IDs migrated in parallel")
+    parser.add_argument('--page-size', type=int, default=MAX_BATCH_OPS, help="documents per read and per batch")
+    parser.add_argument('--timezone', help="zone of the old local-time received_at strings, e.g. Asia/Kuala_Lumpur")
+    parser.add_argument('--dry-run', action='store_true', help="read and convert, write nothing")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    db = bridge.init_firebase()
+
+    migration = Migration(db, source_tz=ZoneInfo(args.timezone) if args.timezone else None, dry_run=args.dry_run)
+    started = time.perf_counter()
+    migration.run(args.collection, workers=args.workers,
+                  page_size=min(args.page_size, MAX_BATCH_OPS))
+    elapsed = time.perf_counter() - started
+    stats = migration.stats()
+    logger.info(f"✅ {'Dry run' if args.dry_run else 'Migration'} done in {elapsed:.1f}s "
+                f"({stats['scanned'] / elapsed if elapsed else 0:.0f} docs/s): {stats}")
+
+
+if __name__ == "__main__":
+    main()
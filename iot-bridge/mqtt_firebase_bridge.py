@@ -3,10 +3,25 @@
 # mqtt_firebase_bridge.py
 import paho.mqtt.client as mqtt
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import firebase_admin
 from firebase_admin import credentials, firestore
 import logging
+import signal
+import threading
+import time
+import metrics
+from firestore_writer import BatchWriter, Coalescer
+from ingest_queue import IngestQueue
+from spool import Spool, SpoolReplayer
+from dedup import DedupCache, message_id
+from rollups import RollupAggregator
+from alert_engine import AlertEngine, rules_from_thresholds
+from alert_episodes import EpisodeCompactor
+from topic_router import Route, TopicRouter, require_object
+from payload_codec import PayloadError, parse_payload
+from schema import SENSOR_STORAGE, normalize_reading, reading_collection
+from sensor_buckets import SensorBuckets
 
 # Firebase Configuration
 CRED_PATH = "firebase-key.json"
@@ -18,15 +33,79 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize Firebase
-try:
-    cred = credentials.Certificate(CRED_PATH)
-    firebase_admin.initialize_app(cred)
-    db = firestore.client()
-    logger.info("✅ Firebase initialized successfully")
-except Exception as e:
-    logger.error(f"❌ Firebase initialization failed: {e}")
-    exit(1)
+def init_firebase():
+    """Initialize Firebase and return the Firestore client, exit if that fails"""
+    try:
+        cred = credentials.Certificate(CRED_PATH)
+        firebase_admin.initialize_app(cred)
+        db = firestore.client()
+        logger.info("✅ Firebase initialized successfully")
+        return db
+    except Exception as e:
+        logger.error(f"❌ Firebase initialization failed: {e}")
+        exit(1)
+
+# Local write-ahead spool: every message is appended here before it is processed,
+# and replayed to Firestore in batches after an outage or a restart
+# SPOOL_FSYNC: "always", "interval" (every SPOOL_FSYNC_INTERVAL seconds) or "never"
+SPOOL_DIR = "spool"
+SPOOL_SEGMENT_BYTES = 16 * 1024 * 1024
+SPOOL_MAX_BYTES = 1024 * 1024 * 1024
+# QoS 1 messages are acked only after their fsync, and the broker stops sending once
+# max_inflight_messages are unacked, so keep the interval short
+SPOOL_FSYNC = "interval"
+SPOOL_FSYNC_INTERVAL = 0.05
+SPOOL_REPLAY_BATCH = 400
+
+# Batched Firestore writes: flush at BATCH_MAX_OPS writes (Firestore max 500)
+# or once the oldest pending write is BATCH_MAX_AGE seconds old
+BATCH_MAX_OPS = 500
+BATCH_MAX_AGE = 1.0
+
+# devices_latest and device_heartbeats only keep the newest state per device,
+# so each device's document is written at most once per COALESCE_INTERVAL seconds
+COALESCE_INTERVAL = 15.0
+
+# Ingest queue between the paho thread and the workers that do the Firestore work
+# QUEUE_POLICY: "block", "drop-oldest" or "spill" (overflow goes to SPILL_DIR)
+WORKER_COUNT = 4
+QUEUE_MAXSIZE = 10000
+QUEUE_POLICY = "block"
+SPILL_DIR = "spill"
+
+# Per-device minute/hour/day rollups in sensor_rollups, one merge write per
+# touched bucket every ROLLUP_FLUSH_INTERVAL seconds. A reading is counted once its
+# document has committed, and its message completes in the spool with the rollup write.
+ROLLUP_FLUSH_INTERVAL = 10.0
+
+# Server-side alert rules evaluated on every sensor reading. Thresholds come from
+# the Settings page (settings/alert_thresholds) and are picked up live.
+ALERT_SETTINGS_COLLECTION = "settings"
+ALERT_SETTINGS_DOC = "alert_thresholds"
+
+# Repeated device alerts with the same (device_id, alert_type, severity) within
+# ALERT_EPISODE_WINDOW seconds are folded into one episode document in alerts
+ALERT_EPISODE_WINDOW = 600.0
+ALERT_EPISODE_FLUSH_INTERVAL = 10.0
+
+# With SENSOR_STORAGE = "buckets" (schema.py) readings are appended to one document
+# per device per SENSOR_BUCKET_SECONDS, rewritten every SENSOR_BUCKET_FLUSH_INTERVAL
+# seconds and when the window ends. At one reading per 5s a 300s bucket holds 60
+# readings; a shorter flush interval makes the dashboard fresher but costs more writes
+SENSOR_BUCKET_SECONDS = 300
+SENSOR_BUCKET_FLUSH_INTERVAL = 300.0
+
+# Recently handled message IDs, so MQTT redeliveries are dropped before they cost a write
+DEDUP_CAPACITY = 100000
+
+# On SIGTERM/SIGINT the bridge stops consuming and gets SHUTDOWN_DEADLINE seconds to
+# commit what it holds (keep it under systemd's TimeoutStopSec, 90s by default).
+# Anything still uncommitted then stays in the spool and is replayed on the next start.
+SHUTDOWN_DEADLINE = 30.0
+
+# Local Prometheus-style metrics endpoint (http://METRICS_HOST:METRICS_PORT/metrics)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
 
 # MQTT Configuration
 MQTT_BROKER = "35.247.154.240"  # GCP Compute Engine
@@ -35,115 +114,470 @@ MQTT_USER = "sensor_node"
 MQTT_PASSWORD = "sensorpwd"
 MQTT_TLS = True  # Use SSL/TLS
 
-# Topics to subscribe
-TOPICS = [
-    "home/sensors/data",
-    "home/sensors/alerts",
-    "home/heartbeat"
-]
+# QoS 1 with a persistent session: the broker queues messages while the bridge is
+# down and redelivers anything we have not acked. The client ID must stay fixed.
+MQTT_CLIENT_ID = "mqtt-firebase-bridge"
+MQTT_QOS = 1
+MQTT_CLEAN_SESSION = False
+
+# Set by bridge_cluster.py in shared-subscription mode: topics are subscribed as
+# $share/<SHARE_GROUP>/<pattern> so the broker spreads them over the workers
+SHARE_GROUP = None
+
+# paho-mqtt 2.x can ack QoS 1 messages manually, after the spool has fsynced them.
+# paho-mqtt 1.x acks as soon as on_message returns, so on_message fsyncs first.
+MANUAL_ACK = hasattr(mqtt, 'CallbackAPIVersion')
+
+# Metrics; gauges are read from the pipeline when scraped
+MESSAGES = metrics.Counter('bridge_messages_total', "MQTT messages received", ('route',))
+MESSAGE_ERRORS = metrics.Counter('bridge_message_errors_total', "Messages that could not be processed",
+                                 ('route', 'reason'))
+DUPLICATES = metrics.Counter('bridge_duplicates_total', "MQTT redeliveries dropped by the dedup cache")
+BATCHED_READINGS = metrics.Counter('bridge_batched_readings_total', "Sensor readings that arrived in batched payloads")
+DECODE_SECONDS = metrics.Histogram('bridge_json_decode_seconds', "Time to decode a message payload",
+                                   buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005))
+WRITE_SECONDS = metrics.Histogram('bridge_firestore_commit_seconds', "Firestore batch commit latency")
+WRITE_OPS = metrics.Counter('bridge_firestore_writes_total', "Document writes committed to Firestore")
+DEVICE_LAG_SECONDS = metrics.Histogram('bridge_device_lag_seconds',
+                                       "Device-to-store lag above the best seen for that device boot",
+                                       buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+CONNECTS = metrics.Counter('bridge_mqtt_connects_total', "Successful connections to the MQTT broker")
+RECONNECTS = metrics.Counter('bridge_mqtt_reconnects_total', "Connections after the first one")
+CONNECTED = metrics.Gauge('bridge_mqtt_connected', "1 while connected to the MQTT broker")
+metrics.Gauge('bridge_queue_depth', "Messages waiting in the ingest queue, including spilled",
+              fn=lambda: ingest.depth() if ingest else 0)
+metrics.Gauge('bridge_writer_pending', "Writes waiting for the next batch commit",
+              fn=lambda: writer.pending() if writer else 0)
+metrics.Counter('bridge_firestore_failed_writes_total', "Writes in failed batch commits",
+                fn=lambda: writer.failed_ops if writer else 0)
+metrics.Gauge('bridge_spool_backlog', "Spooled messages not yet persisted to Firestore",
+              fn=lambda: spool.stats()['backlog'] if spool else 0)
+metrics.Gauge('bridge_spool_replaying', "1 while the spool replays after a failed write",
+              fn=lambda: int(spool.replay_from is not None) if spool else 0)
+metrics.Counter('bridge_queue_dropped_total', "Messages dropped by the ingest queue policy",
+                fn=lambda: ingest.stats()['dropped'] if ingest else 0)
+device_lag = metrics.DeviceLag()
+
+def on_commit(tokens):
+    # Committed readings go to the rollups, which complete their messages later
+    spool.done(rollups.committed(tokens, spool.is_live))
 
-# Collections in Firestore
-COLLECTIONS = {
-    "home/sensors/data": "sensor_readings",
-    "home/sensors/alerts": "alerts",
-    "home/heartbeat": "device_heartbeats"
-}
+def on_error(tokens):
+    spool.failed(rollups.failed(tokens))
+
+def on_flush(ops, seconds):
+    WRITE_SECONDS.observe(seconds)
+    WRITE_OPS.inc(amount=ops)
 
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         logger.info("✅ Connected to MQTT broker")
+        if CONNECTS.value():
+            RECONNECTS.inc()
+        CONNECTS.inc()
+        CONNECTED.set(1)
         # Subscribe to all topics
-        for topic in TOPICS:
-            client.subscribe(topic)
-            logger.info(f"   Subscribed to: {topic}")
+        if flags.get('session present'):
+            logger.info("   Resuming persistent session, broker will redeliver queued messages")
+        for topic in router.patterns():
+            if SHARE_GROUP:
+                topic = f"$share/{SHARE_GROUP}/{topic}"
+            client.subscribe(topic, qos=MQTT_QOS)
+            logger.info(f"   Subscribed to: {topic} (QoS {MQTT_QOS})")
     else:
         logger.error(f"❌ Connection failed with code: {rc}")
 
+def on_disconnect(client, userdata, rc):
+    CONNECTED.set(0)
+    if rc != 0:
+        logger.warning(f"⚠️  Disconnected from MQTT broker (rc={rc}), reconnecting")
+
+def accept(topic, payload, on_durable=None, sync=False):
+    """Spool a message and hand it off; on_durable runs once it is on disk"""
+    # While the spool is replaying after a failed write, the replayer handles it
+    MESSAGES.inc(router.route(topic).name)
+    seq, live = spool.append(topic, payload, on_durable=on_durable)
+    if sync:
+        spool.sync()
+
+    if live:
+        ingest.put(topic, payload, seq)
+
 def on_message(client, userdata, msg):
+    # Runs on the paho network thread: spool the message, then hand it off.
+    # The broker only gets its ack once the message is safely in the spool.
+    on_durable = None
+    if MANUAL_ACK and msg.qos > 0:
+        on_durable = lambda: client.ack(msg.mid, msg.qos)
+    accept(msg.topic, msg.payload, on_durable=on_durable, sync=msg.qos > 0 and not MANUAL_ACK)
+
+def expand_batch(data, msg_id, received):
+    """(reading, msg_id, taken) for each reading of a batched sensor payload.
+
+    The batch's device fields apply to every reading. The batch `timestamp`
+    is the device's millis() when it was sent, so a reading whose own
+    timestamp is earlier (buffered through a WiFi drop) is dated that much
+    before `received`.
+    """
+    common = {key: value for key, value in data.items() if key != 'readings'}
+    sent = data.get('timestamp')
+    for index, item in enumerate(data['readings']):
+        reading = dict(common)
+        reading.update(item)
+        taken = received
+        millis = item.get('timestamp')
+        if isinstance(sent, int) and isinstance(millis, int) and 0 <= sent - millis:
+            taken = received - timedelta(milliseconds=sent - millis)
+        # boot_id and seq make the usual ID; without them the index keeps readings apart
+        yield reading, message_id(reading, f"{msg_id}/{index}".encode('utf-8')), taken
+
+def persist_sensor_data(route, data, msg_id, received, tokens):
+    # Stored under the message ID, so redeliveries overwrite instead of duplicating.
+    # Flat typed fields and a UTC timestamp (schema.py), not the nested Arduino JSON.
+    # A batched payload (PUBLISH_BATCH_SIZE in arduino.cpp) is expanded into its
+    # readings, which are stored in one WriteBatch that completes the message.
+    device_id = data.get('device_id', 'unknown')
+    if 'readings' in data:
+        readings = list(expand_batch(data, msg_id, received))
+    else:
+        readings = [(data, msg_id, received)]
+    
+    stored = []
+    for reading_data, reading_id, taken in readings:
+        reading = normalize_reading(reading_data, taken)
+        stored.append((reading_id, reading))
+        alert_engine.evaluate(device_id, reading_data.get('sensors'), taken.timestamp(), reading_id)
+    
+    # The readings are counted in the rollups once the write that stores them commits
+    tokens = (rollups.stage(device_id, [(taken, reading_data.get('sensors'), reading_id)
+                                        for reading_data, reading_id, taken in readings], tokens),)
+    if buckets is not None:
+        # The tokens go with the newest reading, whose bucket is written last
+        for i, (reading_id, reading) in enumerate(stored):
+            buckets.add(reading, reading_id, tokens=tokens if i == len(stored) - 1 else ())
+    else:
+        writer.set_all([(reading_collection(db, route.collection, reading['device_id']).document(reading_id), reading)
+                        for reading_id, reading in stored], tokens=tokens)
+    
+    # Also update latest reading for this device
+    reading = stored[-1][1]
+    coalescer.set(db.collection('devices_latest').document(device_id), {
+        'last_reading': reading,
+        'last_updated': reading['received_at']
+    })
+    if len(stored) > 1:
+        BATCHED_READINGS.inc(amount=len(stored))
+        logger.info(f"💾 Saved {len(stored)} batched sensor readings from {device_id}")
+    else:
+        logger.info(f"💾 Saved sensor data from {device_id}")
+
+def persist_alert(route, data, msg_id, received, tokens):
+    # Repeats fold into an episode document (keyed by its first message ID)
+    episodes.add(db.collection(route.collection).document(msg_id), data, received, tokens=tokens)
+    logger.info(f"🚨 Saved alert: {data.get('alert_type', 'unknown')}")
+
+def persist_heartbeat(route, data, msg_id, received, tokens):
+    device_id = data.get('device_id', 'unknown')
+    coalescer.set(db.collection(route.collection).document(device_id), data, tokens=tokens)
+    logger.info(f"❤️  Updated heartbeat for {device_id}")
+
+def persist_unknown(route, data, msg_id, received, tokens):
+    writer.set(db.collection(route.collection).document(msg_id), data, tokens=tokens)
+    logger.warning(f"⚠️  Unknown topic, saved to {route.collection}")
+
+def emit_alert(device_id, rule, value, now, reading_id):
+    fired_at = datetime.fromtimestamp(now)
+    alert = {
+        'device_id': device_id,
+        'alert_type': rule.alert_type,
+        'severity': rule.severity,
+        'message': rule.message.format(value=round(value, 1)),
+        'value': value,
+        'threshold': rule.threshold,
+        'rule': rule.name,
+        'source': 'bridge',
+        'received_at': fired_at.isoformat(),
+        'alert_status': 'active',
+        'acknowledged': False
+    }
+    # Named after the reading that fired it, so a replayed reading rewrites the same alert
+    doc_id = f"{reading_id}_{rule.name}"
+    writer.set(db.collection('alerts').document(doc_id), alert)
+    logger.info(f"🔔 Rule {rule.name} fired for {device_id}: {alert['message']}")
+
+def on_thresholds_snapshot(doc_snapshot, changes, read_time):
+    for doc in doc_snapshot:
+        if doc.exists:
+            alert_engine.set_rules(rules_from_thresholds(doc.to_dict()))
+
+def validate_sensor_data(data):
+    problem = require_object(data)
+    if problem is None and not isinstance(data.get('sensors', {}), dict):
+        problem = "sensors is not an object"
+    if problem is None and 'readings' in data:
+        readings = data['readings']
+        if not isinstance(readings, list) or not readings:
+            problem = "readings is not a non-empty array"
+        elif len(readings) > BATCH_MAX_OPS:
+            problem = f"more than {BATCH_MAX_OPS} readings in one batch"
+        elif not all(isinstance(r, dict) and isinstance(r.get('sensors', {}), dict) for r in readings):
+            problem = "readings has an entry that is not a sensor reading object"
+    return problem
+
+# Devices send JSON or MessagePack on the same topics (payload_codec.py)
+SENSOR_DATA = Route('sensor_data', 'sensor_readings', persist_sensor_data, parse=parse_payload,
+                    validate=validate_sensor_data)
+ALERTS = Route('alerts', 'alerts', persist_alert, parse=parse_payload)
+HEARTBEAT = Route('heartbeat', 'device_heartbeats', persist_heartbeat, parse=parse_payload)
+UNKNOWN = Route('unknown', 'unknown_messages', persist_unknown)
+
+# Topic patterns to subscribe and the route for each. MQTT + and # wildcards work;
+# home/<home_id>/... lets one bridge serve many homes next to the single-home topics.
+ROUTES = [
+    ("home/sensors/data", SENSOR_DATA),
+    ("home/sensors/alerts", ALERTS),
+    ("home/heartbeat", HEARTBEAT),
+    ("home/+/sensors/data", SENSOR_DATA),
+    ("home/+/sensors/alerts", ALERTS),
+    ("home/+/heartbeat", HEARTBEAT),
+]
+
+router = TopicRouter(default=UNKNOWN)
+for pattern, route in ROUTES:
+    router.add(pattern, route)
+
+def process_message(topic, payload, token=None, received=None):
+    # The spool replayer took this message over after a failed commit. When the
+    # replayer hands a message in, received is the time it was spooled.
+    if token is not None and not spool.is_live(token):
+        return
+    tokens = (token,) if token is not None else ()
+    route = router.route(topic)
+
     try:
-        topic = msg.topic
-        payload = msg.payload.decode('utf-8')
-        data = json.loads(payload)
+        decode_started = time.perf_counter()
+        data = route.parse(payload)
+        DECODE_SECONDS.observe(time.perf_counter() - decode_started)
         
         logger.info(f"📨 Received message on [{topic}]")
         
-        # Add timestamp
-        data['received_at'] = datetime.now().isoformat()
-        data['topic'] = topic
-        
-        # Store in appropriate Firestore collection
-        collection_name = COLLECTIONS.get(topic, "unknown_messages")
+        problem = route.validate(data) if route.validate else None
+        if problem:
+            logger.error(f"❌ Invalid message on [{topic}]: {problem}")
+            MESSAGE_ERRORS.inc(route.name, 'invalid')
+            spool.done(tokens)
+            return
         
-        # For sensor data, use device_id + timestamp as document ID
-        if topic == "home/sensors/data":
-            device_id = data.get('device_id', 'unknown')
-            timestamp = data.get('timestamp', str(datetime.now().timestamp()))
-            doc_id = f"{device_id}_{timestamp}"
-            
-            # Store in sensor_readings collection
-            db.collection(collection_name).document(doc_id).set(data)
-            
-            # Also update latest reading for this device
-            db.collection('devices_latest').document(device_id).set({
-                'last_reading': data,
-                'last_updated': data['received_at']
-            })
-            
-            logger.info(f"💾 Saved sensor data from {device_id}")
+        # Deterministic ID: the same message always maps to the same document
+        msg_id = message_id(data, payload)
+        if token is None:
+            dedup.add(msg_id)  # replayed from the spool, must be written
+        elif dedup.seen(msg_id):
+            logger.info(f"♻️  Dropped duplicate {msg_id}")
+            DUPLICATES.inc()
+            spool.done(tokens)
+            return
         
-        # For alerts, store with auto-generated ID
-        elif topic == "home/sensors/alerts":
-            # Add alert status
-            data['alert_status'] = 'active'
-            data['acknowledged'] = False
-            
-            doc_ref = db.collection(collection_name).add(data)
-            logger.info(f"🚨 Saved alert: {data.get('alert_type', 'unknown')}")
-            
-        # For heartbeats
-        elif topic == "home/heartbeat":
-            device_id = data.get('device_id', 'unknown')
-            db.collection(collection_name).document(device_id).set(data)
-            logger.info(f"❤️  Updated heartbeat for {device_id}")
+        # Add timestamp: when it arrived, also for a message replayed later
+        if received is None:
+            received = datetime.now()
+        data['received_at'] = received.isoformat()
+        data['topic'] = topic
+        lag = device_lag.lag(data.get('device_id'), data.get('boot_id'), data.get('timestamp'),
+                             received.timestamp())
+        if lag is not None:
+            DEVICE_LAG_SECONDS.observe(lag)
         
-        else:
-            # Store unknown messages
-            db.collection(collection_name).add(data)
-            logger.warning(f"⚠️  Unknown topic, saved to {collection_name}")
+        route.persist(route, data, msg_id, received, tokens)
             
     except json.JSONDecodeError as e:
         logger.error(f"❌ JSON decode error: {e}")
+        MESSAGE_ERRORS.inc(route.name, 'json')
+        spool.done(tokens)  # nothing to persist, don't hold the checkpoint back
+    except PayloadError as e:
+        logger.error(f"❌ Payload decode error: {e}")
+        MESSAGE_ERRORS.inc(route.name, 'decode')
+        spool.done(tokens)
     except Exception as e:
         logger.error(f"❌ Error processing message: {e}")
+        MESSAGE_ERRORS.inc(route.name, 'exception')
+        spool.done(tokens)
 
-def main():
-    # Create MQTT client
-    client = mqtt.Client()
+# Pipeline components, built by setup()
+db = None
+spool = writer = coalescer = rollups = alert_engine = episodes = dedup = ingest = replayer = None
+buckets = None
+
+def setup(database, spool_dir=None, spill_dir=None, writer_class=BatchWriter):
+    """Build the pipeline around a Firestore client (a FakeFirestore works for load tests)"""
+    global db, spool, writer, coalescer, rollups, alert_engine, episodes, dedup, ingest, replayer, buckets
+    db = database
+    spool_dir = spool_dir or SPOOL_DIR
+    spill_dir = spill_dir or SPILL_DIR
+    spool = Spool(spool_dir, segment_bytes=SPOOL_SEGMENT_BYTES, max_bytes=SPOOL_MAX_BYTES,
+                  fsync=SPOOL_FSYNC, fsync_interval=SPOOL_FSYNC_INTERVAL)
+    writer = writer_class(db, max_ops=BATCH_MAX_OPS, max_age=BATCH_MAX_AGE,
+                          on_commit=on_commit, on_error=on_error, on_flush=on_flush)
+    coalescer = Coalescer(writer, interval=COALESCE_INTERVAL)
+    rollups = RollupAggregator(db, writer, flush_interval=ROLLUP_FLUSH_INTERVAL, spool=spool)
+    alert_engine = AlertEngine(rules_from_thresholds({}), emit_alert)
+    episodes = EpisodeCompactor(writer, window=ALERT_EPISODE_WINDOW, flush_interval=ALERT_EPISODE_FLUSH_INTERVAL)
+    buckets = None
+    if SENSOR_STORAGE == "buckets":
+        buckets = SensorBuckets(db, writer, window=SENSOR_BUCKET_SECONDS, flush_interval=SENSOR_BUCKET_FLUSH_INTERVAL)
+    dedup = DedupCache(DEDUP_CAPACITY)
+    ingest = IngestQueue(process_message, workers=WORKER_COUNT, maxsize=QUEUE_MAXSIZE,
+                         policy=QUEUE_POLICY, spill_dir=spill_dir, on_drop=spool.done)
+    replayer = SpoolReplayer(spool, process_message, writer, coalescer, batch_records=SPOOL_REPLAY_BATCH,
+                             buckets=buckets, rollups=rollups, episodes=episodes)
+
+def start():
+    """Start the background threads of the pipeline"""
+    writer.start()
+    coalescer.start()
+    rollups.start()
+    episodes.start()
+    if buckets is not None:
+        buckets.start()
+    ingest.start()
+    replayer.start()
+
+def stop():
+    """Drain the pipeline, persist what is pending and close the spool"""
+    ingest.stop()
+    coalescer.stop()
+    episodes.stop()
+    if buckets is not None:
+        buckets.stop()
+    # After everything that writes readings, so the rollups count them all
+    rollups.stop()
+    writer.stop()
+    replayer.stop()
+    spool.close()
+
+def drain_snapshot(queued):
+    """What the pipeline holds right now, for drain_summary()"""
+    return {
+        'queued': queued,
+        'coalesced': coalescer.stats()['buffered'],
+        'rollup_readings': rollups.stats()['staged_readings'],
+        'open_episodes': episodes.stats()['open_episodes'],
+        'open_buckets': buckets.stats()['open_buckets'] if buckets is not None else 0,
+        'pending_writes': writer.pending(),
+        'ops_written': writer.ops_written,
+        'failed_ops': writer.failed_ops,
+    }
+
+def drain_summary(before, completed, seconds):
+    """Log and return what a drain flushed and what it left in the spool"""
+    summary = {
+        'completed': completed,
+        'seconds': round(seconds, 2),
+        'queued_messages': before['queued'],
+        'coalesced_docs': before['coalesced'],
+        'rollup_readings': before['rollup_readings'],
+        'open_episodes': before['open_episodes'],
+        'open_buckets': before['open_buckets'],
+        'pending_writes': before['pending_writes'],
+        'writes_flushed': writer.ops_written - before['ops_written'],
+        'writes_failed': writer.failed_ops - before['failed_ops'],
+        'left_in_spool': spool.stats()['backlog'],
+    }
+    if completed and not summary['left_in_spool']:
+        logger.info(f"✅ Drained in {seconds:.1f}s: {summary}")
+    else:
+        logger.warning(f"⚠️  Drain left {summary['left_in_spool']} messages in the spool, "
+                       f"they are replayed on the next start: {summary}")
+    return summary
+
+def drain(deadline=None):
+    """Stop within `deadline` seconds (SHUTDOWN_DEADLINE) and report what was flushed or left in the spool"""
+    deadline = SHUTDOWN_DEADLINE if deadline is None else deadline
+    before = drain_snapshot(ingest.depth())
+    started = time.monotonic()
+    stopper = threading.Thread(target=stop, name="drain", daemon=True)
+    stopper.start()
+    stopper.join(deadline)
+    completed = not stopper.is_alive()
+    if not completed:
+        logger.error(f"❌ Pipeline did not drain within {deadline:.0f}s")
+        spool.sync()  # whatever was received is on disk for the replay
+    return drain_summary(before, completed, time.monotonic() - started)
+
+def handle_shutdown_signals(callback):
+    """Call callback() on SIGTERM (systemd, docker stop) as well as on SIGINT"""
+    def handler(signum, frame):
+        logger.info(f"👋 {signal.Signals(signum).name} received, shutting down...")
+        callback()
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+
+def create_client():
+    if MANUAL_ACK:
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=MQTT_CLIENT_ID,
+                             clean_session=MQTT_CLEAN_SESSION, manual_ack=True)
+    else:
+        client = mqtt.Client(client_id=MQTT_CLIENT_ID, clean_session=MQTT_CLEAN_SESSION)
     client.username_pw_set(MQTT_USER, MQTT_PASSWORD)
     
+    # Enable TLS if configured
+    if MQTT_TLS:
+        client.tls_set(ca_certs=None, certfile=None, keyfile=None, 
+                      cert_reqs=mqtt.ssl.CERT_REQUIRED, tls_version=mqtt.ssl.PROTOCOL_TLSv1_2)
+        client.tls_insecure_set(True)  # For development/testing
+    return client
+
+def watch_thresholds():
+    """Follow threshold changes from the Settings page"""
+    db.collection(ALERT_SETTINGS_COLLECTION).document(ALERT_SETTINGS_DOC).on_snapshot(on_thresholds_snapshot)
+
+def log_stats():
+    logger.info(f"🧵 Ingest queue stats: {ingest.stats()}")
+    logger.info(f"💽 Spool stats: {spool.stats()}")
+    logger.info(f"♻️  Dedup stats: {dedup.stats()}")
+    logger.info(f"📈 Rollup stats: {rollups.stats()}")
+    logger.info(f"🔔 Alert engine stats: {alert_engine.stats()}")
+    logger.info(f"🚨 Alert episode stats: {episodes.stats()}")
+    logger.info(f"🗜️  Coalescer stats: {coalescer.stats()}")
+    if buckets is not None:
+        logger.info(f"🪣 Sensor bucket stats: {buckets.stats()}")
+    logger.info(f"📦 Batch writer stats: {writer.stats()}")
+
+def main():
+    setup(init_firebase())
+    
     # Set callbacks
+    client = create_client()
     client.on_connect = on_connect
+    client.on_disconnect = on_disconnect
     client.on_message = on_message
     
+    stopping = threading.Event()
+    handle_shutdown_signals(stopping.set)
+
     try:
-        # Enable TLS if configured
-        if MQTT_TLS:
-            client.tls_set(ca_certs=None, certfile=None, keyfile=None, 
-                          cert_reqs=mqtt.ssl.CERT_REQUIRED, tls_version=mqtt.ssl.PROTOCOL_TLSv1_2)
-            client.tls_insecure_set(True)  # For development/testing
-        
         # Connect to MQTT broker
         client.connect(MQTT_BROKER, MQTT_PORT, 60)
         logger.info(f"🔗 Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT} (TLS: {MQTT_TLS})")
         
-        # Start loop
-        client.loop_forever()
+        watch_thresholds()
         
-    except KeyboardInterrupt:
-        logger.info("👋 Shutting down...")
-        client.disconnect()
+        # Start loop
+        metrics.start_http_server(METRICS_PORT, METRICS_HOST)
+        start()
+        client.loop_start()
     except Exception as e:
         logger.error(f"❌ MQTT connection error: {e}")
+        return
+
+    stopping.wait()
+    # Stop consuming: ack what is already spooled, then leave the persistent session,
+    # so the broker keeps everything else queued for the next start
+    spool.sync()
+    client.disconnect()
+    client.loop_stop()
+    drain()
+    log_stats()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,133 @@
+# payload_codec.py
+# Device payloads come as JSON or as MessagePack maps keyed by small integer field IDs
+# (FIELD_IDS), which firmware built with PAYLOAD_MSGPACK sends to save bandwidth. Both
+# decode to the same nested dict, so everything after parsing is format-blind.
+# The field IDs are a contract with arduino.cpp: never reuse or renumber one.
+import json
+
+try:
+    import msgpack
+except ImportError:  # only needed once devices send MessagePack
+    msgpack = None
+
+# Field ID -> (payload object or None for the top level, field name, scale). Scaled
+# fields are sent as integers (value * scale) and divided back here.
+FIELD_IDS = {
+    1: (None, 'device_id', None),
+    2: (None, 'device_type', None),
+    3: (None, 'location', None),
+    4: (None, 'timestamp', None),
+    5: (None, 'boot_id', None),
+    6: (None, 'seq', None),
+    7: (None, 'uptime_seconds', None),
+    10: ('sensors', 'air_quality_ppm', None),
+    11: ('sensors', 'water_leak', None),
+    12: ('sensors', 'motion', None),
+    13: ('sensors', 'light_level', None),
+    14: ('sensors', 'temperature_c', 100),
+    15: ('sensors', 'humidity_percent', 100),
+    16: ('sensors', 'battery_percent', 100),
+    20: ('system', 'wifi_connected', None),
+    21: ('system', 'mqtt_connected', None),
+    22: ('system', 'rssi', None),
+    23: ('system', 'publish_count', None),
+    24: ('system', 'error_count', None),
+    30: (None, 'readings', None),  # batched payloads: a list of maps of the fields above
+}
+
+_FIELD_NAMES = {(group, name): (field_id, scale) for field_id, (group, name, scale) in FIELD_IDS.items()}
+_GROUPS = {group for group, _, _ in FIELD_IDS.values() if group is not None}
+
+DEVICE_ID_FIELD = 1
+READINGS_FIELD = 30
+
+
+class PayloadError(ValueError):
+    """A payload that looks like MessagePack but cannot be decoded"""
+
+
+def is_msgpack(payload):
+    """True for a payload starting with a MessagePack map header (JSON starts with '{' or whitespace)"""
+    return bool(payload) and (0x80 <= payload[0] <= 0x8f or payload[0] in (0xde, 0xdf))
+
+
+def decode_fields(fields):
+    """Nested payload dict for a map of field IDs; string keys are kept as they are"""
+    data = {}
+    groups = {}
+    for key, value in fields.items():
+        spec = FIELD_IDS.get(key)
+        if spec is None:
+            data[str(key)] = value
+            continue
+        group, name, scale = spec
+        if scale and value.__class__ is int:
+            value = value / scale
+        elif key == READINGS_FIELD and isinstance(value, list):
+            value = [decode_fields(item) if isinstance(item, dict) else item for item in value]
+        if group is None:
+            data[name] = value
+        else:
+            target = groups.get(group)
+            if target is None:
+                target = groups[group] = data[group] = {}
+            target[name] = value
+    return data
+
+
+def parse_payload(payload):
+    """Route parser for JSON or MessagePack payloads"""
+    if not is_msgpack(payload):
+        return json.loads(payload.decode('utf-8'))
+    if msgpack is None:
+        raise PayloadError("MessagePack payload, but the msgpack package is not installed")
+    try:
+        fields = msgpack.unpackb(payload, raw=False, strict_map_key=False)
+    except (ValueError, msgpack.exceptions.ExtraData) as e:
+        raise PayloadError(f"bad MessagePack payload: {e}") from e
+    return decode_fields(fields)
+
+
+def encode_payload(data):
+    """MessagePack form of a nested payload dict, as the firmware writes it"""
+    return msgpack.packb(_encode_fields(data))
+
+
+def _encode_fields(data):
+    items = []
+    for key, value in data.items():
+        if key in _GROUPS and isinstance(value, dict):
+            items.extend(((key, name), inner) for name, inner in value.items())
+        else:
+            items.append(((None, key), value))
+
+    # Fields without an ID keep their name as the key
+    fields = {}
+    for (group, name), value in items:
+        field_id, scale = _FIELD_NAMES.get((group, name), (name, None))
+        if scale is not None and isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = round(value * scale)
+        elif field_id == READINGS_FIELD and isinstance(value, list):
+            value = [_encode_fields(item) for item in value]
+        fields[field_id] = value
+    return fields
+
+
+def device_id(payload):
+    """device_id of a MessagePack payload without decoding it, if it is the first field
+
+    Returns bytes, like the JSON lookup in ingest_queue.partition_key, or None.
+    """
+    if not is_msgpack(payload):
+        return None
+    pos = 1 if payload[0] <= 0x8f else 3 if payload[0] == 0xde else 5
+    if payload[pos:pos + 1] != bytes((DEVICE_ID_FIELD,)):
+        return None
+    header = payload[pos + 1] if len(payload) > pos + 1 else None
+    if header is not None and 0xa0 <= header <= 0xbf:
+        start, length = pos + 2, header & 0x1f
+    elif header == 0xd9 and len(payload) > pos + 2:
+        start, length = pos + 3, payload[pos + 2]
+    else:
+        return None
+    return payload[start:start + length]
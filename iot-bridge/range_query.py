@@ -0,0 +1,33 @@
+# range_query.py
+# Documents whose timestamp field falls in a date range, read page by page with
+# cursors: reads follow the size of the range instead of a fixed newest-N limit,
+# and a range longer than one page is still complete.
+from datetime import datetime, time, timedelta
+
+PAGE_SIZE = 1000
+
+
+def day_bounds(start_date, end_date):
+    """[start, end) naive local datetimes covering start_date through end_date"""
+    start = datetime.combine(start_date, time.min)
+    end = datetime.combine(end_date + timedelta(days=1), time.min)
+    return start, end
+
+
+def stream_range(query, start, end, field='received_at', page_size=PAGE_SIZE):
+    """Yield the documents with start <= field < end, oldest first, one page query at a time
+
+    Firestore range filters only match values of the bounds' type, so pass
+    datetimes for timestamp fields and ISO strings for string ones.
+    """
+    query = query.where(field, '>=', start).where(field, '<', end).order_by(field)
+    last = None
+    while True:
+        page_query = query.limit(page_size)
+        if last is not None:
+            page_query = page_query.start_after(last)
+        page = list(page_query.stream())
+        yield from page
+        if len(page) < page_size:
+            return
+        last = page[-1]
@@ -0,0 +1,327 @@
+# rollups.py
+import logging
+import threading
+from datetime import datetime
+
+from firebase_admin import firestore
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "sensor_rollups"
+# Map of the reading IDs a bucket holds that a spool replay could still bring back
+COUNTED_FIELD = "counted"
+
+# Numeric sensor fields aggregated in every rollup (name in the rollup -> Arduino field)
+ROLLUP_METRICS = {
+    'air_quality': 'air_quality_ppm',
+    'temperature': 'temperature_c',
+    'humidity': 'humidity_percent',
+    'light_level': 'light_level',
+    'battery': 'battery_percent',
+}
+
+# Bucket granularities and how a timestamp is truncated for each
+GRANULARITIES = {
+    'minute': lambda ts: ts.replace(second=0, microsecond=0),
+    'hour': lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    'day': lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+
+def rollup_doc_id(device_id, granularity, bucket_start):
+    return f"{device_id}_{granularity}_{bucket_start.strftime('%Y%m%dT%H%M')}"
+
+
+class _Bucket:
+    __slots__ = ('count', 'motion', 'leak', 'metrics')
+
+    def __init__(self):
+        self.count = 0
+        self.motion = 0
+        self.leak = 0
+        self.metrics = {}  # name -> [sum, sum_sq, min, max]
+
+    def add(self, sensors):
+        self.count += 1
+        if sensors.get('motion'):
+            self.motion += 1
+        if sensors.get('water_leak'):
+            self.leak += 1
+        for name, field in ROLLUP_METRICS.items():
+            value = sensors.get(field)
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            agg = self.metrics.get(name)
+            if agg is None:
+                self.metrics[name] = [value, value * value, value, value]
+            else:
+                agg[0] += value
+                agg[1] += value * value
+                if value < agg[2]:
+                    agg[2] = value
+                if value > agg[3]:
+                    agg[3] = value
+
+
+class StagedReadings:
+    """Token that rides on the write of a message's readings, so they are only
+    counted in the rollups once that write has committed"""
+    __slots__ = ('device_id', 'readings', 'tokens')
+
+    def __init__(self, device_id, readings, tokens):
+        self.device_id = device_id
+        self.readings = readings  # [(received_at, sensors, reading_id)]
+        self.tokens = tokens      # spool tokens of the message
+
+
+class _BucketWrite:
+    """Token of a bucket write: the reading IDs it adds, and the spool tokens riding on it"""
+    __slots__ = ('key', 'reading_ids', 'tokens')
+
+    def __init__(self, key, reading_ids, tokens):
+        self.key = key
+        self.reading_ids = reading_ids
+        self.tokens = tokens
+
+
+class RollupAggregator:
+    """Per-device minute/hour/day rollups of sensor readings, kept incrementally.
+
+    Every `flush_interval` seconds the readings committed since the last
+    flush are folded into one merge write per touched bucket through the
+    BatchWriter, using Increment for count/sum/sum_sq and Minimum/Maximum
+    for min/max. Mean and standard deviation follow from count, sum and sum_sq.
+
+    Increments are not idempotent, so a reading must be counted once: stage()
+    wraps a message's readings in a token for the write that stores them, and
+    the writer's callbacks pass through committed() and failed(). A reading is
+    staged for the rollups only once its write commits, and the message's
+    spool tokens ride on the rollup writes, so the spool checkpoint only
+    passes it once the rollups hold it. A failed write sends the messages
+    back to the spool replayer, so the readings staged for them are dropped
+    and counted again when they are replayed.
+
+    A replay can still bring back readings whose bucket writes committed: a
+    failed write rewinds the spool to the oldest unfinished message, and a
+    restart replays from the last saved checkpoint. With a `spool`, each
+    bucket write also records the IDs of the readings it adds under
+    COUNTED_FIELD, and a bucket skips the readings it already holds. An ID
+    is deleted from the document with the bucket's next write once the
+    saved spool checkpoint has passed it. Readings received before the
+    bridge started can only come from a replay, and the first of them to
+    reach a bucket reads the IDs an earlier run left there.
+    """
+
+    def __init__(self, db, writer, flush_interval=10.0, granularities=tuple(GRANULARITIES), spool=None):
+        self.db = db
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.granularities = granularities
+        self.spool = spool
+
+        self._staged = []   # StagedReadings committed since the last flush
+        self._counted = {}  # bucket key -> {reading_id: spool position}, written and not yet passed
+        self._passed = {}   # bucket key -> reading IDs to delete from the document with its next write
+        self._earlier = {}  # bucket key -> reading IDs an earlier run left in the document
+        self._started = datetime.now()
+        self._start_seq = spool.next_seq if spool is not None else 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # the replayer flushes too
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.readings = 0
+        self.duplicates = 0
+        self.writes = 0
+
+    def stage(self, device_id, readings, tokens=()):
+        """Token for the write of (received_at, sensors, reading_id) readings; pass it in that write's tokens"""
+        return StagedReadings(device_id, [(received_at, sensors, reading_id)
+                                          for received_at, sensors, reading_id in readings
+                                          if isinstance(sensors, dict)], tuple(tokens))
+
+    def committed(self, tokens, is_live=None):
+        """BatchWriter on_commit: stage the readings of committed writes, return the other tokens.
+
+        is_live(token) tells whether the live path still owns a message; one
+        the spool replayer took over is counted when it is replayed instead.
+        """
+        rest = []
+        staged = []
+        for token in tokens:
+            if isinstance(token, _BucketWrite):
+                rest.extend(token.tokens)
+            elif not isinstance(token, StagedReadings):
+                rest.append(token)
+            elif not token.readings:
+                # Nothing to count: the message is complete with its own write
+                rest.extend(token.tokens)
+            elif is_live is None or all(is_live(t) for t in token.tokens):
+                staged.append(token)
+        if staged:
+            with self._lock:
+                self._staged.extend(staged)
+        return rest
+
+    def failed(self, tokens):
+        """BatchWriter on_error: drop the staged readings, return the spool tokens of the failed writes"""
+        rest = []
+        with self._lock:
+            self._staged = []
+            for token in tokens:
+                if isinstance(token, _BucketWrite):
+                    # The bucket does not hold them: count them again when they are replayed
+                    counted = self._counted.get(token.key, {})
+                    for reading_id in token.reading_ids:
+                        counted.pop(reading_id, None)
+                    rest.extend(token.tokens)
+                elif isinstance(token, StagedReadings):
+                    rest.extend(token.tokens)
+                else:
+                    rest.append(token)
+        return rest
+
+    def _pass_checkpoint(self):
+        """Forget the reading IDs behind the saved spool checkpoint, which no replay brings back"""
+        checkpoint = self.spool.checkpoint
+        now = datetime.now()
+        with self._lock:
+            for key, counted in list(self._counted.items()):
+                passed = [reading_id for reading_id, position in counted.items() if position <= checkpoint]
+                for reading_id in passed:
+                    del counted[reading_id]
+                if passed:
+                    self._passed.setdefault(key, []).extend(passed)
+                if not counted:
+                    del self._counted[key]
+            # Only current buckets get another write to delete the IDs with
+            for key in list(self._passed):
+                if key[2] < GRANULARITIES[key[1]](now):
+                    del self._passed[key]
+            if self._started is not None and checkpoint >= self._start_seq:
+                self._started = None
+                self._earlier = {}
+
+    def _holds(self, key, reading_id, received_at):
+        if reading_id in self._counted.get(key, ()):
+            return True
+        if self._started is None or received_at >= self._started:
+            return False
+        earlier = self._earlier.get(key)
+        if earlier is None:
+            doc = self.db.collection(ROLLUP_COLLECTION).document(rollup_doc_id(*key)).get().to_dict() or {}
+            earlier = self._earlier[key] = set(doc.get(COUNTED_FIELD, ()))
+        return reading_id in earlier
+
+    def flush(self):
+        """Hand one merge write per touched bucket to the BatchWriter"""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._lock:
+            staged, self._staged = self._staged, []
+        if self.spool is not None:
+            self._pass_checkpoint()
+            position = self.spool.next_seq
+
+        pending = {}  # (device_id, granularity, bucket_start) -> _Bucket
+        added = {}    # bucket key -> IDs of the readings added to it
+        tokens = []
+        try:
+            for item in staged:
+                tokens.extend(item.tokens)
+                for received_at, sensors, reading_id in item.readings:
+                    counted = False
+                    for granularity in self.granularities:
+                        key = (item.device_id, granularity, GRANULARITIES[granularity](received_at))
+                        if self.spool is not None:
+                            if reading_id in added.get(key, ()) or self._holds(key, reading_id, received_at):
+                                continue
+                            added.setdefault(key, []).append(reading_id)
+                        bucket = pending.get(key)
+                        if bucket is None:
+                            bucket = pending[key] = _Bucket()
+                        bucket.add(sensors)
+                        counted = True
+                    if counted:
+                        self.readings += 1
+                    else:
+                        self.duplicates += 1
+        except Exception as e:
+            # Reading what an earlier run counted failed: keep the readings for the next flush
+            logger.error(f"📈 Rollup flush failed, keeping {len(staged)} messages for the next one: {e}")
+            with self._lock:
+                self._staged = staged + self._staged
+            return 0
+
+        if self.spool is not None:
+            if not pending and tokens:
+                # Every bucket held the readings already: nothing left to write for the messages
+                self.spool.done(tokens)
+            with self._lock:
+                for key, reading_ids in added.items():
+                    counted = self._counted.setdefault(key, {})
+                    for reading_id in reading_ids:
+                        counted[reading_id] = position
+
+        for key, bucket in pending.items():
+            device_id, granularity, bucket_start = key
+            metrics = {}
+            for name, (total, total_sq, low, high) in bucket.metrics.items():
+                metrics[name] = {
+                    'sum': firestore.Increment(total),
+                    'sum_sq': firestore.Increment(total_sq),
+                    'min': firestore.Minimum(low),
+                    'max': firestore.Maximum(high),
+                }
+            data = {
+                'device_id': device_id,
+                'granularity': granularity,
+                'bucket_start': bucket_start.isoformat(),
+                'count': firestore.Increment(bucket.count),
+                'motion_count': firestore.Increment(bucket.motion),
+                'leak_count': firestore.Increment(bucket.leak),
+                'metrics': metrics,
+                'updated_at': datetime.now().isoformat(),
+            }
+            write_tokens = tuple(tokens)
+            if self.spool is not None:
+                with self._lock:
+                    passed = self._passed.pop(key, ())
+                counted = {reading_id: firestore.DELETE_FIELD for reading_id in passed}
+                counted.update((reading_id, True) for reading_id in added[key])
+                data[COUNTED_FIELD] = counted
+                write_tokens = (_BucketWrite(key, added[key], write_tokens),)
+            doc_ref = self.db.collection(ROLLUP_COLLECTION).document(
+                rollup_doc_id(device_id, granularity, bucket_start))
+            self.writer.set(doc_ref, data, merge=True, tokens=write_tokens)
+
+        self.writes += len(pending)
+        return len(pending)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rollups", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        # Commit the readings still waiting in the writer, so they are in the last flush
+        self.writer.flush()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {'readings': self.readings, 'duplicates': self.duplicates, 'writes': self.writes,
+                    'staged_readings': sum(len(item.readings) for item in self._staged),
+                    'counted_ids': sum(len(counted) for counted in self._counted.values())}
@@ -0,0 +1,127 @@
+# schema.py
+# Layout of sensor_readings documents. The Arduino payload nests the readings under
+# `sensors` and `system` and its `timestamp` is millis() since boot; bridges before
+# schema_version 2 stored it like that, with `received_at` as a local-time ISO string.
+# Version 2 documents are flat and typed, with `received_at` a native UTC timestamp.
+import math
+from datetime import datetime, timezone
+
+SCHEMA_VERSION = 2
+
+# How the bridge stores readings and the dashboard loads them: "documents" (one
+# sensor_readings document per reading), "devices" (the same documents in a
+# sensor_readings subcollection per device, see reading_collection) or "buckets"
+# (sensor_buckets.py: one sensor_buckets document per device and time window,
+# holding columnar arrays)
+SENSOR_STORAGE = "documents"
+
+# Parent documents of the per-device subcollections: sensor_devices/<device_id>/sensor_readings
+SENSOR_DEVICE_COLLECTION = "sensor_devices"
+
+# Reading fields the dashboard filters or orders by. firestore_indexes.py exempts
+# every other field from indexing.
+INDEXED_READING_FIELDS = ('device_id', 'received_at')
+
+# Lower bound for queries ordered by received_at. Firestore sorts strings after
+# timestamps, so newest-first the ISO strings of documents from before version 2 would
+# come first; `received_at >= TIMESTAMP_FLOOR` only matches version 2 timestamps.
+TIMESTAMP_FLOOR = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Flat field -> (payload object, Arduino field, type)
+READING_FIELDS = {
+    'air_quality': ('sensors', 'air_quality_ppm', float),
+    'temperature': ('sensors', 'temperature_c', float),
+    'humidity': ('sensors', 'humidity_percent', float),
+    'light_level': ('sensors', 'light_level', int),
+    'battery': ('sensors', 'battery_percent', float),
+    'motion': ('sensors', 'motion', bool),
+    'leak_detected': ('sensors', 'water_leak', bool),
+    'rssi': ('system', 'rssi', int),
+    'wifi_connected': ('system', 'wifi_connected', bool),
+    'mqtt_connected': ('system', 'mqtt_connected', bool),
+    'publish_count': ('system', 'publish_count', int),
+    'error_count': ('system', 'error_count', int),
+}
+
+# Top-level payload fields kept as they are
+DEVICE_FIELDS = ('device_type', 'location', 'boot_id', 'seq', 'uptime_seconds', 'topic')
+
+
+def reading_collection(db, collection, device_id):
+    """Collection a device's readings are stored in under SENSOR_STORAGE.
+
+    A single collection keeps one received_at index that every device appends
+    to at its newest end, which Firestore cannot split past about 500 writes/s.
+    Under "devices" each device has its own collection, and so its own range of
+    that index.
+    """
+    if SENSOR_STORAGE == "devices":
+        return db.collection(SENSOR_DEVICE_COLLECTION).document(device_id).collection(collection)
+    return db.collection(collection)
+
+
+def _typed(value, kind):
+    """value as kind, or None if it is missing or not a usable number"""
+    if value is None or isinstance(value, (dict, list, str)):
+        return None
+    if kind is bool:
+        return bool(value)
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def normalize_reading(data, received_at):
+    """schema_version 2 document for a sensor payload received at `received_at` (naive = local time).
+
+    Fields the payload does not have (or has as something other than a
+    number or bool) are left out rather than stored as 0.
+    """
+    doc = {
+        'schema_version': SCHEMA_VERSION,
+        'device_id': str(data.get('device_id', 'unknown')),
+        'received_at': received_at.astimezone(timezone.utc),
+    }
+    device_millis = _typed(data.get('timestamp'), int)
+    if device_millis is not None:
+        doc['device_millis'] = device_millis
+    for field in DEVICE_FIELDS:
+        if data.get(field) is not None:
+            doc[field] = data[field]
+
+    for field, (group, source, kind) in READING_FIELDS.items():
+        values = data.get(group)
+        # Payloads that are already flat carry the Arduino name at the top level
+        value = values.get(source) if isinstance(values, dict) else data.get(source, data.get(field))
+        value = _typed(value, kind)
+        if value is not None:
+            doc[field] = value
+    return doc
+
+
+def parse_received_at(value, source_tz=None):
+    """Aware datetime for a stored received_at: a Firestore timestamp or a local-time ISO string.
+
+    Naive strings are read in `source_tz` (a tzinfo), or in this machine's
+    local time zone if it is None.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=source_tz) if source_tz is not None else value.astimezone()
+    return value
+
+
+def upgrade_document(doc, source_tz=None):
+    """schema_version 2 form of a stored sensor_readings document, or None if it needs no rewrite"""
+    if doc.get('schema_version', 1) >= SCHEMA_VERSION:
+        return None
+    received_at = parse_received_at(doc.get('received_at'), source_tz)
+    if received_at is None:
+        raise ValueError(f"unusable received_at {doc.get('received_at')!r}")
+    return normalize_reading(doc, received_at)
@@ -0,0 +1,209 @@
+# sensor_buckets.py
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from schema import READING_FIELDS, SCHEMA_VERSION
+
+logger = logging.getLogger(__name__)
+
+BUCKET_COLLECTION = "sensor_buckets"
+
+# Per-reading columns of a bucket document, next to one array per READING_FIELDS entry
+SAMPLE_COLUMNS = ('ids', 'received_at', 'device_millis')
+
+# Device metadata kept once per bucket, from its newest reading
+BUCKET_DEVICE_FIELDS = ('device_type', 'location', 'topic')
+
+
+def bucket_doc_id(device_id, bucket_start):
+    return f"{device_id}_{bucket_start.strftime('%Y%m%dT%H%M')}"
+
+
+class _Bucket:
+    __slots__ = ('doc_ref', 'start', 'end', 'ids', 'columns', 'device', 'tokens', 'dirty', 'last_write')
+
+    def __init__(self, doc_ref, start, end, now):
+        self.doc_ref = doc_ref
+        self.start = start
+        self.end = end
+        self.ids = set()
+        self.columns = {name: [] for name in SAMPLE_COLUMNS + tuple(READING_FIELDS)}
+        self.device = {}
+        self.tokens = []
+        self.dirty = False
+        self.last_write = now
+
+
+class SensorBuckets:
+    """Stores sensor readings as one document per device per `window` seconds.
+
+    A bucket document holds its readings as columnar arrays (ids,
+    received_at, device_millis and one array per schema field), so loading
+    N readings costs about N / readings-per-bucket document reads. The open
+    bucket is kept in memory and rewritten in full every `flush_interval`
+    seconds and once more when its window has passed. A bucket this process
+    did not start (it began before the bridge did, or was already closed)
+    goes to a separate part document instead of overwriting the earlier
+    one; readers drop the repeated IDs that a spool replay can leave across
+    parts.
+    """
+
+    def __init__(self, db, writer, window=300, flush_interval=300.0, grace=5.0):
+        self.db = db
+        self.writer = writer
+        self.window = window
+        self.flush_interval = flush_interval
+        self.grace = grace
+        self.started = datetime.now(timezone.utc)
+
+        self._buckets = {}  # (device_id, bucket_start) -> _Bucket
+        self._closed = {}   # (device_id, bucket_start) -> bucket end, for recently closed buckets
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.readings = 0
+        self.duplicates = 0
+        self.buckets = 0
+        self.writes = 0
+
+    def _bucket_start(self, received_at):
+        epoch = int(received_at.timestamp())
+        return datetime.fromtimestamp(epoch - epoch % self.window, timezone.utc)
+
+    def add(self, reading, msg_id, tokens=()):
+        """Append one schema_version 2 reading to its device's bucket"""
+        device_id = reading['device_id']
+        start = self._bucket_start(reading['received_at'])
+        key = (device_id, start)
+        with self._lock:
+            self.readings += 1
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                doc_id = bucket_doc_id(device_id, start)
+                if start < self.started or key in self._closed:
+                    doc_id = f"{doc_id}_{int(time.time() * 1000)}"
+                end = datetime.fromtimestamp(start.timestamp() + self.window, timezone.utc)
+                bucket = self._buckets[key] = _Bucket(
+                    self.db.collection(BUCKET_COLLECTION).document(doc_id), start, end, reading['received_at'])
+                self.buckets += 1
+
+            bucket.tokens.extend(tokens)
+            if msg_id in bucket.ids:
+                self.duplicates += 1
+                return
+            bucket.ids.add(msg_id)
+            columns = bucket.columns
+            columns['ids'].append(msg_id)
+            columns['received_at'].append(reading['received_at'])
+            columns['device_millis'].append(reading.get('device_millis'))
+            for field in READING_FIELDS:
+                columns[field].append(reading.get(field))
+            for field in BUCKET_DEVICE_FIELDS:
+                if field in reading:
+                    bucket.device[field] = reading[field]
+            bucket.dirty = True
+
+    def _write(self, device_id, bucket, now):
+        doc = {
+            'schema_version': SCHEMA_VERSION,
+            'device_id': device_id,
+            'bucket_start': bucket.start,
+            'bucket_seconds': self.window,
+            'count': len(bucket.columns['ids']),
+        }
+        doc.update(bucket.device)
+        # Copies: the lists keep growing after the write is queued
+        doc.update({name: list(values) for name, values in bucket.columns.items()})
+        self.writer.set(bucket.doc_ref, doc, tokens=tuple(bucket.tokens))
+        bucket.tokens = []
+        bucket.dirty = False
+        bucket.last_write = now
+        self.writes += 1
+
+    def flush(self, force=False, now=None):
+        """Write buckets that are due, and close the ones whose window has passed.
+
+        force writes every bucket with unwritten readings. `now` (an aware
+        datetime) is for replaying simulated time.
+        """
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            for key, bucket in list(self._buckets.items()):
+                closed = (now - bucket.end).total_seconds() >= self.grace
+                # A redelivery adds tokens without readings, and its tokens still need a write
+                due = force or closed or (now - bucket.last_write).total_seconds() >= self.flush_interval
+                if (bucket.dirty or bucket.tokens) and due:
+                    self._write(key[0], bucket, now)
+                if closed:
+                    del self._buckets[key]
+                    self._closed[key] = bucket.end
+            for key, end in list(self._closed.items()):
+                if (now - end).total_seconds() > self.window:
+                    del self._closed[key]
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sensor-buckets", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush(force=True)
+
+    def _run(self):
+        tick = min(1.0, self.grace)
+        while not self._stop.wait(tick):
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {'readings': self.readings, 'duplicates': self.duplicates, 'buckets': self.buckets,
+                    'writes': self.writes, 'open_buckets': len(self._buckets)}
+
+
+def recent_buckets(db, limit, per_page=20):
+    """Newest bucket documents, across devices, until they hold at least `limit` readings"""
+    query = db.collection(BUCKET_COLLECTION).order_by('bucket_start', direction='DESCENDING')
+    snapshots = []
+    readings = 0
+    last = None
+    while readings < limit:
+        page_query = query.limit(per_page)
+        if last is not None:
+            page_query = page_query.start_after(last)
+        page = list(page_query.stream())
+        for snapshot in page:
+            snapshots.append(snapshot)
+            readings += snapshot.to_dict().get('count', 0)
+        if len(page) < per_page:
+            break
+        last = page[-1]
+    return snapshots
+
+
+def bucket_columns(docs):
+    """Concatenate the arrays of bucket documents into one list per column.
+
+    Each reading also gets its bucket's device_id. Readings repeated across
+    the part documents of a bucket are kept once.
+    """
+    columns = {name: [] for name in ('device_id',) + SAMPLE_COLUMNS + tuple(READING_FIELDS)}
+    seen = set()
+    for doc in docs:
+        ids = doc.get('ids', [])
+        repeated = any(msg_id in seen for msg_id in ids)
+        keep = [msg_id not in seen for msg_id in ids] if repeated else None
+        seen.update(ids)
+        for name in SAMPLE_COLUMNS + tuple(READING_FIELDS):
+            values = doc.get(name) or [None] * len(ids)
+            columns[name].extend(values if keep is None else [v for v, k in zip(values, keep) if k])
+        columns['device_id'].extend([doc.get('device_id')] * (len(ids) if keep is None else sum(keep)))
+    return columns
@@ -0,0 +1,121 @@
+# sensor_store.py
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from frames import concat
+from schema import TIMESTAMP_FLOOR
+
+
+class SensorStore:
+    """The newest sensor_readings as a DataFrame, topped up incrementally.
+
+    The first refresh loads the newest `limit` documents. Later refreshes
+    only query documents whose received_at is past the watermark (the
+    newest received_at loaded), so they cost about one read per new
+    reading. The query reaches `overlap` seconds behind the watermark for
+    writes that commit after a newer one was read; those rows are matched
+    by document ID. When a refresh gets a full page of new rows there may
+    be more, so the older rows are dropped instead of being kept behind a
+    gap. A larger limit than loaded so far backfills older rows, and rows
+    past `max_rows` are evicted, oldest first. Documents from before
+    schema_version 2 are left out until migrate_sensor_readings.py has
+    rewritten them (see schema.TIMESTAMP_FLOOR).
+
+    `build(rows)` turns raw documents (dicts with their `id`) into a frame
+    of dashboard rows sorted newest first, like frames.readings_frame.
+    """
+
+    def __init__(self, db, build, collection='sensor_readings', max_rows=5000, overlap=5.0):
+        self.db = db
+        self.build = build
+        self.collection = collection
+        self.max_rows = max_rows
+        self.overlap = timedelta(seconds=overlap)
+
+        self._frame = None
+        self._watermark = None  # newest received_at loaded (an aware datetime)
+        self._oldest = None     # oldest received_at loaded
+        self._complete = False  # no older documents to backfill
+        self._lock = threading.Lock()
+
+        self.refreshes = 0
+        self.documents_read = 0
+
+    def _query(self):
+        return self.db.collection(self.collection).where('received_at', '>=', TIMESTAMP_FLOOR) \
+            .order_by('received_at', direction='DESCENDING')
+
+    def _load(self, query):
+        rows = []
+        for doc in query.stream():
+            row = doc.to_dict()
+            row['id'] = doc.id
+            rows.append(row)
+        self.documents_read += len(rows)
+        return rows
+
+    def _add(self, rows, newer):
+        # Timestamps from the bridge are datetimes; ISO strings are documents from
+        # before schema_version 2, which the watermark query cannot reach
+        times = [row['received_at'] for row in rows if isinstance(row.get('received_at'), datetime)]
+        if times and (self._watermark is None or max(times) > self._watermark):
+            self._watermark = max(times)
+        if not rows:
+            return
+
+        frame = self.build(rows)
+        if self._frame is not None and not self._frame.empty:
+            # Newer copies of a document win
+            parts = [frame, self._frame] if newer else [self._frame, frame]
+            frame = concat(parts).drop_duplicates('id', keep='first')
+            frame = frame.sort_values('timestamp', ascending=False, kind='stable')
+        self._frame = frame.head(self.max_rows).reset_index(drop=True)
+        if len(frame) > self.max_rows:
+            self._complete = False
+        # received_at is a UTC datetime64 column; NaT only for rows without a timestamp
+        oldest = self._frame['received_at'].min() if 'received_at' in self._frame else pd.NaT
+        self._oldest = None if pd.isna(oldest) else oldest.to_pydatetime()
+
+    def refresh(self, limit):
+        """Query what is new since the last refresh, and older rows if limit needs them"""
+        with self._lock:
+            self.refreshes += 1
+            limit = min(limit, self.max_rows)
+            if self._frame is None or self._watermark is None:
+                rows = self._load(self._query().limit(limit))
+                self._frame = None
+                self._complete = len(rows) < limit
+                self._add(rows, newer=True)
+                return
+
+            since = self._watermark - self.overlap
+            rows = self._load(self._query().where('received_at', '>', since).limit(limit))
+            if len(rows) == limit:
+                # Maybe more new readings than limit: the newest limit are enough for this
+                # call, but the rows kept so far would sit behind a gap, so start over from
+                # these and let later, larger limits backfill below them
+                self._frame = None
+                self._complete = False
+            self._add(rows, newer=True)
+
+            missing = limit - len(self._frame)
+            if missing > 0 and not self._complete and self._oldest is not None:
+                rows = self._load(self._query().where('received_at', '<', self._oldest).limit(missing))
+                self._complete = len(rows) < missing
+                self._add(rows, newer=False)
+
+    def frame(self, limit):
+        """The newest `limit` rows, refreshed first"""
+        self.refresh(limit)
+        with self._lock:
+            if self._frame is None:
+                return pd.DataFrame()
+            return self._frame.head(limit).copy()
+
+    def stats(self):
+        with self._lock:
+            return {'rows': 0 if self._frame is None else len(self._frame), 'refreshes': self.refreshes,
+                    'documents_read': self.documents_read,
+                    'watermark': self._watermark.isoformat() if self._watermark else None}
@@ -0,0 +1,423 @@
+# spool.py
+import bisect
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# fsync policies
+FSYNC_ALWAYS = "always"      # fsync after every append
+FSYNC_INTERVAL = "interval"  # fsync at most every fsync_interval seconds
+FSYNC_NEVER = "never"        # leave it to the OS
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER)
+
+# Record layout: body length, crc32 of receive time + body, topic length, receive
+# time (epoch seconds), then topic + payload
+_HEADER = struct.Struct('<IIHd')
+_RECEIVED = struct.Struct('<d')
+SEGMENT_SUFFIX = ".spool"
+# Segments written before the receive time was recorded, in the old record layout
+LEGACY_SEGMENT_SUFFIX = ".seg"
+CHECKPOINT_FILE = "checkpoint"
+
+
+def _checksum(received_at, body):
+    return zlib.crc32(body, zlib.crc32(_RECEIVED.pack(received_at)))
+
+
+class Spool:
+    """Append-only, segmented write-ahead log of raw MQTT messages.
+
+    Every message gets a sequence number when it is appended. While the
+    backend is healthy the bridge processes messages live and marks them
+    done once their Firestore commit succeeds. When a commit fails the spool
+    switches to replay mode: from the oldest unfinished message onwards,
+    messages are only appended, and a SpoolReplayer drains them to Firestore
+    in order once the backend is back. The checkpoint (everything before it
+    is persisted) is saved to disk, so a restart replays what was missed.
+    Each record keeps the time the message was received, so a replayed
+    message is dated when it arrived, not when it was replayed.
+    """
+
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024, max_bytes=1024 * 1024 * 1024,
+                 fsync=FSYNC_INTERVAL, fsync_interval=1.0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        self._lock = threading.Lock()
+        self._segments = []   # first sequence number of each segment, oldest first
+        self._sizes = {}      # first sequence number -> bytes on disk
+        self._live = set()    # appended, handed to the live path, not yet persisted
+        self._cursor = None   # (seq, segment, offset) where the last read stopped
+        self._awaiting = []   # on_durable callbacks waiting for the next fsync
+        self._unsynced = False
+        self._last_sync = time.monotonic()
+        self._last_checkpoint = 0.0
+
+        self.appended = 0
+        self.dropped = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+        # Anything between the checkpoint and the end of the log was never persisted
+        self.replay_from = self.checkpoint if self.checkpoint < self.next_seq else None
+        if self.replay_from is not None:
+            logger.warning(f"💽 Spool has {self.next_seq - self.checkpoint} unpersisted messages to replay")
+
+    def _path(self, first_seq):
+        return os.path.join(self.directory, f"{first_seq:016d}{SEGMENT_SUFFIX}")
+
+    def _recover(self):
+        self.checkpoint = 0
+        checkpoint_path = os.path.join(self.directory, CHECKPOINT_FILE)
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                self.checkpoint = int(f.read().strip() or 0)
+
+        legacy = [name for name in os.listdir(self.directory) if name.endswith(LEGACY_SEGMENT_SUFFIX)]
+        if legacy:
+            logger.warning(f"💽 Ignoring {len(legacy)} spool segments in the old record layout in "
+                           f"{self.directory}; replay them with the bridge version that wrote them")
+        for name in os.listdir(self.directory):
+            if name.endswith(SEGMENT_SUFFIX):
+                first_seq = int(name[:-len(SEGMENT_SUFFIX)])
+                self._segments.append(first_seq)
+                self._sizes[first_seq] = os.path.getsize(self._path(first_seq))
+        self._segments.sort()
+
+        if not self._segments:
+            self.next_seq = self.checkpoint
+            self._open_segment(self.next_seq)
+            return
+
+        # Count the records in the last segment and cut off a torn tail from a crash
+        last = self._segments[-1]
+        count, valid_bytes = 0, 0
+        with open(self._path(last), 'rb') as f:
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                length, crc, _, received_at = _HEADER.unpack(header)
+                body = f.read(length)
+                if len(body) < length or _checksum(received_at, body) != crc:
+                    break
+                count += 1
+                valid_bytes += _HEADER.size + length
+        if valid_bytes < self._sizes[last]:
+            logger.warning(f"💽 Truncating torn spool record at {self._path(last)}:{valid_bytes}")
+            with open(self._path(last), 'r+b') as f:
+                f.truncate(valid_bytes)
+            self._sizes[last] = valid_bytes
+
+        self.next_seq = last + count
+        self.checkpoint = min(max(self.checkpoint, self._segments[0]), self.next_seq)
+        self._file = open(self._path(last), 'ab')
+
+    def _open_segment(self, first_seq):
+        self._segments.append(first_seq)
+        self._sizes[first_seq] = 0
+        self._file = open(self._path(first_seq), 'ab')
+
+    def _rotate(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._open_segment(self.next_seq)
+        self._enforce_max_bytes()
+
+    def _enforce_max_bytes(self):
+        while sum(self._sizes.values()) > self.max_bytes and len(self._segments) > 1:
+            oldest, following = self._segments[0], self._segments[1]
+            lost = max(0, following - max(self.checkpoint, oldest))
+            os.remove(self._path(oldest))
+            del self._segments[0]
+            del self._sizes[oldest]
+
+            self.checkpoint = max(self.checkpoint, following)
+            if self.replay_from is not None and self.replay_from < following:
+                self.replay_from = following
+            self._live = {seq for seq in self._live if seq >= following}
+            if lost:
+                self.dropped += lost
+                logger.error(f"❌ Spool over {self.max_bytes} bytes, dropped {lost} unpersisted messages")
+
+    def append(self, topic, payload, on_durable=None, received_at=None):
+        """Write a message to the log. Returns (seq, live): live is False while replaying.
+
+        received_at (epoch seconds, now by default) is stored with the record.
+        on_durable is called once the record has been fsynced (per the fsync policy).
+        """
+        if received_at is None:
+            received_at = time.time()
+        topic_bytes = topic.encode('utf-8')
+        body = topic_bytes + payload
+        record = _HEADER.pack(len(body), _checksum(received_at, body), len(topic_bytes), received_at) + body
+
+        callbacks = ()
+        with self._lock:
+            if self._sizes[self._segments[-1]] and self._sizes[self._segments[-1]] + len(record) > self.segment_bytes:
+                self._rotate()
+            self._file.write(record)
+            self._sizes[self._segments[-1]] += len(record)
+
+            seq = self.next_seq
+            self.next_seq += 1
+            self.appended += 1
+
+            live = self.replay_from is None
+            if live:
+                self._live.add(seq)
+
+            if on_durable is not None:
+                self._awaiting.append(on_durable)
+            # Group commit: someone is waiting on this record, so sync now if the interval allows
+            if self.fsync == FSYNC_ALWAYS or (
+                    self._awaiting and time.monotonic() - self._last_sync >= self.fsync_interval):
+                callbacks = self._sync()
+            else:
+                self._unsynced = True
+
+        for callback in callbacks:
+            callback()
+        return seq, live
+
+    def _sync(self):
+        self._file.flush()
+        if self.fsync != FSYNC_NEVER:
+            os.fsync(self._file.fileno())
+        self._unsynced = False
+        self._last_sync = time.monotonic()
+
+        callbacks, self._awaiting = self._awaiting, []
+        return callbacks
+
+    def sync(self):
+        callbacks = ()
+        with self._lock:
+            if self._unsynced:
+                callbacks = self._sync()
+        for callback in callbacks:
+            callback()
+
+    def is_live(self, seq):
+        """True if the live path still owns this message (not handed to the replayer)"""
+        with self._lock:
+            return seq in self._live
+
+    def done(self, tokens):
+        """Mark messages as persisted (BatchWriter on_commit callback)"""
+        with self._lock:
+            for seq in tokens:
+                self._live.discard(seq)
+
+    def failed(self, tokens):
+        """A live commit failed (BatchWriter on_error callback): switch to replay mode"""
+        with self._lock:
+            if not any(seq in self._live for seq in tokens):
+                return
+            self.replay_from = min(self._live)
+            self._live.clear()
+        logger.warning(f"💽 Firestore write failed, spooling from message {self.replay_from} until it recovers")
+
+    def advance(self, seq):
+        """The replayer has persisted everything before seq"""
+        with self._lock:
+            if self.replay_from is None:
+                return
+            self.replay_from = seq
+            if seq >= self.next_seq:
+                self.replay_from = None
+                logger.info("💽 Spool replay caught up, back to live writes")
+
+    def committed_seq(self):
+        """Every message before this sequence number is persisted"""
+        with self._lock:
+            if self.replay_from is not None:
+                return self.replay_from
+            return min(self._live) if self._live else self.next_seq
+
+    def maintain(self):
+        """Periodic housekeeping: interval fsync, checkpoint save and segment cleanup"""
+        callbacks = ()
+        with self._lock:
+            if self._unsynced and time.monotonic() - self._last_sync >= self.fsync_interval:
+                callbacks = self._sync()
+        for callback in callbacks:
+            callback()
+
+        checkpoint = self.committed_seq()
+        with self._lock:
+            now = time.monotonic()
+            if checkpoint == self.checkpoint or now - self._last_checkpoint < 1.0:
+                return
+            self._last_checkpoint = now
+            self.checkpoint = checkpoint
+            tmp_path = os.path.join(self.directory, CHECKPOINT_FILE + ".tmp")
+            with open(tmp_path, 'w') as f:
+                f.write(str(checkpoint))
+            os.replace(tmp_path, os.path.join(self.directory, CHECKPOINT_FILE))
+
+            # Segments that are entirely before the checkpoint are no longer needed
+            while len(self._segments) > 1 and self._segments[1] <= checkpoint:
+                oldest = self._segments.pop(0)
+                del self._sizes[oldest]
+                os.remove(self._path(oldest))
+
+    def read(self, from_seq, max_records):
+        """Return up to max_records (seq, topic, payload, received_at) tuples starting at from_seq"""
+        with self._lock:
+            self._file.flush()
+            end = min(self.next_seq, from_seq + max_records)
+            segments = list(self._segments)
+
+        records = []
+        seq = max(from_seq, segments[0])
+        while seq < end:
+            i = bisect.bisect_right(segments, seq) - 1
+            first = segments[i]
+            segment_end = min(segments[i + 1] if i + 1 < len(segments) else end, end)
+
+            if self._cursor is not None and self._cursor[:2] == (seq, first):
+                current, offset = seq, self._cursor[2]
+            else:
+                current, offset = first, 0
+
+            try:
+                f = open(self._path(first), 'rb')
+            except FileNotFoundError:
+                # Dropped by the disk limit while we were reading; caller retries from replay_from
+                break
+            with f:
+                f.seek(offset)
+                while current < segment_end:
+                    length, _, topic_len, received_at = _HEADER.unpack(f.read(_HEADER.size))
+                    body = f.read(length)
+                    if current >= seq:
+                        records.append((current, body[:topic_len].decode('utf-8'), body[topic_len:], received_at))
+                    current += 1
+                self._cursor = (current, first, f.tell())
+            seq = current
+
+        return records
+
+    def close(self):
+        self._last_checkpoint = 0.0
+        self.maintain()
+        with self._lock:
+            callbacks = self._sync()
+            self._file.close()
+        for callback in callbacks:
+            callback()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'appended': self.appended,
+                'next_seq': self.next_seq,
+                'checkpoint': self.checkpoint,
+                'replaying': self.replay_from is not None,
+                'backlog': self.next_seq - self.replay_from if self.replay_from is not None else len(self._live),
+                'segments': len(self._segments),
+                'bytes': sum(self._sizes.values()),
+                'dropped': self.dropped,
+            }
+
+
+class SpoolReplayer:
+    """Background thread that keeps the spool checkpoint current and, after an
+    outage, drains the spooled messages to Firestore in batches.
+
+    The handler is called as handler(topic, payload, received=received),
+    with the local time the message was spooled.
+    """
+
+    def __init__(self, spool, handler, writer, coalescer=None, batch_records=400,
+                 interval=1.0, max_backoff=30.0, buckets=None, rollups=None, episodes=None):
+        self.spool = spool
+        self.handler = handler
+        self.writer = writer
+        self.coalescer = coalescer
+        self.buckets = buckets
+        self.rollups = rollups
+        self.episodes = episodes
+        self.batch_records = batch_records
+        self.interval = min(interval, spool.fsync_interval)
+        self.max_backoff = max_backoff
+
+        self.replayed = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def replay_batch(self):
+        """Replay one batch from the spool. Returns False if the commit failed"""
+        start = self.spool.replay_from
+        if start is None:
+            return True
+
+        records = self.spool.read(start, self.batch_records)
+        failed_before = self.writer.failed_ops
+        for seq, topic, payload, received_at in records:
+            self.handler(topic, payload, received=datetime.fromtimestamp(received_at))
+        if self.coalescer is not None:
+            self.coalescer.flush(force=True)
+        if self.buckets is not None:
+            self.buckets.flush(force=True)
+        if self.episodes is not None:
+            self.episodes.flush()
+        # A failed write of any of them keeps the checkpoint where it is
+        self.writer.flush()
+        if self.rollups is not None:
+            # Readings are counted once their documents have committed, just above
+            self.rollups.flush()
+            self.writer.flush()
+            if self.rollups.stats()['staged_readings']:
+                # The rollups could not check what an earlier run counted
+                return False
+
+        if self.writer.failed_ops != failed_before:
+            return False
+
+        self.spool.advance(records[-1][0] + 1 if records else start)
+        self.replayed += len(records)
+        return True
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="spool-replayer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        wait = self.interval
+        backoff = self.interval
+        while not self._stop.wait(wait):
+            self.spool.maintain()
+            if self.spool.replay_from is None:
+                wait = backoff = self.interval
+                continue
+
+            if self.replay_batch():
+                wait, backoff = 0, self.interval
+            else:
+                logger.warning(f"💽 Spool replay failed, retrying in {backoff:.0f}s")
+                wait, backoff = backoff, min(backoff * 2, self.max_backoff)
@@ -5,11 +5,20 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from itertools import chain, islice
 import time
 import io
+from concurrent.futures import ThreadPoolExecutor
 import qrcode
 from firebase_config import FirebaseAdmin
+from alert_engine import DEFAULT_THRESHOLDS
+from schema import SCHEMA_VERSION, SENSOR_STORAGE, TIMESTAMP_FLOOR, reading_collection
+from sensor_buckets import BUCKET_COLLECTION, bucket_columns, recent_buckets
+from sensor_store import SensorStore
+from frames import alert_frame, readings_frame, sensor_frame
+from live_store import LiveStore
+from range_query import day_bounds, stream_range
 from streamlit_option_menu import option_menu
 import json
 import pyotp  # For Google Authenticator integration
@@ -299,17 +308,67 @@ def check_user_role(email):
 # ========================================
 # DATA FETCHING FUNCTIONS
 # ========================================
-@st.cache_data(ttl=60)
+# Readings kept in memory by the process-wide sensor store; each refresh only reads
+# the documents written since the previous one
+SENSOR_STORE_MAX_ROWS = 5000
+
+# Snapshot listeners keep the newest readings, the alerts and the device heartbeats in
+# memory for every session (live_store.py); without them each session polls through
+# the TTL caches below
+LIVE_UPDATES = True
+LIVE_SENSOR_ROWS = 1000
+LIVE_ALERT_ROWS = 500
+
+@st.cache_resource
+def get_sensor_store():
+    """One incremental sensor_readings store shared by all sessions"""
+    return SensorStore(firebase.db, readings_frame, max_rows=SENSOR_STORE_MAX_ROWS)
+
+@st.cache_resource
+def get_live_store():
+    """One set of Firestore listeners shared by all sessions"""
+    return LiveStore(firebase.db, readings_frame, alert_frame,
+                     sensor_rows=LIVE_SENSOR_ROWS, alert_rows=LIVE_ALERT_ROWS)
+
+def live_store():
+    """The listener store, or None when it is off or cannot start"""
+    if not LIVE_UPDATES:
+        return None
+    try:
+        return get_live_store()
+    except Exception as e:
+        st.warning(f"⚠️ Live updates unavailable, polling instead: {str(e)[:50]}")
+        return None
+
 def get_sensor_data(limit=500):
+    """Newest sensor readings, from the listener store when it holds enough of them"""
+    store = live_store()
+    # The listener watches the sensor_readings collection of the "documents" layout
+    if store is not None and SENSOR_STORAGE == "documents" and limit <= store.sensor_rows:
+        try:
+            df = store.sensors.frame()
+            if df.empty:
+                st.warning("📊 No sensor data found in Firestore yet")
+            return df.head(limit)
+        except Exception as e:
+            st.warning(f"⚠️ Live sensor data unavailable: {str(e)[:50]}")
+    return load_sensor_data(limit)
+
+@st.cache_data(ttl=60)
+def load_sensor_data(limit=500):
     """Fetch sensor data from Firestore with caching"""
     try:
-        # First attempt: try with order_by
+        if SENSOR_STORAGE == "buckets":
+            return get_bucketed_sensor_data(limit)
+        if SENSOR_STORAGE == "devices":
+            return get_device_sensor_data(limit)
+        
+        # First attempt: the incremental store, ordered by received_at
         try:
-            docs = firebase.db.collection('sensor_readings')\
-                             .order_by('received_at', direction='DESCENDING')\
-                             .limit(limit)\
-                             .stream()
-            docs = list(docs)
+            df = get_sensor_store().frame(limit)
+            if df.empty:
+                st.warning("📊 No sensor data found in Firestore yet")
+            return df
         except Exception as e:
             # Fallback: query without order_by to avoid index errors
             st.warning(f"⚠️ Note: {str(e)[:50]}... Using unordered query")
@@ -326,55 +385,150 @@ def get_sensor_data(limit=500):
             st.warning("📊 No sensor data found in Firestore yet")
             return pd.DataFrame()
         
-        df = pd.DataFrame(data)
-        
-        # Parse timestamps - try multiple field names
-        if 'received_at' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['received_at'], errors='coerce')
-        elif 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+        return readings_frame(data)
+    except Exception as e:
+        st.error(f"❌ Error fetching sensor data: {str(e)}")
+        return pd.DataFrame()
+
+def get_bucketed_sensor_data(limit):
+    """Newest readings from sensor_buckets documents, a few document reads per thousand readings"""
+    snapshots = recent_buckets(firebase.db, limit)
+    if not snapshots:
+        st.warning("📊 No sensor data found in Firestore yet")
+        return pd.DataFrame()
+    
+    # The columnar arrays become DataFrame columns as they are
+    columns = bucket_columns(snapshot.to_dict() for snapshot in snapshots)
+    columns['id'] = columns.pop('ids')
+    df = pd.DataFrame(columns)
+    df['schema_version'] = SCHEMA_VERSION
+    return sensor_frame(df).head(limit)
+
+def get_device_sensor_data(limit):
+    """Newest readings from the per-device sensor_readings subcollections, one query per device"""
+    device_ids = [doc.id for doc in firebase.db.collection('devices_latest').stream()]
+    if not device_ids:
+        st.warning("📊 No sensor data found in Firestore yet")
+        return pd.DataFrame()
+    
+    # Each device's newest share of limit. Devices publish at the same interval, so
+    # that is about the newest `limit` overall, without a collection group index on
+    # received_at (one index range that every write appends to)
+    per_device = -(-limit // len(device_ids))
+    
+    def newest(device_id):
+        return list(reading_collection(firebase.db, 'sensor_readings', device_id)
+                    .where('received_at', '>=', TIMESTAMP_FLOOR)
+                    .order_by('received_at', direction='DESCENDING')
+                    .limit(per_device)
+                    .stream())
+    
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        docs = [doc for page in pool.map(newest, device_ids) for doc in page]
+    
+    data = []
+    for doc in docs:
+        doc_data = doc.to_dict()
+        doc_data['id'] = doc.id
+        data.append(doc_data)
+    
+    if not data:
+        st.warning("📊 No sensor data found in Firestore yet")
+        return pd.DataFrame()
+    
+    return readings_frame(data).head(limit)
+
+# Date-range loads (Analytics, Alert History) page through Firestore RANGE_PAGE_SIZE
+# documents at a time and stop, with a warning, at RANGE_MAX_ROWS
+RANGE_PAGE_SIZE = 1000
+RANGE_MAX_ROWS = 200000
+
+# Longest bucket the bridge may write (SENSOR_BUCKET_SECONDS), so a range query on
+# bucket_start also finds the bucket the range starts in
+BUCKET_SECONDS_MAX = 3600
+
+def collect_range(streams, what):
+    """Documents of the range streams (with their IDs), at most RANGE_MAX_ROWS"""
+    data = []
+    for doc in islice(chain.from_iterable(streams), RANGE_MAX_ROWS + 1):
+        doc_data = doc.to_dict()
+        doc_data['id'] = doc.id
+        data.append(doc_data)
+    if len(data) > RANGE_MAX_ROWS:
+        st.warning(f"⚠️ Showing the first {RANGE_MAX_ROWS:,} {what} of the range; pick a shorter one for the rest")
+        data = data[:RANGE_MAX_ROWS]
+    return data
+
+@st.cache_data(ttl=60)
+def get_sensor_data_range(start_date, end_date):
+    """Every sensor reading received from start_date through end_date (local dates)"""
+    start, end = day_bounds(start_date, end_date)
+    start_utc, end_utc = start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+    try:
+        if SENSOR_STORAGE == "buckets":
+            query = firebase.db.collection(BUCKET_COLLECTION)
+            docs = collect_range([stream_range(query, start_utc - timedelta(seconds=BUCKET_SECONDS_MAX),
+                                               end_utc, 'bucket_start', RANGE_PAGE_SIZE)], "buckets")
+            if not docs:
+                return pd.DataFrame()
+            columns = bucket_columns(docs)
+            columns['id'] = columns.pop('ids')
+            df = pd.DataFrame(columns)
+            received = pd.to_datetime(df['received_at'], utc=True)
+            df = df[(received >= start_utc) & (received < end_utc)].reset_index(drop=True)
+            df['schema_version'] = SCHEMA_VERSION
+            return sensor_frame(df) if not df.empty else df
+        
+        if SENSOR_STORAGE == "devices":
+            device_ids = [doc.id for doc in firebase.db.collection('devices_latest').stream()]
+            
+            def device_range(device_id):
+                query = reading_collection(firebase.db, 'sensor_readings', device_id)
+                return list(stream_range(query, start_utc, end_utc, page_size=RANGE_PAGE_SIZE))
+            
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                streams = list(pool.map(device_range, device_ids))
         else:
-            df['timestamp'] = pd.Timestamp.now()
+            # schema_version 2 documents store a UTC timestamp and older ones a local-time
+            # ISO string; a range filter only matches its own type, so both are queried
+            query = firebase.db.collection('sensor_readings')
+            streams = [stream_range(query, start_utc, end_utc, page_size=RANGE_PAGE_SIZE),
+                       stream_range(query, start.isoformat(), end.isoformat(), page_size=RANGE_PAGE_SIZE)]
         
-        # Extract sensor values - handle nested 'sensors' object
-        if 'sensors' in df.columns:
-            df['air_quality'] = df['sensors'].apply(
-                lambda x: x.get('air_quality_ppm', 0) if isinstance(x, dict) else 0
-            )
-            df['temperature'] = df['sensors'].apply(
-                lambda x: x.get('temperature_c', 0) if isinstance(x, dict) else 0
-            )
-            df['humidity'] = df['sensors'].apply(
-                lambda x: x.get('humidity_percent', 0) if isinstance(x, dict) else 0
-            )
-            df['motion'] = df['sensors'].apply(
-                lambda x: x.get('motion', False) if isinstance(x, dict) else False
-            )
-            df['light_level'] = df['sensors'].apply(
-                lambda x: x.get('light_level', 0) if isinstance(x, dict) else 0
-            )
-            df['leak_detected'] = df['sensors'].apply(
-                lambda x: x.get('water_leak', False) if isinstance(x, dict) else False  # Note: Arduino sends 'water_leak'
-            )
-        else:
-            # Fallback: data might be flat (not nested under 'sensors')
-            df['air_quality'] = df.get('air_quality_ppm', 0) if 'air_quality_ppm' in df else 0
-            df['temperature'] = df.get('temperature_c', 0) if 'temperature_c' in df else 0
-            df['humidity'] = df.get('humidity_percent', 0) if 'humidity_percent' in df else 0
-            df['motion'] = df.get('motion', False) if 'motion' in df else False
-            df['light_level'] = df.get('light_level', 0) if 'light_level' in df else 0
-            df['leak_detected'] = df.get('water_leak', False) if 'water_leak' in df else False
-        
-        # Sort by timestamp descending
-        df = df.sort_values('timestamp', ascending=False)
-        
-        return df
+        data = collect_range(streams, "readings")
+        if not data:
+            return pd.DataFrame()
+        return readings_frame(data)
     except Exception as e:
         st.error(f"❌ Error fetching sensor data: {str(e)}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=30)
 def get_alerts(active_only=True, limit=100):
+    """Newest alerts, from the listener store for active ones when it holds enough of them"""
+    store = live_store()
+    if store is not None and active_only and limit <= store.alert_rows:
+        try:
+            return store.active_alerts.frame().head(limit)
+        except Exception as e:
+            st.warning(f"⚠️ Live alerts unavailable: {str(e)[:50]}")
+    return load_alerts(active_only, limit)
+
+@st.cache_data(ttl=60)
+def get_alerts_range(start_date, end_date):
+    """Every alert (any status) received from start_date through end_date (local dates)"""
+    start, end = day_bounds(start_date, end_date)
+    try:
+        # Alerts store received_at as a local-time ISO string
+        query = firebase.db.collection('alerts')
+        data = collect_range([stream_range(query, start.isoformat(), end.isoformat(),
+                                           page_size=RANGE_PAGE_SIZE)], "alerts")
+        return alert_frame(data)
+    except Exception as e:
+        st.error(f"Error fetching alerts: {e}")
+        return pd.DataFrame()
+
+@st.cache_data(ttl=30)
+def load_alerts(active_only=True, limit=100):
     """Fetch alerts from Firestore"""
     try:
         query = firebase.db.collection('alerts')
@@ -389,18 +543,25 @@ def get_alerts(active_only=True, limit=100):
             alert_data['id'] = doc.id
             alerts.append(alert_data)
         
-        df = pd.DataFrame(alerts)
-        if not df.empty:
-            df['timestamp'] = pd.to_datetime(df['received_at'])
-        
-        return df
+        return alert_frame(alerts)
     except Exception as e:
         st.error(f"Error fetching alerts: {e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=60)
 def get_device_status():
     """Get device heartbeat status"""
+    store = live_store()
+    if store is not None:
+        try:
+            # Online status depends on the time of asking, so it is worked out per call
+            return device_status(store.heartbeats.frame().to_dict('records'))
+        except Exception as e:
+            st.warning(f"⚠️ Live device status unavailable: {str(e)[:50]}")
+    return load_device_status()
+
+@st.cache_data(ttl=60)
+def load_device_status():
+    """Fetch device heartbeats from Firestore"""
     try:
         docs = firebase.db.collection('device_heartbeats').stream()
         
@@ -408,26 +569,53 @@ def get_device_status():
         for doc in docs:
             device_data = doc.to_dict()
             device_data['device_id'] = doc.id
-            
-            # Calculate online status
-            last_seen = device_data.get('received_at', 'Never')
-            if last_seen != 'Never':
-                try:
-                    last_seen_dt = datetime.fromisoformat(last_seen.replace('Z', '+00:00'))
-                    time_diff = (datetime.utcnow() - last_seen_dt).total_seconds()
-                    device_data['status'] = 'online' if time_diff < 120 else 'offline'
-                    device_data['last_seen_seconds'] = time_diff
-                except:
-                    device_data['status'] = 'unknown'
-            else:
-                device_data['status'] = 'unknown'
-            
             devices.append(device_data)
         
-        return pd.DataFrame(devices)
+        return device_status(devices)
     except Exception as e:
         return pd.DataFrame()
 
+def device_status(devices):
+    """Frame of heartbeat documents with their online status"""
+    for device_data in devices:
+        last_seen = device_data.get('received_at', 'Never')
+        if last_seen != 'Never':
+            try:
+                last_seen_dt = datetime.fromisoformat(last_seen.replace('Z', '+00:00'))
+                time_diff = (datetime.utcnow() - last_seen_dt).total_seconds()
+                device_data['status'] = 'online' if time_diff < 120 else 'offline'
+                device_data['last_seen_seconds'] = time_diff
+            except:
+                device_data['status'] = 'unknown'
+        else:
+            device_data['status'] = 'unknown'
+    
+    return pd.DataFrame(devices)
+
+def get_alert_thresholds():
+    """Load the alert thresholds the bridge's alert engine uses"""
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    try:
+        doc = firebase.db.collection('settings').document('alert_thresholds').get()
+        if doc.exists:
+            thresholds.update({k: v for k, v in doc.to_dict().items() if k in DEFAULT_THRESHOLDS})
+    except Exception as e:
+        st.warning(f"⚠️ Could not load alert thresholds, using defaults: {e}")
+    return thresholds
+
+def save_alert_thresholds(thresholds):
+    """Save alert thresholds; the bridge picks them up through a snapshot listener"""
+    try:
+        firebase.db.collection('settings').document('alert_thresholds').set({
+            **thresholds,
+            'updated_by': st.session_state.user_email,
+            'updated_at': datetime.now().isoformat()
+        }, merge=True)
+        return True
+    except Exception as e:
+        st.error(f"Could not save alert thresholds: {e}")
+        return False
+
 # ========================================
 # ANALYTICS HELPER FUNCTIONS
 # ========================================
@@ -797,7 +985,7 @@ def dashboard_home():
                 <div class='alert-critical'>
                     <h4 style='margin: 0; color: white;'>⚠️ {alert.get('alert_type', 'Critical Alert').upper()}</h4>
                     <p style='margin: 0.5rem 0; font-size: 1.1rem;'>{alert.get('message', 'Immediate action required')}</p>
-                    <small>🕒 {alert.get('received_at', 'Just now')}</small>
+                    <small>🕒 {alert.get('timestamp', 'Just now')}</small>
                 </div>
                 """, unsafe_allow_html=True)
     
@@ -1074,7 +1262,7 @@ def alerts_management_page():
                 )
             
             with col_filter2:
-                alert_types = active_alerts['alert_type'].unique() if 'alert_type' in active_alerts.columns else []
+                alert_types = list(active_alerts['alert_type'].unique()) if 'alert_type' in active_alerts.columns else []
                 type_filter = st.multiselect(
                     "Filter by Type",
                     alert_types,
@@ -1112,6 +1300,12 @@ def alerts_management_page():
                     'LOW': 'ℹ️'
                 }.get(severity, 'ℹ️')
                 
+                # Repeated alerts are folded into one episode by the bridge
+                count = alert.get('count')
+                repeats = ""
+                if pd.notna(count) and count > 1:
+                    repeats = f" | 🔁 ×{int(count)} since {alert.get('first_seen', 'Unknown time')}"
+                
                 col_alert1, col_alert2 = st.columns([4, 1])
                 
                 with col_alert1:
@@ -1120,7 +1314,7 @@ def alerts_management_page():
                         <strong>{icon} {alert.get('alert_type', 'System Alert')}</strong>
                         <span style='margin-left: 1rem; padding: 0.2rem 0.6rem; background-color: rgba(0,0,0,0.1); border-radius: 12px; font-size: 0.85rem;'>{severity}</span>
                         <p style='margin: 0.5rem 0 0 0;'>{alert.get('message', 'No details available')}</p>
-                        <small>🕒 {alert.get('received_at', 'Unknown time')} | 📍 {alert.get('device_id', 'Unknown')}</small>
+                        <small>🕒 {alert.get('timestamp', 'Unknown time')} | 📍 {alert.get('device_id', 'Unknown')}{repeats}</small>
                     </div>
                     """, unsafe_allow_html=True)
                 
@@ -1202,56 +1396,47 @@ def alerts_management_page():
                 st.cache_data.clear()
                 st.rerun()
         
-        # Fetch all alerts (including historical)
-        historical_alerts = get_alerts(active_only=False, limit=500)
+        # Fetch every alert of the date range (including historical)
+        historical_alerts = get_alerts_range(start_date, end_date)
         
         if not historical_alerts.empty:
-            # Filter by date
-            historical_alerts = historical_alerts[
-                (historical_alerts['timestamp'].dt.date >= start_date) & 
-                (historical_alerts['timestamp'].dt.date <= end_date)
-            ]
-            
-            if not historical_alerts.empty:
-                # Statistics
-                col_stat1, col_stat2, col_stat3, col_stat4 = st.columns(4)
-                
-                with col_stat1:
-                    total_alerts = len(historical_alerts)
-                    st.metric("Total Alerts", total_alerts)
-                
-                with col_stat2:
-                    high_alerts = len(historical_alerts[historical_alerts['severity'] == 'HIGH'])
-                    st.metric("Critical Alerts", high_alerts)
-                
-                with col_stat3:
-                    unique_days = historical_alerts['timestamp'].dt.date.nunique()
-                    st.metric("Active Days", unique_days)
-                
-                with col_stat4:
-                    avg_alerts = total_alerts / unique_days if unique_days > 0 else 0
-                    st.metric("Avg Per Day", f"{avg_alerts:.1f}")
-                
-                # Display as table
-                st.markdown("#### 📋 Alert History Table")
-                display_cols = ['timestamp', 'alert_type', 'severity', 'message', 'device_id']
-                st.dataframe(
-                    historical_alerts[display_cols].sort_values('timestamp', ascending=False),
-                    use_container_width=True,
-                    hide_index=True
-                )
-                
-                # Export options
-                st.download_button(
-                    label="📥 Download Full History (CSV)",
-                    data=historical_alerts.to_csv(index=False),
-                    file_name=f"alert_history_{start_date}_to_{end_date}.csv",
-                    mime="text/csv"
-                )
-            else:
-                st.info("No alerts found in the selected date range")
+            # Statistics
+            col_stat1, col_stat2, col_stat3, col_stat4 = st.columns(4)
+            
+            with col_stat1:
+                total_alerts = len(historical_alerts)
+                st.metric("Total Alerts", total_alerts)
+            
+            with col_stat2:
+                high_alerts = len(historical_alerts[historical_alerts['severity'] == 'HIGH'])
+                st.metric("Critical Alerts", high_alerts)
+            
+            with col_stat3:
+                unique_days = historical_alerts['timestamp'].dt.date.nunique()
+                st.metric("Active Days", unique_days)
+            
+            with col_stat4:
+                avg_alerts = total_alerts / unique_days if unique_days > 0 else 0
+                st.metric("Avg Per Day", f"{avg_alerts:.1f}")
+            
+            # Display as table
+            st.markdown("#### 📋 Alert History Table")
+            display_cols = ['timestamp', 'alert_type', 'severity', 'message', 'device_id']
+            st.dataframe(
+                historical_alerts[display_cols].sort_values('timestamp', ascending=False),
+                use_container_width=True,
+                hide_index=True
+            )
+            
+            # Export options
+            st.download_button(
+                label="📥 Download Full History (CSV)",
+                data=historical_alerts.to_csv(index=False),
+                file_name=f"alert_history_{start_date}_to_{end_date}.csv",
+                mime="text/csv"
+            )
         else:
-            st.info("No historical alerts available")
+            st.info("No alerts found in the selected date range")
     
     # ===== ALERT CONFIGURATION TAB =====
     with tab3:
@@ -1346,20 +1531,10 @@ def analytics_page():
             st.cache_data.clear()
             st.rerun()
     
-    # Fetch and filter data
-    sensor_df = get_sensor_data(1000)
+    # Fetch every reading of the date range
+    sensor_df = get_sensor_data_range(start_date, end_date)
     
     if not sensor_df.empty:
-        # Filter by date range
-        sensor_df = sensor_df[
-            (sensor_df['timestamp'].dt.date >= start_date) & 
-            (sensor_df['timestamp'].dt.date <= end_date)
-        ]
-        
-        if sensor_df.empty:
-            st.warning("No data available for selected date range")
-            return
-        
         # Calculate statistics
         stats = calculate_statistics(sensor_df)
         patterns = detect_patterns(sensor_df)
@@ -1650,7 +1825,7 @@ Most Active Day: {patterns['most_active_day']}
             )
     
     else:
-        st.warning("⚠️ No sensor data available for analysis")
+        st.warning("⚠️ No sensor data available for the selected date range")
 
 # ========================================
 # DEVICE MANAGEMENT PAGE
@@ -1859,24 +2034,26 @@ def settings_page():
     with tab2:
         st.markdown("### Alert Threshold Configuration")
         
+        saved = get_alert_thresholds()
         col_alert1, col_alert2 = st.columns(2)
         
         with col_alert1:
             st.markdown("#### 💨 Air Quality Alerts")
-            air_warning = st.slider("⚠️ Warning Level (PPM)", 50, 300, 100, 10)
-            air_critical = st.slider("🚨 Critical Level (PPM)", 100, 500, 200, 10)
+            air_warning = st.slider("⚠️ Warning Level (PPM)", 50, 300, int(saved['air_warning']), 10)
+            air_critical = st.slider("🚨 Critical Level (PPM)", 100, 500, int(saved['air_critical']), 10)
             
             st.markdown("#### 🌡️ Temperature Alerts")
-            temp_high = st.slider("🔥 High Temperature (°C)", 25, 40, 30, 1)
-            temp_low = st.slider("❄️ Low Temperature (°C)", 10, 20, 18, 1)
+            temp_high = st.slider("🔥 High Temperature (°C)", 25, 40, int(saved['temp_high']), 1)
+            temp_low = st.slider("❄️ Low Temperature (°C)", 10, 20, int(saved['temp_low']), 1)
         
         with col_alert2:
             st.markdown("#### 💧 Humidity Alerts")
-            humidity_high = st.slider("💦 High Humidity (%)", 60, 90, 70, 5)
-            humidity_low = st.slider("🏜️ Low Humidity (%)", 20, 50, 30, 5)
+            humidity_high = st.slider("💦 High Humidity (%)", 60, 90, int(saved['humidity_high']), 5)
+            humidity_low = st.slider("🏜️ Low Humidity (%)", 20, 50, int(saved['humidity_low']), 5)
             
             st.markdown("#### 🚪 Occupancy Alerts")
-            inactivity_threshold = st.slider("⏰ Inactivity Alert (minutes)", 30, 240, 60, 10)
+            inactivity_threshold = st.slider("⏰ Inactivity Alert (minutes)", 30, 240,
+                                             int(saved['inactivity_threshold']), 10)
         
         st.divider()
         
@@ -1894,7 +2071,14 @@ def settings_page():
         )
         
         if st.button("💾 Save Alert Settings", type="primary"):
-            st.success("✅ Alert settings saved successfully!")
+            saved_ok = save_alert_thresholds({
+                'air_warning': air_warning, 'air_critical': air_critical,
+                'temp_high': temp_high, 'temp_low': temp_low,
+                'humidity_high': humidity_high, 'humidity_low': humidity_low,
+                'inactivity_threshold': inactivity_threshold
+            })
+            if saved_ok:
+                st.success("✅ Alert settings saved successfully!")
             st.info("""
             **Active Thresholds:**
             - Air Quality: Warning at {air_warning} PPM, Critical at {air_critical} PPM
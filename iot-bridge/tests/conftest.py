@@ -0,0 +1,24 @@
+# conftest.py
+# The bridge and dashboard modules are flat in iot-bridge/, run with
+#   python -m pytest tests
+import logging
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_firestore import FakeFirestore  # noqa: E402
+
+
+@pytest.fixture
+def bridge(tmp_path):
+    """mqtt_firebase_bridge set up on a FakeFirestore, without its background threads"""
+    import mqtt_firebase_bridge as bridge
+
+    logging.disable(logging.CRITICAL)
+    bridge.setup(FakeFirestore(), spool_dir=str(tmp_path / "spool"), spill_dir=str(tmp_path / "spill"))
+    yield bridge
+    bridge.spool.close()
+    logging.disable(logging.NOTSET)
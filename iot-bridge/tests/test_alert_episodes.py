@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+from alert_episodes import EpisodeCompactor
+from fake_firestore import FakeFirestore
+
+START = datetime(2026, 1, 1, 20, 0)
+
+
+class _Writer:
+    def __init__(self):
+        self.writes = []
+
+    def set(self, doc_ref, data, merge=False, tokens=()):
+        self.writes.append((doc_ref.id, data, tokens))
+
+
+def dark(episodes, db, seq, tokens=()):
+    """The firmware's LIGHT alert, sent on every read while the room is dark"""
+    episodes.add(db.collection('alerts').document(f"esp32_test_7_{seq}"),
+                 {'device_id': 'esp32_test', 'alert_type': 'LIGHT', 'severity': 'INFO'},
+                 START + timedelta(seconds=2 * seq), tokens=tokens)
+
+
+def test_replayed_alerts_are_counted_once():
+    writer, db = _Writer(), FakeFirestore()
+    episodes = EpisodeCompactor(writer)
+    for seq in range(5):
+        dark(episodes, db, seq)
+    for seq in range(3, 5):
+        dark(episodes, db, seq, tokens=(seq,))
+    episodes.flush()
+
+    doc_id, data, tokens = writer.writes[-1]
+    assert (doc_id, data['count'], tokens) == ('esp32_test_7_0', 5, (3, 4))
+
+
+def test_dedup_state_stays_bounded_in_a_long_episode():
+    writer, db = _Writer(), FakeFirestore()
+    episodes = EpisodeCompactor(writer, dedup_capacity=32)
+    # A dark room all night keeps one episode open
+    for seq in range(6 * 3600 // 2):
+        dark(episodes, db, seq)
+    episodes.flush()
+
+    assert episodes.stats()['alert_ids'] == 32
+    assert writer.writes[-1][1]['count'] == 6 * 3600 // 2
@@ -0,0 +1,38 @@
+from dedup import DedupCache, message_id
+
+
+def test_duplicates_are_seen():
+    cache = DedupCache(capacity=10)
+    assert cache.seen("esp32_1_7_0") is False
+    assert cache.seen("esp32_1_7_0") is True
+    assert cache.stats() == {'size': 1, 'capacity': 10, 'duplicates': 1}
+
+
+def test_least_recently_seen_is_evicted():
+    cache = DedupCache(capacity=3)
+    for msg_id in ("a", "b", "c"):
+        cache.seen(msg_id)
+    # A hit moves "a" to the newest end, so "b" goes first
+    assert cache.seen("a") is True
+    cache.seen("d")
+    assert cache.stats()['size'] == 3
+    assert cache.seen("b") is False
+    assert cache.seen("a") is True
+
+
+def test_add_records_without_counting():
+    cache = DedupCache(capacity=2)
+    cache.add("a")
+    cache.add("b")
+    cache.add("c")
+    assert cache.seen("a") is False
+    assert cache.seen("c") is True
+    assert cache.stats()['duplicates'] == 1
+
+
+def test_message_id_survives_reboots():
+    data = {'device_id': 'esp32_1', 'boot_id': 7, 'seq': 3}
+    assert message_id(data, b'') == "esp32_1_7_3"
+    legacy = {'device_id': 'esp32_1', 'timestamp': 5000}
+    assert message_id(legacy, b'{"x": 1}') == message_id(legacy, b'{"x": 1}')
+    assert message_id(legacy, b'{"x": 1}') != message_id(legacy, b'{"x": 2}')
@@ -0,0 +1,19 @@
+import pandas as pd
+import pytest
+
+from bench_frames import compare, documents
+from frames import readings_frame, sensor_frame
+
+
+@pytest.mark.parametrize("legacy", [0.0, 0.3])
+def test_readings_frame_matches_sensor_frame(legacy):
+    rows = documents(500, legacy, seed=357)
+    expected = sensor_frame(pd.DataFrame(rows))
+    actual = readings_frame(rows)
+    assert compare(expected, actual) == []
+    assert len(actual) == len(rows)
+    assert actual['timestamp'].is_monotonic_decreasing
+
+
+def test_empty_documents():
+    assert readings_frame([]).empty
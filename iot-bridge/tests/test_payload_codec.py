@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from payload_codec import PayloadError, device_id, encode_payload, is_msgpack, parse_payload
+
+READING = {
+    'device_id': 'esp32_livingroom', 'device_type': 'ESP32', 'location': 'living room',
+    'timestamp': 123456, 'boot_id': 7, 'seq': 42,
+    'sensors': {'air_quality_ppm': 410, 'water_leak': False, 'motion': True, 'light_level': 2048,
+                'temperature_c': 24.37, 'humidity_percent': 61.5},
+    'system': {'wifi_connected': True, 'mqtt_connected': True, 'rssi': -58, 'publish_count': 9,
+               'error_count': 0},
+}
+
+
+def test_round_trip():
+    payload = encode_payload(READING)
+    assert is_msgpack(payload)
+    assert len(payload) < len(json.dumps(READING))
+    assert parse_payload(payload) == READING
+
+
+def test_round_trip_of_a_batch():
+    batch = {'device_id': 'esp32_livingroom', 'boot_id': 7, 'seq': 43,
+             'readings': [{'timestamp': 1000 + i, 'sensors': {'temperature_c': 20.25 + i}} for i in range(3)]}
+    assert parse_payload(encode_payload(batch)) == batch
+
+
+def test_unknown_fields_keep_their_name():
+    data = {'device_id': 'esp32_x', 'firmware': '1.2.0'}
+    assert parse_payload(encode_payload(data)) == data
+
+
+def test_json_still_parses():
+    assert parse_payload(json.dumps(READING).encode()) == READING
+
+
+def test_device_id_without_decoding():
+    assert device_id(encode_payload(READING)) == b'esp32_livingroom'
+    long_name = 'esp32_' + 'x' * 40
+    assert device_id(encode_payload({'device_id': long_name})) == long_name.encode()
+
+
+def test_device_id_only_when_it_comes_first():
+    assert device_id(encode_payload({'seq': 1, 'device_id': 'esp32_x'})) is None
+    assert device_id(json.dumps(READING).encode()) is None
+
+
+def test_garbage_raises_payload_error():
+    with pytest.raises(PayloadError):
+        parse_payload(b'\x82\x01\xc1')
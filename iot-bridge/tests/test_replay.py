@@ -0,0 +1,166 @@
+# Outage runs through mqtt_firebase_bridge: commits fail, the spool replays them
+import json
+import time
+from datetime import datetime
+
+from alert_engine import AlertEngine, rules_from_thresholds
+
+TOPIC_SENSOR_DATA = "home/sensors/data"
+TOPIC_ALERTS = "home/sensors/alerts"
+
+
+def reading(seq, temperature=21.0):
+    return json.dumps({'device_id': 'esp32_test', 'boot_id': 7, 'seq': seq, 'timestamp': seq * 1200,
+                       'sensors': {'temperature_c': temperature, 'humidity_percent': 50.0}}).encode()
+
+
+def deliver(bridge, topic, payload, received_at=None):
+    """on_message without the ingest threads: spool, then process on the live path"""
+    seq, live = bridge.spool.append(topic, payload, received_at=received_at)
+    if live:
+        bridge.process_message(topic, payload, seq)
+    bridge.writer.flush()
+
+
+def replay(bridge):
+    while bridge.spool.replay_from is not None:
+        assert bridge.replayer.replay_batch()
+
+
+def documents(bridge, prefix):
+    return {path: data for path, data in bridge.db.docs.items() if path.startswith(prefix)}
+
+
+def test_replayed_readings_keep_their_receive_time(bridge):
+    start = time.time() - 60
+    bridge.db.available = False
+    for seq in range(5):
+        deliver(bridge, TOPIC_SENSOR_DATA, reading(seq), received_at=start + 1.2 * seq)
+    bridge.db.available = True
+    replay(bridge)
+
+    stored = sorted(doc['received_at'].timestamp() for doc in documents(bridge, 'sensor_readings/').values())
+    assert len(stored) == 5
+    assert all(abs(at - (start + 1.2 * seq)) < 1e-3 for seq, at in enumerate(stored))
+
+
+def test_rollups_count_each_reading_once(bridge):
+    deliver(bridge, TOPIC_SENSOR_DATA, reading(0))
+    deliver(bridge, TOPIC_SENSOR_DATA, reading(1))
+    bridge.rollups.flush()
+    bridge.writer.flush()
+
+    bridge.db.available = False
+    for seq in range(2, 5):
+        deliver(bridge, TOPIC_SENSOR_DATA, reading(seq))
+    bridge.rollups.flush()
+    bridge.writer.flush()
+    bridge.db.available = True
+    replay(bridge)
+    deliver(bridge, TOPIC_SENSOR_DATA, reading(5))
+    # A redelivery of a handled message is dropped by the dedup cache
+    deliver(bridge, TOPIC_SENSOR_DATA, reading(5))
+    bridge.rollups.flush()
+    bridge.writer.flush()
+
+    days = documents(bridge, 'sensor_rollups/esp32_test_day_')
+    assert [doc['count'] for doc in days.values()] == [6]
+    assert bridge.spool.committed_seq() == bridge.spool.next_seq
+
+
+def test_checkpoint_waits_for_the_rollup_flush(bridge):
+    deliver(bridge, TOPIC_SENSOR_DATA, reading(0))
+    assert bridge.spool.committed_seq() == 0
+    bridge.rollups.flush()
+    bridge.writer.flush()
+    assert bridge.spool.committed_seq() == 1
+
+
+def test_replay_writes_alert_episodes_before_advancing(bridge):
+    bridge.db.available = False
+    for seq in range(3):
+        deliver(bridge, TOPIC_ALERTS, json.dumps({'device_id': 'esp32_test', 'boot_id': 7, 'seq': seq,
+                                                  'alert_type': 'LIGHT', 'severity': 'INFO'}).encode())
+        bridge.episodes.flush()
+        bridge.writer.flush()
+    bridge.db.available = True
+    replay(bridge)
+
+    alerts = documents(bridge, 'alerts/')
+    assert [doc['count'] for doc in alerts.values()] == [3]
+
+
+def test_replayed_reading_rewrites_its_bridge_alert(bridge):
+    leak = json.dumps({'device_id': 'esp32_test', 'boot_id': 7, 'seq': 0, 'sensors': {'water_leak': True}}).encode()
+    deliver(bridge, TOPIC_SENSOR_DATA, leak)
+    # Replayed after a restart, with fresh rule state: the rule fires again
+    bridge.alert_engine = AlertEngine(rules_from_thresholds({}), bridge.emit_alert)
+    bridge.replayer.handler(TOPIC_SENSOR_DATA, leak, received=datetime.now())
+    bridge.writer.flush()
+
+    assert list(documents(bridge, 'alerts/')) == ['alerts/esp32_test_7_0_water_leak']
+
+
+def test_non_numeric_field_does_not_drop_the_reading(bridge):
+    payload = json.dumps({'device_id': 'esp32_test', 'boot_id': 7, 'seq': 0,
+                          'sensors': {'temperature_c': 'n/a', 'humidity_percent': 40.0}}).encode()
+    deliver(bridge, TOPIC_SENSOR_DATA, payload)
+    assert list(documents(bridge, 'sensor_readings/')) == ['sensor_readings/esp32_test_7_0']
+
+
+def heartbeat(seq):
+    return json.dumps({'device_id': 'esp32_other', 'boot_id': 3, 'seq': seq, 'uptime_seconds': seq}).encode()
+
+
+def test_replay_after_a_later_failure_does_not_count_twice(bridge):
+    # The second heartbeat waits in the coalescer while the reading after it commits with its rollups
+    deliver(bridge, "home/heartbeat", heartbeat(0))
+    deliver(bridge, "home/heartbeat", heartbeat(1))
+    deliver(bridge, TOPIC_SENSOR_DATA, reading(0))
+    bridge.rollups.flush()
+    bridge.writer.flush()
+    assert [doc['count'] for doc in documents(bridge, 'sensor_rollups/esp32_test_day_').values()] == [1]
+
+    # The heartbeat's write fails, so the spool replays from it, reading included
+    bridge.db.available = False
+    bridge.coalescer.flush(force=True)
+    bridge.writer.flush()
+    assert bridge.spool.replay_from == 1
+    bridge.db.available = True
+    replay(bridge)
+
+    days = documents(bridge, 'sensor_rollups/esp32_test_day_')
+    assert [doc['count'] for doc in days.values()] == [1]
+    assert bridge.rollups.stats()['duplicates'] == 1
+    assert bridge.spool.committed_seq() == bridge.spool.next_seq
+
+
+def test_replay_after_a_restart_does_not_count_twice(bridge, tmp_path):
+    deliver(bridge, TOPIC_SENSOR_DATA, reading(0), received_at=time.time() - 60)
+    bridge.rollups.flush()
+    bridge.writer.flush()
+    # Crash before the checkpoint is saved: the restarted bridge replays the reading
+    bridge.spool.sync()
+    db = bridge.db
+    bridge.setup(db, spool_dir=str(tmp_path / "spool"), spill_dir=str(tmp_path / "spill"))
+    assert bridge.spool.replay_from == 0
+    replay(bridge)
+
+    days = documents(bridge, 'sensor_rollups/esp32_test_day_')
+    assert [doc['count'] for doc in days.values()] == [1]
+
+
+def test_counted_ids_are_deleted_once_the_checkpoint_passes_them(bridge):
+    deliver(bridge, TOPIC_SENSOR_DATA, reading(0))
+    bridge.rollups.flush()
+    bridge.writer.flush()
+    day = next(iter(documents(bridge, 'sensor_rollups/esp32_test_day_').values()))
+    assert list(day['counted']) == ['esp32_test_7_0']
+
+    bridge.spool.maintain()
+    deliver(bridge, TOPIC_SENSOR_DATA, reading(1))
+    bridge.rollups.flush()
+    bridge.writer.flush()
+    day = next(iter(documents(bridge, 'sensor_rollups/esp32_test_day_').values()))
+    assert list(day['counted']) == ['esp32_test_7_1']
+    assert day['count'] == 2
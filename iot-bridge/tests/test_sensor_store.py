@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta, timezone
+
+from fake_firestore import FakeFirestore
+from frames import readings_frame
+from sensor_store import SensorStore
+
+BASE = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def write(db, start, count):
+    for i in range(start, start + count):
+        db.collection('sensor_readings').document(f"r{i:04d}").set({
+            'device_id': 'esp32_test', 'schema_version': 2, 'received_at': BASE + timedelta(seconds=i),
+            'temperature': 20.0 + i % 10})
+
+
+def ids(frame):
+    return list(frame['id'])
+
+
+def test_refresh_reads_only_new_documents():
+    db = FakeFirestore()
+    write(db, 0, 300)
+    store = SensorStore(db, readings_frame)
+    assert ids(store.frame(100)) == [f"r{i:04d}" for i in range(299, 199, -1)]
+
+    write(db, 300, 10)
+    before = store.documents_read
+    assert ids(store.frame(100)) == [f"r{i:04d}" for i in range(309, 209, -1)]
+    # The new rows plus the few inside the overlap window
+    assert store.documents_read - before < 20
+
+
+def test_larger_limit_backfills_older_rows():
+    db = FakeFirestore()
+    write(db, 0, 300)
+    store = SensorStore(db, readings_frame)
+    store.frame(100)
+    assert ids(store.frame(250)) == [f"r{i:04d}" for i in range(299, 49, -1)]
+
+
+def test_full_page_of_new_rows_leaves_no_gap():
+    db = FakeFirestore()
+    write(db, 0, 500)
+    store = SensorStore(db, readings_frame)
+    store.frame(500)
+
+    # More new rows than the next, smaller limit can fetch at once
+    write(db, 500, 200)
+    assert ids(store.frame(100)) == [f"r{i:04d}" for i in range(699, 599, -1)]
+    assert ids(store.frame(500)) == [f"r{i:04d}" for i in range(699, 199, -1)]
+
+
+def test_unmigrated_documents_do_not_come_first():
+    db = FakeFirestore()
+    write(db, 0, 300)
+    # Stored before schema_version 2: received_at is a local-time ISO string
+    for i in range(20):
+        db.collection('sensor_readings').document(f"legacy{i:02d}").set({
+            'device_id': 'esp32_test', 'received_at': (BASE + timedelta(seconds=i)).isoformat(),
+            'sensors': {'temperature_c': 20.0}})
+    store = SensorStore(db, readings_frame)
+    assert ids(store.frame(100)) == [f"r{i:04d}" for i in range(299, 199, -1)]
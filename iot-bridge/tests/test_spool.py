@@ -0,0 +1,90 @@
+import json
+from datetime import datetime
+
+from spool import SEGMENT_SUFFIX, Spool, SpoolReplayer
+
+
+def test_append_read_round_trip(tmp_path):
+    spool = Spool(str(tmp_path))
+    assert spool.append("home/sensors/data", b'{"a": 1}', received_at=1000.5) == (0, True)
+    assert spool.append("home/heartbeat", b'{"b": 2}', received_at=1001.25) == (1, True)
+
+    assert spool.read(0, 10) == [(0, "home/sensors/data", b'{"a": 1}', 1000.5),
+                                 (1, "home/heartbeat", b'{"b": 2}', 1001.25)]
+    assert spool.read(1, 10) == [(1, "home/heartbeat", b'{"b": 2}', 1001.25)]
+    spool.close()
+
+
+def test_records_span_segments(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=64)
+    for i in range(10):
+        spool.append("t", b"x" * 20, received_at=float(i))
+    assert spool.stats()['segments'] > 1
+    assert [(seq, received) for seq, _, _, received in spool.read(3, 4)] == [(3, 3.0), (4, 4.0), (5, 5.0), (6, 6.0)]
+    spool.close()
+
+
+def test_checkpoint_survives_restart(tmp_path):
+    spool = Spool(str(tmp_path))
+    for i in range(5):
+        spool.append("t", b"m%d" % i, received_at=100.0 + i)
+    spool.done([0, 1, 2])
+    spool.close()
+
+    spool = Spool(str(tmp_path))
+    assert spool.checkpoint == 3
+    assert spool.replay_from == 3
+    assert [(seq, payload, received) for seq, _, payload, received in spool.read(spool.replay_from, 10)] == \
+        [(3, b"m3", 103.0), (4, b"m4", 104.0)]
+    spool.close()
+
+
+def test_torn_tail_is_cut_on_restart(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append("t", b"complete", received_at=1.0)
+    spool.append("t", b"torn", received_at=2.0)
+    spool.close()
+    segment = next(tmp_path.glob("*" + SEGMENT_SUFFIX))
+    segment.write_bytes(segment.read_bytes()[:-2])
+
+    spool = Spool(str(tmp_path))
+    assert spool.next_seq == 1
+    assert spool.read(0, 10) == [(0, "t", b"complete", 1.0)]
+    spool.close()
+
+
+def test_failed_commit_switches_to_replay(tmp_path):
+    spool = Spool(str(tmp_path))
+    for i in range(3):
+        spool.append("t", b"m", received_at=float(i))
+    spool.done([0])
+    spool.failed([1])
+    assert spool.replay_from == 1
+    assert spool.append("t", b"m")[1] is False
+    assert spool.committed_seq() == 1
+    spool.close()
+
+
+class _Writer:
+    failed_ops = 0
+
+    def flush(self):
+        pass
+
+
+def test_replayer_passes_receive_time_and_advances(tmp_path):
+    spool = Spool(str(tmp_path))
+    received = [1700000000.0 + 1.2 * i for i in range(5)]
+    for i, at in enumerate(received):
+        spool.append("home/sensors/data", json.dumps({'i': i}).encode(), received_at=at)
+    spool.failed([0])
+
+    handled = []
+    replayer = SpoolReplayer(spool, lambda topic, payload, received: handled.append(received), _Writer(),
+                             batch_records=2)
+    while spool.replay_from is not None:
+        assert replayer.replay_batch()
+
+    assert handled == [datetime.fromtimestamp(at) for at in received]
+    assert spool.committed_seq() == 5
+    spool.close()
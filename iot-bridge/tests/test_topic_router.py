@@ -0,0 +1,54 @@
+import pytest
+
+from topic_router import Route, TopicRouter
+
+
+def route(name):
+    return Route(name, name, persist=None)
+
+
+@pytest.fixture
+def router():
+    router = TopicRouter(default=route('unknown'))
+    router.add("home/sensors/data", route('exact'))
+    router.add("home/+/data", route('plus'))
+    router.add("home/#", route('multi'))
+    return router
+
+
+def test_exact_beats_plus_beats_multi(router):
+    assert router.route("home/sensors/data").name == 'exact'
+    assert router.route("home/kitchen/data").name == 'plus'
+    assert router.route("home/kitchen/alerts").name == 'multi'
+    assert router.route("home/kitchen/data/raw").name == 'multi'
+
+
+def test_multi_matches_its_parent_level(router):
+    assert router.route("home").name == 'multi'
+
+
+def test_unmatched_topics_get_the_default(router):
+    assert router.route("office/sensors/data").name == 'unknown'
+    assert router.route("homes/sensors/data").name == 'unknown'
+
+
+def test_dollar_topics_skip_wildcards_at_the_first_level():
+    router = TopicRouter()
+    router.add("#", route('all'))
+    router.add("+/broker/load", route('plus'))
+    assert router.route("$SYS/broker/load") is None
+    assert router.route("home/broker/load").name == 'plus'
+    assert router.route("home/sensors").name == 'all'
+
+
+def test_add_clears_cached_routes(router):
+    assert router.route("home/kitchen/status").name == 'multi'
+    router.add("home/kitchen/status", route('status'))
+    assert router.route("home/kitchen/status").name == 'status'
+    assert router.patterns() == ["home/sensors/data", "home/+/data", "home/#", "home/kitchen/status"]
+
+
+@pytest.mark.parametrize("pattern", ["home/#/data", "home/sens+", "home/data#"])
+def test_invalid_patterns_are_rejected(pattern):
+    with pytest.raises(ValueError):
+        TopicRouter().add(pattern, route('bad'))
@@ -0,0 +1,120 @@
+# topic_router.py
+import json
+import threading
+
+
+def parse_json(payload):
+    return json.loads(payload.decode('utf-8'))
+
+
+def require_object(data):
+    """Validator: the payload must be a JSON object"""
+    if not isinstance(data, dict):
+        return f"expected a JSON object, got {type(data).__name__}"
+    return None
+
+
+class Route:
+    """Pipeline for the messages on one kind of topic.
+
+    `parse(payload)` turns the raw bytes into data, `validate(data)` returns
+    an error string for messages that must not be stored (or None), and
+    `persist(route, data, msg_id, received, tokens)` hands the writes to
+    Firestore. `collection` is the Firestore collection the route writes to.
+    """
+
+    __slots__ = ('name', 'collection', 'persist', 'parse', 'validate')
+
+    def __init__(self, name, collection, persist, parse=parse_json, validate=require_object):
+        self.name = name
+        self.collection = collection
+        self.persist = persist
+        self.parse = parse
+        self.validate = validate
+
+
+class _Node:
+    __slots__ = ('children', 'route', 'multi')
+
+    def __init__(self):
+        self.children = {}  # topic level (or '+') -> _Node
+        self.route = None   # route for a topic ending here
+        self.multi = None   # route for '#' at this level
+
+
+def _valid_pattern(pattern):
+    levels = pattern.split('/')
+    for i, level in enumerate(levels):
+        if '#' in level and (level != '#' or i != len(levels) - 1):
+            return False
+        if '+' in level and level != '+':
+            return False
+    return True
+
+
+class TopicRouter:
+    """Topic patterns with MQTT '+' and '#' wildcards, matched to routes.
+
+    Patterns are compiled into a tree of topic levels when they are added.
+    Exact levels win over '+', which wins over '#'. The result for each
+    concrete topic is cached, so a message usually costs one dict lookup
+    however many patterns are registered.
+    """
+
+    def __init__(self, default=None, cache_size=10000):
+        self.default = default
+        self.cache_size = cache_size
+        self._root = _Node()
+        self._patterns = []
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def add(self, pattern, route):
+        if not _valid_pattern(pattern):
+            raise ValueError(f"Invalid MQTT topic pattern: {pattern}")
+        with self._lock:
+            node = self._root
+            levels = pattern.split('/')
+            for level in levels:
+                if level == '#':
+                    node.multi = route
+                    break
+                node = node.children.setdefault(level, _Node())
+            else:
+                node.route = route
+            self._patterns.append(pattern)
+            self._cache = {}
+
+    def patterns(self):
+        """Registered patterns, in order, for subscribing"""
+        return list(self._patterns)
+
+    def route(self, topic):
+        """The route for a concrete topic, or the default route"""
+        route = self._cache.get(topic)
+        if route is not None:
+            return route
+        route = self._match(self._root, topic.split('/'), 0) or self.default
+        if len(self._cache) >= self.cache_size:
+            self._cache = {}
+        self._cache[topic] = route
+        return route
+
+    def _match(self, node, levels, i):
+        if i == len(levels):
+            # 'home/#' also matches 'home' itself
+            return node.route or node.multi
+        child = node.children.get(levels[i])
+        if child is not None:
+            route = self._match(child, levels, i + 1)
+            if route is not None:
+                return route
+        # '+' and '#' don't match topics starting with '$' at the first level
+        if i == 0 and levels[0].startswith('$'):
+            return None
+        child = node.children.get('+')
+        if child is not None:
+            route = self._match(child, levels, i + 1)
+            if route is not None:
+                return route
+        return node.multi